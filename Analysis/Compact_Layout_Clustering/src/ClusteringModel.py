@@ -3,12 +3,13 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
-from typing import List, Dict, Any, Optional, Tuple, Union
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple, Union
 
 import sys
 import os
 import io
 import json
+import threading
 import numpy as np
 import logging
 import pandas as pd
@@ -17,9 +18,104 @@ from sklearn.decomposition import PCA
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 from sklearn.cluster import DBSCAN, KMeans
+from sklearn.neighbors import NearestNeighbors
 
 sys.path.append("../../")
-from Routing_Forms.src.WordAndLayoutEncoder import WordAndLayoutEncoder
+from Routing_Forms.src.VectorizedWordAndLayoutEncoder import VectorizedWordAndLayoutEncoder
+
+class OcrColumns(NamedTuple):
+    """
+    OCR results of a dataset in columnar arrays, the words of all the images one after the other.
+    The words of image i are texts[offsets[i]:offsets[i + 1]], and their bounding boxes
+    (top, left, bottom, right) the matching rows of boxes.
+    """
+    texts: np.ndarray
+    boxes: np.ndarray
+    offsets: np.ndarray
+
+class ClusterIndex:
+    """
+    ClusterIndex holds what is needed to place new images into the clusters of a fitted
+    ClusteringModel: the PCA projection of the word and layout encodings, and the DBSCAN core
+    points (in the projected space) with their cluster. As DBSCAN does for its border points,
+    an image belongs to the cluster of the nearest core point within epsilon, and is noise (-1)
+    otherwise. The core points are held in a KD-tree, so assigning an image takes a time
+    logarithmic in the number of core points rather than a new clustering.
+    """
+
+    def __init__(
+            self,
+            word_mean: np.ndarray,
+            word_components: np.ndarray,
+            layout_mean: np.ndarray,
+            layout_components: np.ndarray,
+            core_points: np.ndarray,
+            core_labels: np.ndarray,
+            epsilon: float
+    ):
+        """
+        Constructor for a cluster index
+
+        :param word_mean: mean of the word encoding removed by the word PCA
+        :param word_components: components of the word PCA, one per row
+        :param layout_mean: mean of the layout encoding removed by the layout PCA
+        :param layout_components: components of the layout PCA, one per row
+        :param core_points: the DBSCAN core points in the projected space, one per row
+        :param core_labels: the cluster of each core point
+        :param epsilon: DBSCAN parameter, maximum distance to a core point for an image to join its cluster
+        """
+        self.word_mean = word_mean
+        self.word_components = word_components
+        self.layout_mean = layout_mean
+        self.layout_components = layout_components
+        self.core_points = core_points
+        self.core_labels = core_labels
+        self.epsilon = epsilon
+        self.nearest_core = None
+        if len(core_points) > 0:
+            self.nearest_core = NearestNeighbors(n_neighbors=1, algorithm="kd_tree", leaf_size=40).fit(core_points)
+
+    @staticmethod
+    def from_pipeline(pipeline: Pipeline):
+        """
+        Builds the cluster index of a fitted PCA + DBSCAN pipeline of a ClusteringModel
+
+        :param pipeline: the fitted pipeline of the ClusteringModel
+        :returns: the ClusterIndex of the pipeline
+        """
+        word_pca = pipeline["pca"].named_transformers_["word_pca"]
+        layout_pca = pipeline["pca"].named_transformers_["layout_pca"]
+        dbscan = pipeline["dbscan"]
+        return ClusterIndex(
+            word_pca.mean_, word_pca.components_, layout_pca.mean_, layout_pca.components_,
+            dbscan.components_, dbscan.labels_[dbscan.core_sample_indices_], dbscan.eps)
+
+    def project(self, encoding: np.ndarray) -> np.ndarray:
+        """
+        Applies the PCA of the word encoding and of the layout encoding, as the pipeline does
+
+        :param encoding: the word and layout encoding of the images, one per row
+        :returns: the projected encoding, one row per image
+        """
+        vocabulary_size = len(self.word_mean)
+        return np.hstack((
+            (encoding[:, :vocabulary_size] - self.word_mean) @ self.word_components.T,
+            (encoding[:, vocabulary_size:] - self.layout_mean) @ self.layout_components.T))
+
+    def assign(self, encoding: np.ndarray) -> np.ndarray:
+        """
+        Assigns images to the clusters of the index
+
+        :param encoding: the word and layout encoding of the images, one per row
+        :returns: the cluster of each image, -1 for noise
+        """
+        labels = np.full(len(encoding), -1, dtype=np.int64)
+        if self.nearest_core is None or len(encoding) == 0:
+            return labels
+        distances, indices = self.nearest_core.kneighbors(self.project(encoding))
+        within = distances[:, 0] <= self.epsilon
+        labels[within] = self.core_labels[indices[within, 0]]
+        return labels
 
 class ClusteringModel:
     """
@@ -41,7 +137,8 @@ class ClusteringModel:
             n_pca_components: int = 200,
             vocabulary: List[str] = None,
             stopwords: List[str] = None,
-            pipeline: Pipeline = None
+            pipeline: Pipeline = None,
+            recluster_every: int = None
     ):
         """
         Constructor for a clustering model
@@ -54,6 +151,8 @@ class ClusteringModel:
         :param vocabulary: A pre-defined vocabulary if available
         :param stopwords: A list of stopwords to filter out if the vocabulary is regenerated
         :param pipeline: An sklearn pipeline containing the PCAs for the word and layout encoding
+        :param recluster_every: Number of images assigned with assign_clusters after which the
+        whole clustering is fitted again in the background, None to only recluster on demand
         """
         self.layout_shape = layout_shape
         self.vocabulary_size = vocabulary_size
@@ -61,47 +160,80 @@ class ClusteringModel:
         self.n_pca_components = n_pca_components
         self.stopwords = stopwords
         if vocabulary is not None:
-            self.encoder = WordAndLayoutEncoder(vocabulary, layout_shape)
+            self.encoder = VectorizedWordAndLayoutEncoder(vocabulary, layout_shape)
         else:
             self.encoder = None
         self.pipeline = pipeline
-
-    def _generate_vocabulary(
+        self.recluster_every = recluster_every
+
+        # State of the incremental assignment: the index of the current clustering, the encodings
+        # it was fitted on, and the encodings of the images assigned since, for the next reclustering
+        self.cluster_index = None
+        self.encoding = None
+        self.new_encodings = []
+        self.min_samples = None
+        self.epsilon = None
+        self._lock = threading.Lock()
+        self._reclustering = None
+        # Incremented each time a fit replaces the clustering, a reclustering started before a
+        # newer fit does not replace it
+        self._generation = 0
+
+    def _read_ocr_results(
             self,
             data: pd.DataFrame,
-            image_name_column: str):
+            image_name_column: str) -> OcrColumns:
         """
-        Adapted from plan_agnostic_vocabulary_vector in RoutingClassifier.ipynb
+        Read the OCR results of all the images designated in the data DataFrame once,
+        by running OCR API (with local caching via the ocr_results utility function),
+        and gather their words and bounding boxes into columnar arrays
 
         :param data: Pandas DataFrame containing all the images to be clustered
         :param image_name_column: Column in the dataframe with the filename
-        :returns: a list containing the most frequent words in the OCR text for these images
+        :returns: the OcrColumns of the images, in the order of the data rows
         """
 
-        logging.info(f"Counting extracted words across all images to generate the encoding vocabulary")
-
-        # Finds the most popular words out of a bag comprised of all plans
-        # Guarantees a length based on vocabulary_size
-        count = 0
-        counter = Counter()
+        texts = []
+        boxes = []
+        offsets = np.zeros(len(data) + 1, dtype=np.int64)
 
-        for index, row in data.iterrows():
+        for count, filename in enumerate(data[image_name_column]):
             try:
-                filename = data.loc[index, image_name_column]
-
                 ocr_results = self.ocr_provider.get_ocr_results(filename)
-
-                for word in ocr_results:
-                    if not self.stopwords or (word.text.lower() not in self.stopwords):
-                        counter.update({word.text: 1})
-
-                count += 1
-                if count % 5000 == 0:
-                    logging.info(f"Processed {count} images for vocabulary generation")
             except:
-                logging.error("Could not locate image file: {}".format(row[image_name_column]))
+                logging.error("Could not locate image file: {}".format(filename))
                 raise
 
+            for word in ocr_results:
+                texts.append(word.text)
+                boxes.append((word.top, word.left, word.bottom, word.right))
+            offsets[count + 1] = len(texts)
+
+            if (count + 1) % 5000 == 0:
+                logging.info(f"Read the OCR results of {count + 1} images")
+
+        return OcrColumns(
+            np.array(texts, dtype=object),
+            np.array(boxes, dtype=np.float64).reshape(-1, 4),
+            offsets)
+
+    def _generate_vocabulary(
+            self,
+            ocr_columns: OcrColumns):
+        """
+        Adapted from plan_agnostic_vocabulary_vector in RoutingClassifier.ipynb
+
+        :param ocr_columns: OcrColumns of all the images to be clustered
+        :returns: a list containing the most frequent words in the OCR text for these images
+        """
+
+        logging.info(f"Counting extracted words across all images to generate the encoding vocabulary")
+
+        # Finds the most popular words out of a bag comprised of all plans
+        # Guarantees a length based on vocabulary_size
+        stopwords = set(self.stopwords) if self.stopwords else set()
+        counter = Counter(text for text in ocr_columns.texts if text.lower() not in stopwords)
+
         # Create the vocabulary vector based on the most common words
         vocabulary_vector = []
         for word in counter.most_common(self.vocabulary_size):
@@ -111,43 +243,38 @@ class ClusteringModel:
 
     def _encode_dataset(
             self,
-            data: pd.DataFrame,
-            image_name_column: str):
+            ocr_columns: OcrColumns):
         """
-        Encode all the images designated in the data DataFrame into the word+layout encoding
-        by running OCR API (with local caching via the ocr_results utility function)
+        Encode all the images of the OCR columns into the word+layout encoding
 
-        :param data: a pandas DataFrame containing a list of images and their metadata
-        :param image_name_column: column in the dataframe that has the file paths in the blob storage container
+        :param ocr_columns: OcrColumns of the images, see _read_ocr_results
         :returns: a 2D numpy array and an array mask.
         The 2D numpy arrays contains the concatenated word and layout encoding for each encoded image.
         The mask is an array of the same length as the original data.
         A zero entry denotes unsuccessfully encoded image. A one denotes a successfully image
         """
 
-        empty_ocr_count = 0
-        mask = np.zeros(len(data))
-        encoded_data = np.zeros((len(data), self.vocabulary_size + self.layout_shape[0] * self.layout_shape[1]))
-
-        counter = 0
-        for index, row in data.iterrows():
-            try:
-                filename = data.loc[index, image_name_column]
-                ocr_results = self.ocr_provider.get_ocr_results(filename)
-
-                if len(ocr_results) == 0:
-                    empty_ocr_count += 1
-                else:
-                    mask[counter] = 1
-                    encodings = self.encoder.encode_ocr_results(ocr_results)
-                    encoded_data[counter, :] = encodings
-
-            except:
-                logging.error("Could not locate blob: {}".format(row[image_name_column]))
-                raise
-
-            counter += 1
-
+        n_images = len(ocr_columns.offsets) - 1
+        word_counts = np.diff(ocr_columns.offsets)
+        mask = (word_counts > 0).astype(np.float64)
+        encoded_data = np.zeros((n_images, self.vocabulary_size + self.layout_shape[0] * self.layout_shape[1]))
+
+        # Word encoding of all the images at once: a 1 for each (image, vocabulary word) present
+        vocabulary_index = {}
+        for index, word in enumerate(self.encoder.vocabulary_vector):
+            vocabulary_index.setdefault(word, index)
+        word_indices = np.array([vocabulary_index.get(text, -1) for text in ocr_columns.texts], dtype=np.int64)
+        image_indices = np.repeat(np.arange(n_images), word_counts)
+        in_vocabulary = word_indices >= 0
+        encoded_data[image_indices[in_vocabulary], word_indices[in_vocabulary]] = 1
+
+        # Layout encoding of the bounding boxes of each image
+        for counter in np.flatnonzero(mask):
+            start, end = ocr_columns.offsets[counter], ocr_columns.offsets[counter + 1]
+            encoded_data[counter, self.vocabulary_size:] = \
+                self.encoder.encode_boxes(ocr_columns.boxes[start:end]).flatten()
+
+        empty_ocr_count = n_images - int(mask.sum())
         if empty_ocr_count > 0:
             logging.warning("Empty OCR results resulting in null entries for {} images".format(empty_ocr_count))
 
@@ -185,11 +312,14 @@ class ClusteringModel:
         """
 
         # Produce word and layout encoding from the images; there may be empty rows due to failed OCR on an image
+        # The OCR results are read once, for both the vocabulary and the encoding
+        ocr_columns = self._read_ocr_results(data, image_name_column)
         if self.encoder is None:
-            vocabulary = self._generate_vocabulary(data, image_name_column)
-            self.encoder = WordAndLayoutEncoder(vocabulary, self.layout_shape)
+            vocabulary = self._generate_vocabulary(ocr_columns)
+            self.encoder = VectorizedWordAndLayoutEncoder(vocabulary, self.layout_shape)
+        vocabulary = self.encoder.vocabulary_vector
 
-        (encoding, mask) = self._encode_dataset(data, image_name_column)
+        (encoding, mask) = self._encode_dataset(ocr_columns)
 
         if sum(mask) == data.shape[0]:
             logging.info(f"All {sum(mask)} images are successfully encoded")
@@ -198,21 +328,196 @@ class ClusteringModel:
 
         # Remove the empty rows before applying PCA
         encoding = encoding[mask == 1, :]
-        self.n_pca_components = min(self.n_pca_components, encoding.shape[0])
 
+        (pipeline, Y, projected) = self._fit(encoding, min_samples, epsilon)
+        with self._lock:
+            self._generation += 1
+            self.pipeline = pipeline
+            self.cluster_index = ClusterIndex.from_pipeline(pipeline)
+            self.encoding = encoding
+            self.new_encodings = []
+            self.min_samples = min_samples
+            self.epsilon = epsilon
+
+        data_copy = data.copy()
+        data_copy.drop(["cluster"], axis=1, errors="ignore")
+        data_copy.loc[mask == 1, "cluster"] = Y
+
+        # The encodings with PCA applied, to help with data visualization
+        encoded_data = pd.DataFrame(projected)
+
+        return (data_copy, encoded_data, vocabulary)
+
+    def _fit(
+            self,
+            encoding: np.ndarray,
+            min_samples: int,
+            epsilon: float):
+        """
+        Fit the PCA + DBSCAN pipeline on the encodings
+
+        :param encoding: the word and layout encoding of the images, one per row
+        :param min_samples: DBSCAN parameter, see find_clusters
+        :param epsilon: DBSCAN parameter, see find_clusters
+        :returns: the fitted pipeline, the cluster of each image and the projected encodings
+        """
+        n_pca_components = min(self.n_pca_components, encoding.shape[0])
         transformer = ColumnTransformer(
-        [("word_pca", PCA(n_components=self.n_pca_components), list(range(0, self.vocabulary_size)) ),
-         ("layout_pca", PCA(n_components=self.n_pca_components), list(range(self.vocabulary_size, self.vocabulary_size + self.layout_shape[0] * self.layout_shape[1])))])
+        [("word_pca", PCA(n_components=n_pca_components), list(range(0, self.vocabulary_size)) ),
+         ("layout_pca", PCA(n_components=n_pca_components), list(range(self.vocabulary_size, self.vocabulary_size + self.layout_shape[0] * self.layout_shape[1])))])
         dbscan = DBSCAN(eps=epsilon, min_samples=min_samples, metric="euclidean", leaf_size=40)
 
-        self.pipeline = Pipeline([("pca", transformer), ("dbscan", dbscan)])
-        Y = self.pipeline.fit_predict(encoding)
+        pipeline = Pipeline([("pca", transformer), ("dbscan", dbscan)])
+        # Same steps as pipeline.fit_predict, keeping the projected encodings
+        projected = pipeline["pca"].fit_transform(encoding)
+        Y = pipeline["dbscan"].fit_predict(projected)
+
+        return (pipeline, Y, projected)
+
+    def assign_clusters(
+            self,
+            data: pd.DataFrame,
+            image_name_column: str):
+        """
+        Place new images into the clusters found by find_clusters (or of a loaded model),
+        without fitting the clustering again: each image joins the cluster of the nearest core point
+        within epsilon, or is noise (-1), see ClusterIndex.
+        The encodings of the images are kept for the next reclustering, which is started in the
+        background once recluster_every images have been assigned.
+
+        :param data: a Pandas Dataframe containing the image metadata / filename
+        :param image_name_column: the column name in the dataframe with the filename
+        :returns: a copy of the data with the "cluster" column added or overwritten
+        """
+        if self.cluster_index is None:
+            raise ValueError("The model has no clusters yet, run find_clusters first")
+
+        (encoding, mask) = self._encode_dataset(self._read_ocr_results(data, image_name_column))
+        encoding = encoding[mask == 1, :]
+
+        with self._lock:
+            Y = self.cluster_index.assign(encoding)
+            self.new_encodings.append(encoding)
+            n_new = sum(len(e) for e in self.new_encodings)
+
+        if self.recluster_every is not None and n_new >= self.recluster_every:
+            self.recluster()
 
         data_copy = data.copy()
-        data_copy.drop(["cluster"], axis=1, errors="ignore")
         data_copy.loc[mask == 1, "cluster"] = Y
+        return data_copy
 
-        # A bit of extra work to return the encodings with PCA applied to help with data visualization
-        encoded_data = pd.DataFrame(self.pipeline["pca"].transform(encoding))
+    def recluster(self, wait: bool = False) -> threading.Thread:
+        """
+        Fit the clustering again in the background on all the images seen so far (the images of
+        find_clusters and the images assigned since) with the same parameters. assign_clusters keeps
+        using the current clusters until the new ones replace them. Note that the cluster numbers
+        of the new clustering may differ from the previous ones.
 
-        return (data_copy, encoded_data, vocabulary)
+        :param wait: set to true to wait for the reclustering to complete
+        :returns: the thread running the reclustering, or the one already running
+        """
+        with self._lock:
+            if self._reclustering is None or not self._reclustering.is_alive():
+                self._reclustering = threading.Thread(
+                    target=self._recluster, name="layout-reclustering", daemon=True)
+                self._reclustering.start()
+            reclustering = self._reclustering
+
+        if wait:
+            reclustering.join()
+        return reclustering
+
+    def _recluster(self) -> None:
+        with self._lock:
+            generation = self._generation
+            n_new = len(self.new_encodings)
+            encoding = np.vstack([self.encoding] + self.new_encodings[:n_new])
+            min_samples, epsilon = self.min_samples, self.epsilon
+
+        try:
+            (pipeline, _, _) = self._fit(encoding, min_samples, epsilon)
+            cluster_index = ClusterIndex.from_pipeline(pipeline)
+        except Exception as e:
+            logging.error(f"Reclustering failed: {e}")
+            return
+
+        # The images assigned during the fit are kept for the next reclustering
+        with self._lock:
+            if self._generation != generation:
+                logging.info("Reclustering discarded, the clustering was fitted again in the meantime")
+                return
+            self._generation += 1
+            self.pipeline = pipeline
+            self.cluster_index = cluster_index
+            self.encoding = encoding
+            self.new_encodings = self.new_encodings[n_new:]
+        logging.info(f"Reclustered {encoding.shape[0]} images")
+
+    def save(self, file_name: str, include_encodings: bool = True) -> None:
+        """
+        Saves what assign_clusters needs (vocabulary, parameters and ClusterIndex) to a numpy .npz file
+
+        :param file_name: name of the file to write the model to
+        :param include_encodings: set to false to leave out the encodings of the images seen so far,
+        which are only needed to recluster and grow with the number of images
+        """
+        if self.cluster_index is None:
+            raise ValueError("The model has no clusters yet, run find_clusters first")
+
+        with self._lock:
+            cluster_index = self.cluster_index
+            encoding = np.vstack([self.encoding] + self.new_encodings)
+
+        settings = {
+            "vocabulary": self.encoder.vocabulary_vector,
+            "shape": list(self.layout_shape),
+            "vocabularySize": self.vocabulary_size,
+            "nPcaComponents": self.n_pca_components,
+            "minSamples": self.min_samples,
+            "epsilon": self.epsilon
+        }
+        arrays = {
+            "word_mean": cluster_index.word_mean,
+            "word_components": cluster_index.word_components,
+            "layout_mean": cluster_index.layout_mean,
+            "layout_components": cluster_index.layout_components,
+            "core_points": cluster_index.core_points,
+            "core_labels": cluster_index.core_labels
+        }
+        if include_encodings:
+            arrays["encoding"] = encoding
+
+        with open(file_name, "wb") as f:
+            np.savez_compressed(f, settings=json.dumps(settings), **arrays)
+
+    @staticmethod
+    def load(
+            file_name: str,
+            ocr_provider: object,
+            recluster_every: int = None):
+        """
+        Loads a model saved with save, ready to assign new images to its clusters
+
+        :param file_name: name of the file to read the model from
+        :param ocr_provider: An instance of an OCR provider class used to get the words from the image
+        :param recluster_every: see the constructor
+        :returns: the ClusteringModel
+        """
+        with np.load(file_name, allow_pickle=False) as arrays:
+            settings = json.loads(str(arrays["settings"]))
+            model = ClusteringModel(
+                tuple(settings["shape"]), settings["vocabularySize"], ocr_provider,
+                n_pca_components=settings["nPcaComponents"], vocabulary=settings["vocabulary"],
+                recluster_every=recluster_every)
+            model.min_samples = settings["minSamples"]
+            model.epsilon = settings["epsilon"]
+            model.cluster_index = ClusterIndex(
+                arrays["word_mean"], arrays["word_components"], arrays["layout_mean"], arrays["layout_components"],
+                arrays["core_points"], arrays["core_labels"], settings["epsilon"])
+            if "encoding" in arrays:
+                model.encoding = arrays["encoding"]
+            else:
+                model.encoding = np.zeros((0, settings["vocabularySize"] + settings["shape"][0] * settings["shape"][1]))
+
+        return model
@@ -1,16 +1,146 @@
+import hashlib
+import os
+
 import matplotlib.pyplot as plt
 import numpy as np
+from scipy import sparse as sp
 from sklearn import metrics
 from sklearn.cluster import DBSCAN
 from sklearn.manifold import TSNE
 
+EMBEDDING_METHODS = ['tsne', 'opentsne', 'umap']
 
-def fit_dbscan(X_fit, eps=0.55, min_samples=8, plot=False, n_jobs=None):
-    """Runs DBSCAN based clustering.
+
+def hash_matrix(X):
+    """Returns a hash of the values (and layout) of a dense or sparse matrix.
+
+    Args:
+        X (array or scipy.sparse matrix):
+            Matrix to hash
+
+    Returns:
+        str: Hex digest of the matrix
+    """
+    digest = hashlib.sha1()
+    if sp.issparse(X):
+        X = X.tocsr()
+        digest.update(('csr %s %s' % (X.shape, X.dtype)).encode())
+        for part in (X.data, X.indices, X.indptr):
+            digest.update(np.ascontiguousarray(part).tobytes())
+    else:
+        X = np.asarray(X)
+        digest.update(('dense %s %s' % (X.shape, X.dtype)).encode())
+        digest.update(np.ascontiguousarray(X).tobytes())
+    return digest.hexdigest()
+
+
+def embed_2d(X_fit, method='tsne', cache_dir=None, random_state=1, n_jobs=None):
+    """Computes the 2-D embedding of feature vectors used to plot clusters.
 
     Args:
-        X_fit (array):
+        X_fit (array or scipy.sparse matrix):
             Array of feature vectors
+        method (str, optional):
+            'tsne' (scikit-learn), or the approximate and faster 'opentsne'
+            (openTSNE package) or 'umap' (umap-learn package).
+            Defaults to 'tsne'.
+        cache_dir (str, optional):
+            Folder where the embedding is saved, keyed by a hash of `X_fit`
+            and the parameters, and loaded from by later calls.
+            Defaults to None (not cached).
+        random_state (int, optional):
+            Seed of the embedding.
+            Defaults to 1.
+        n_jobs (int or None):
+            The number of parallel jobs to run.
+            Defaults to None.
+
+    Returns:
+        array: Array of shape (n_samples, 2)
+    """
+    assert method in EMBEDDING_METHODS, \
+        'method must be one of %s' % EMBEDDING_METHODS
+
+    cache_path = None
+    if cache_dir is not None:
+        key = '%s_%s_%s' % (hash_matrix(X_fit), method, random_state)
+        cache_path = os.path.join(cache_dir, 'embedding_%s.npy' % key)
+        if os.path.isfile(cache_path):
+            return np.load(cache_path)
+
+    if method == 'tsne':
+        tsne_params = {'random_state': random_state, 'n_jobs': n_jobs}
+        if sp.issparse(X_fit):
+            # TSNE can't initialise the embedding of a sparse matrix with PCA
+            tsne_params['init'] = 'random'
+        embedding = TSNE(**tsne_params).fit_transform(X_fit)
+    elif method == 'opentsne':
+        from openTSNE import TSNE as OpenTSNE
+        embedding = OpenTSNE(
+            random_state=random_state, n_jobs=n_jobs or 1,
+            initialization='random' if sp.issparse(X_fit) else 'pca'
+        ).fit(X_fit)
+    else:
+        import umap
+        embedding = umap.UMAP(
+            random_state=random_state).fit_transform(X_fit)
+    embedding = np.asarray(embedding)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written aside and renamed, an interrupted run leaves no partial file
+        temp_path = cache_path + '.tmp.npy'
+        np.save(temp_path, embedding)
+        os.replace(temp_path, cache_path)
+    return embedding
+
+
+def plot_clusters(embedding, labels, core_sample_indices=None):
+    """Plots clusters over a 2-D embedding, core samples as larger markers.
+
+    Args:
+        embedding (array):
+            Array of shape (n_samples, 2), see `embed_2d`
+        labels (array):
+            Cluster label of each sample, -1 for noise (DBSCAN.labels_)
+        core_sample_indices (array, optional):
+            Indices of the core samples (DBSCAN.core_sample_indices_).
+            Defaults to None (all samples).
+    """
+    labels = np.asarray(labels)
+    core_samples_mask = np.zeros_like(labels, dtype=bool)
+    if core_sample_indices is None:
+        core_samples_mask[:] = True
+    else:
+        core_samples_mask[core_sample_indices] = True
+    n_clusters_ = len(set(labels)) - (1 if -1 in labels else 0)
+
+    # Black removed and is used for noise instead.
+    unique_labels, label_idx = np.unique(labels, return_inverse=True)
+    colors = plt.cm.Spectral(np.linspace(0, 1, len(unique_labels)))
+    colors[unique_labels == -1] = [0, 0, 0, 1]
+    point_colors = colors[label_idx]
+
+    # One scatter per marker size rather than per cluster
+    plt.figure(figsize=(5, 5))
+    for mask, size in ((core_samples_mask, 12), (~core_samples_mask, 6)):
+        plt.scatter(
+            embedding[mask, 0], embedding[mask, 1],
+            c=point_colors[mask], edgecolors='k', s=size ** 2)
+
+    plt.title('Estimated number of clusters: %d' % n_clusters_)
+    plt.show()
+
+
+def fit_dbscan(
+        X_fit, eps=0.55, min_samples=8, plot=False, n_jobs=None,
+        embedding_method='tsne', cache_dir=None):
+    """Runs DBSCAN based clustering.
+
+    Args:
+        X_fit (array or scipy.sparse matrix):
+            Array of feature vectors, a sparse (CSR) matrix is clustered
+            without being densified
         eps (float, optional): 
             The maximum distance between two samples for one to be considered as in the neighborhood of the other.  # NOQA E501
             This is not a maximum bound on the distances of points within a cluster.  # NOQA E501
@@ -26,6 +156,12 @@ def fit_dbscan(X_fit, eps=0.55, min_samples=8, plot=False, n_jobs=None):
             The number of parallel jobs to run.
             None means 1 unless in a joblib.parallel_backend context. -1 means using all processors.
             Defaults to None.
+        embedding_method (str, optional):
+            Method of the 2-D embedding plotted, see `embed_2d`.
+            Defaults to 'tsne'.
+        cache_dir (str, optional):
+            Folder where the 2-D embedding is cached, see `embed_2d`.
+            Defaults to None.
 
     Returns:
         (array, sklearn.cluster.DBSCAN):
@@ -47,36 +183,13 @@ def fit_dbscan(X_fit, eps=0.55, min_samples=8, plot=False, n_jobs=None):
     print(
         'Estimated number of noise points: %d' % n_noise_)
 
-    # Black removed and is used for noise instead.
-    unique_labels = set(labels)
     if plot:
-        colors = [
-            plt.cm.Spectral(each)
-            for each in np.linspace(0, 1, len(unique_labels))]
-
-        plt.figure(figsize=(5, 5))
-        for k, col in zip(unique_labels, colors):
-            if k == -1:
-                # Black used for noise.
-                col = [0, 0, 0, 1]
-
-            class_member_mask = (labels == k)
-            digits_proj = TSNE(random_state=1).fit_transform(X_fit)
-
-            xy = digits_proj[class_member_mask & core_samples_mask]
-            plt.plot(
-                xy[:, 0], xy[:, 1],
-                'o', markerfacecolor=tuple(col),
-                markeredgecolor='k', markersize=12)
-
-            xy = digits_proj[class_member_mask & ~core_samples_mask]
-            plt.plot(
-                xy[:, 0], xy[:, 1],
-                'o', markerfacecolor=tuple(col),
-                markeredgecolor='k', markersize=6)
-
-        plt.title('Estimated number of clusters: %d' % n_clusters_)
-        plt.show()
+        # The embedding is computed once, and loaded from cache_dir when
+        # the same features are plotted again
+        embedding = embed_2d(
+            X_fit, method=embedding_method, cache_dir=cache_dir,
+            n_jobs=n_jobs)
+        plot_clusters(embedding, labels, db.core_sample_indices_)
 
     labels = labels.astype('str')
     labels = np.asarray(list(map(lambda x: "{:02d}".format(int(x)), labels)))
@@ -1,9 +1,17 @@
+import collections
+import functools
+import heapq
+import math
 import os
 import pickle
 import re
 
-from fuzzywuzzy import fuzz, process
-from sklearn.decomposition import PCA
+import joblib
+import numpy as np
+from fuzzywuzzy import fuzz, process, utils
+from scipy import sparse as sp
+from scipy.special import comb
+from sklearn.decomposition import PCA, TruncatedSVD
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.preprocessing import StandardScaler
 
@@ -97,6 +105,159 @@ def fuzzy_search(
     return fuzzy_results
 
 
+def process_word(word):
+    """
+    Applies the processing of `process.extractBests` with `fuzz.QRatio`
+    to a word: letters and numbers only, lower case, ascii.
+    """
+    return utils.full_process(utils.full_process(word), force_ascii=True)
+
+
+def deletion_variants(word, max_deletes):
+    """
+    Returns the strings obtained by deleting up to `max_deletes`
+    characters from `word` (including `word` itself).
+    """
+    variants = {word}
+    frontier = {word}
+    for _ in range(max_deletes):
+        frontier = {
+            variant[:i] + variant[i + 1:]
+            for variant in frontier for i in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+class VocabularyIndex(object):
+    """
+    Index of a vocabulary answering which of its words match a token with
+    a `fuzz.QRatio` score above `threshold`, without comparing the token
+    with every word of the vocabulary.
+
+    A QRatio of r between words of lengths a and b requires a common
+    subsequence of r * (a + b) / 2 characters, which bounds the lengths
+    of the words that can match and the number of characters to delete
+    from each of them to reach that common subsequence. The deletion
+    variants of the vocabulary words are indexed once (SymSpell-like),
+    a token is looked up through its own deletion variants and the
+    candidates are scored with `fuzz.QRatio`, so the matches are exactly
+    the ones a full scan would find. Tokens (and vocabulary words) with
+    too many variants are compared with the words of matching length
+    instead. The matches of each token are cached.
+
+    Args:
+        vocabulary (list):
+            Words to match tokens against
+        threshold (int, optional):
+            Similarity score cutoff threshold.
+            Defaults to 81.
+        max_variants (int, optional):
+            Max number of deletion variants generated for a word.
+            Defaults to 2000.
+        cache_size (int, optional):
+            Max number of tokens whose matches are cached.
+            Defaults to 65536.
+
+    Returns:
+        VocabularyIndex:
+            Instance of VocabularyIndex
+    """
+    def __init__(
+            self,
+            vocabulary, threshold=81,
+            max_variants=2000, cache_size=65536):
+
+        self.vocabulary = list(vocabulary)
+        self.threshold = threshold
+        # lowest similarity rounded up to the threshold by fuzz.QRatio
+        self.min_ratio = (threshold - 0.5) / 100
+        self.max_variants = max_variants
+
+        # processed word -> positions of the word in the vocabulary
+        self.words = collections.defaultdict(list)
+        for position, word in enumerate(self.vocabulary):
+            processed = process_word(word)
+            if len(processed) > 0:
+                self.words[processed].append(position)
+
+        self.words_by_length = collections.defaultdict(list)
+        self.deletes = collections.defaultdict(set)
+        self.scanned = []
+        for word in self.words:
+            self.words_by_length[len(word)].append(word)
+            max_deletes = self.get_max_deletes(len(word))
+            if self.count_variants(len(word), max_deletes) > max_variants:
+                self.scanned.append(word)
+            else:
+                for variant in deletion_variants(word, max_deletes):
+                    self.deletes[variant].add(word)
+
+        self.lookup = functools.lru_cache(maxsize=cache_size)(self._lookup)
+
+    def get_length_window(self, length):
+        """Lengths of the words that can match a word of `length`"""
+        if self.min_ratio <= 0:
+            return 1, math.inf
+        if self.min_ratio > 1:
+            return 1, 0
+        low = math.ceil(self.min_ratio * length / (2 - self.min_ratio) - 1e-9)
+        high = math.floor(length * (2 - self.min_ratio) / self.min_ratio + 1e-9)
+        return low, high
+
+    def get_max_deletes(self, length):
+        """Characters to delete from a word of `length` to reach a common subsequence"""
+        if self.min_ratio <= 0:
+            return length
+        if self.min_ratio > 1:
+            return 0
+        return math.floor(
+            length * (2 - 2 * self.min_ratio) / (2 - self.min_ratio) + 1e-9)
+
+    @staticmethod
+    def count_variants(length, max_deletes):
+        return sum(comb(length, i, exact=True) for i in range(min(max_deletes, length) + 1))
+
+    def _lookup(self, token):
+        processed = process_word(token)
+        if len(processed) == 0:
+            return ()
+
+        low, high = self.get_length_window(len(processed))
+        in_window = [
+            word
+            for length, words in self.words_by_length.items()
+            if low <= length <= high for word in words]
+        max_deletes = self.get_max_deletes(len(processed))
+        if self.count_variants(len(processed), max_deletes) > min(len(in_window), self.max_variants):
+            candidates = in_window
+        else:
+            candidates = set(word for word in self.scanned if low <= len(word) <= high)
+            for variant in deletion_variants(processed, max_deletes):
+                candidates.update(self.deletes.get(variant, ()))
+
+        matches = []
+        for word in candidates:
+            if low <= len(word) <= high:
+                # the vocabulary word is the query, as in fuzzy_search
+                score = fuzz.QRatio(word, processed, full_process=False)
+                if score >= self.threshold:
+                    matches.extend((position, score) for position in self.words[word])
+        return tuple(sorted(matches))
+
+
+@functools.lru_cache(maxsize=8)
+def _get_vocabulary_index(vocabulary, threshold):
+    return VocabularyIndex(vocabulary, threshold)
+
+
+def get_vocabulary_index(vocabulary, threshold=81):
+    """
+    Returns the VocabularyIndex of `vocabulary`, built on first use
+    and shared by the calls with the same vocabulary and threshold.
+    """
+    return _get_vocabulary_index(tuple(vocabulary), threshold)
+
+
 def fuzzy_replace(
         words_list,
         query_list,
@@ -120,7 +281,8 @@ def fuzzy_replace(
             Return string or list of strings
             Defaults to True.
         scorer (fuzz.Scorer, optional):
-            Matching algorithm used by fuzzywuzzy.
+            Matching algorithm used by fuzzywuzzy, only fuzz.QRatio
+            is supported (see VocabularyIndex).
             Defaults to fuzz.QRatio.
         whitelist (bool, optional):
             Whitelist output words based on vocabulary.
@@ -137,23 +299,20 @@ def fuzzy_replace(
         words_list = words_list.lower().split()
     # convert list of strings to dict to capture index
     words_dict = {idx: el for idx, el in enumerate(words_list)}
-    # run fuzzy search for each query vs whole words_dict
-    fuzzy_results = [
-        (
-            query, fuzzy_search(
-                query, words_dict,
-                scorer=scorer, score_cutoff=threshold)
-        ) for query in query_list
-    ]
-    # iterate through search results
-    for res in fuzzy_results:
-        # if result is not empty list
-        if res[1] != []:
-            # iterate through all fuzzy matches
-            for word in res[1]:
-                # get dict key and update (replace) value
-                words_dict[word[2]] = words_dict[word[2]].replace(
-                    word[0], res[0])
+    # look each word up in the index of the queries (vocabulary),
+    # same as running fuzzy search for each query vs whole words_dict
+    index = get_vocabulary_index(query_list, threshold)
+    fuzzy_results = collections.defaultdict(list)
+    for idx, word in words_dict.items():
+        for position, score in index.lookup(word):
+            fuzzy_results[position].append((word, score, idx))
+    # iterate through search results in the order of the queries
+    for position in sorted(fuzzy_results):
+        # keep the 5 best matches, as process.extractBests
+        for word in heapq.nlargest(5, fuzzy_results[position], key=lambda i: i[1]):
+            # get dict key and update (replace) value
+            words_dict[word[2]] = words_dict[word[2]].replace(
+                word[0], query_list[position])
     result = ""
     if whitelist:
         # keep/remove strings based on words list
@@ -206,6 +365,20 @@ class TFIDFProcessor(object):
             1 - errors, top importance
             2 - all msgs
             Defaults to 2.
+        sparse (bool, optional):
+            Keep the TFIDF features as a float32 CSR matrix instead of
+            a dense array, reduce them with TruncatedSVD instead of PCA
+            and scale them without centering when they are not reduced.
+            Fitted transformers are saved with joblib so that their arrays
+            can be memory-mapped when loaded.
+            Defaults to False.
+        mmap_mode (str, optional):
+            Memory-map mode used to load transformers saved with joblib,
+            None to load them in memory.
+            Defaults to 'r'.
+        random_state (int, optional):
+            Random state value used by TruncatedSVD.
+            Defaults to 0.
 
     Returns:
         TFIDFProcessor:
@@ -216,7 +389,7 @@ class TFIDFProcessor(object):
             tfidf_path=None, ngram_range=(1, 2), max_feat=3000,
             pca_path=None, use_pca=True, pca_components=15,
             scaler_path=None, use_scaler=True,
-            verbose=2):
+            verbose=2, sparse=False, mmap_mode='r', random_state=0):
 
         self.tfidf_path = tfidf_path
         self.ngram_range = ngram_range
@@ -231,6 +404,10 @@ class TFIDFProcessor(object):
 
         self.verbose = verbose
 
+        self.sparse = sparse
+        self.mmap_mode = mmap_mode
+        self.random_state = random_state
+
         self.tfidf = None
         self.pca = None
         self.scaler = None
@@ -247,6 +424,8 @@ class TFIDFProcessor(object):
             save_path=self.tfidf_path)
         if self.verbose > 0:
             print('TFIDF shape:', X.shape)
+            if sp.issparse(X):
+                print('TFIDF non zero values:', X.nnz)
 
         if self.use_pca:
             self.pca, X = self.fit_pca(
@@ -278,28 +457,39 @@ class TFIDFProcessor(object):
             norm='l2',
             encoding='latin-1',
             ngram_range=self.ngram_range,
-            stop_words='english')
+            stop_words='english',
+            dtype=np.float32 if self.sparse else np.float64)
 
         tfidf, X = self.fit_transformer(X, tfidf, save_path)
-        return tfidf, X.toarray()
+        return tfidf, X.tocsr() if self.sparse else X.toarray()
 
     def fit_pca(self, X, save_path=None, **kwargs):
 
         for key, value in kwargs.items():
             setattr(self, key, value)
 
-        pca = PCA(n_components=self.pca_components)
+        if sp.issparse(X):
+            # PCA would need to center (densify) the matrix
+            pca = TruncatedSVD(
+                n_components=self.pca_components,
+                random_state=self.random_state)
+        else:
+            pca = PCA(n_components=self.pca_components)
         return self.fit_transformer(X, pca, save_path)
 
     def fit_scaler(self, X, save_path=None):
-        scaler = StandardScaler()
+        scaler = StandardScaler(with_mean=not sp.issparse(X))
         return self.fit_transformer(X, scaler, save_path)
 
     def fit_transformer(self, X, transformer, save_path=None):
         X = transformer.fit_transform(X)
 
         if save_path is not None:
-            pickle.dump(transformer, open(save_path, "wb"))
+            if self.sparse:
+                # uncompressed so that the arrays can be memory-mapped
+                joblib.dump(transformer, save_path)
+            else:
+                pickle.dump(transformer, open(save_path, "wb"))
             if self.verbose > 0:
                 print('Saved transformer to file:', save_path)
 
@@ -335,7 +525,8 @@ class TFIDFProcessor(object):
 
     def apply_tfidf(self, X, tfidf):
         # assert(type(tfidf) is str or type(tfidf) is TfidfVectorizer)
-        return self.apply_transform(X, tfidf).toarray()
+        X = self.apply_transform(X, tfidf)
+        return X.tocsr() if self.sparse else X.toarray()
 
     def apply_scaler(self, X, scaler):
         # assert(type(scaler) is str or type(scaler) is TfidfVectorizer)
@@ -348,6 +539,7 @@ class TFIDFProcessor(object):
             if self.verbose > 1:
                 print('Loading transformer from exisiting file:', transformer)
 
-            transformer = pickle.load(open(transformer, "rb"))
+            # joblib also loads the transformers saved with pickle
+            transformer = joblib.load(transformer, mmap_mode=self.mmap_mode)
 
         return transformer.transform(data)
@@ -76,6 +76,10 @@ class TFIDFModel(object):
             1 - print out only error messages,
             2 - print everything.
             Defaults to 2.
+        sparse (bool, optional):
+            Keep the features as a sparse CSR matrix through the pipeline
+            (TruncatedSVD instead of PCA), see TFIDFProcessor.
+            Defaults to False.
 
     Raises:
         ValueError: `model` is None when model was not trained
@@ -87,7 +91,7 @@ class TFIDFModel(object):
             tfidf_path=None, ngram_range=(1, 2), max_feat=10000,
             use_pca=True, pca_path=None, pca_components=100,
             use_scaler=True, scaler_path=None,
-            random_state=0, verbose=2):
+            random_state=0, verbose=2, sparse=False):
 
         self.model_path = model_path
 
@@ -105,12 +109,13 @@ class TFIDFModel(object):
         self.random_state = random_state
         self.verbose = verbose
         self.test_size = test_size
+        self.sparse = sparse
 
         self.tfidf_processor = TFIDFProcessor(
             tfidf_path=self.tfidf_path, ngram_range=self.ngram_range, max_feat=self.max_feat,  # NOQA E501
             pca_path=self.pca_path, use_pca=self.use_pca, pca_components=self.pca_components,  # NOQA E501
             scaler_path=self.scaler_path, use_scaler=self.use_scaler,
-            verbose=2)
+            verbose=2, sparse=self.sparse, random_state=self.random_state)
 
         self.model = None
 
@@ -314,7 +319,7 @@ class TFIDFModel(object):
         """Outputs predicted classes for each row
 
         Args:
-            X (numpy.ndarray):
+            X (numpy.ndarray or scipy.sparse matrix):
                 Features to run prediction on
             model (sklearn classifier object, optional):
                 Trained instance of a model to run evaluation on.
@@ -346,7 +351,7 @@ class TFIDFModel(object):
         """Outputs per class probability for each row
 
         Args:
-            X (numpy.ndarray):
+            X (numpy.ndarray or scipy.sparse matrix):
                 Features to run prediction on
             model (sklearn classifier object, optional):
                 Trained instance of a model to run evaluation on.
@@ -379,7 +384,7 @@ class TFIDFModel(object):
         If verbose == 2 it will print classification report
 
         Args:
-            X (numpy.ndarray):
+            X (numpy.ndarray or scipy.sparse matrix):
                 Features to run prediction on
             y (numpy.ndarray):
                 Labels to use for evaluation
@@ -3,12 +3,10 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
-import json
-import os
 from typing import Dict, List, Optional
 
 import requests
-from .OcrProvider import OcrProvider
+from .OcrProvider import OcrProvider, OcrCache
 from .Word import Word
 
 class AzureComputerVisionOcrApi(OcrProvider):
@@ -23,7 +21,8 @@ class AzureComputerVisionOcrApi(OcrProvider):
             self,
             subscription_key: str,
             ocr_url: str,
-            proxies: Optional[Dict[str, str]] = None
+            proxies: Optional[Dict[str, str]] = None,
+            ocr_cache: Optional[OcrCache] = None
         ):
         """ Initialize a new instance of AzureComputerVisionOcrApi
 
@@ -32,11 +31,14 @@ class AzureComputerVisionOcrApi(OcrProvider):
             For example, 'https://{instance}.cognitiveservices.azure.com'
         :param Dict[str,str] proxies: Optional set of proxies to be used on the http
             request. If none are needed, pass None
+        :param OcrCache ocr_cache: Optional OCR cache, the process-wide cache
+            shared with the other pipelines is used by default
         """
 
         self.subscription_key = subscription_key
         self.ocr_url = ocr_url
         self.proxies = proxies
+        self.ocr_cache = ocr_cache
 
     def get_raw_ocr_results(
             self, 
@@ -44,10 +46,9 @@ class AzureComputerVisionOcrApi(OcrProvider):
         ) -> Dict:
         """Gets the OCR results for the given file
 
-        If a local copy of the OCR results are already present, the code will
-        load those and return quickly. Otherwise the image will be sent to the OCR 
-        API endpoint. In this case the results are written to disk for easy access
-        the next time.
+        If the OCR results for the same image content are already in the OCR
+        cache, the code will load those and return quickly. Otherwise the image
+        will be sent to the OCR API endpoint and the results are added to the cache.
 
         :param str file_name: path to the file to run OCR on
 
@@ -57,20 +58,22 @@ class AzureComputerVisionOcrApi(OcrProvider):
             HTTPError: If the OCR response is greater than 229
         """
 
-        ocr_url = self.ENDPOINT.format(self.ocr_url)
-        result_path = self.CACHE_FILE_PATTERN.format(file_name)
+        params = {'language': 'en', 'detectOrientation': 'true'}
+        return self.read_through_cache(
+            file_name, self.ENDPOINT.format(""), params, self.CACHE_FILE_PATTERN.format(file_name),
+            lambda image_data: self._analyze(image_data, params))
 
-        # If the results already exist then we return our cached version
-        if os.path.exists(result_path):
-            with open(result_path) as f:
-                return json.load(f)
+    def _analyze(
+            self,
+            image_data: bytes,
+            params: Dict[str, str]
+        ) -> Dict:
+        """Sends the image to the OCR API"""
 
-        # Set fixed headers and parameters
-        headers = {'Ocp-Apim-Subscription-Key': self.subscription_key, 'Content-Type': 'application/octet-stream'}
-        params = {'language': 'en', 'detectOrientation': 'true'}
+        ocr_url = self.ENDPOINT.format(self.ocr_url)
 
-        # Open the image file
-        image_data = open(file_name, "rb").read()
+        # Set fixed headers
+        headers = {'Ocp-Apim-Subscription-Key': self.subscription_key, 'Content-Type': 'application/octet-stream'}
 
         response = requests.post(ocr_url, headers=headers, params=params, data=image_data, proxies=self.proxies)
         print(f"OCR time: {response.elapsed}")
@@ -78,13 +81,7 @@ class AzureComputerVisionOcrApi(OcrProvider):
         # Throws HTTPError for bad status
         response.raise_for_status()
 
-        results = response.json()
-
-        # Dump cache file
-        with open(result_path, "w") as f:
-            json.dump(results, f)
-        
-        return results
+        return response.json()
 
     def words_from_result(self, ocr_result: Dict) -> List[Word]:
         """Returns the list of found words (bounding box and text)
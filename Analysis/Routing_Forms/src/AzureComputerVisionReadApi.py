@@ -4,12 +4,11 @@
 # Licensed under the MIT License.
 
 import json
-import os
 import time
 from typing import Dict, List, Optional
 
 import requests
-from .OcrProvider import OcrProvider
+from .OcrProvider import OcrProvider, OcrCache
 from .Word import Word
 
 # Control the timing for querying for Read API results
@@ -28,7 +27,8 @@ class AzureComputerVisionReadApi(OcrProvider):
             self,
             subscription_key: str,
             ocr_url: str,
-            proxies: Optional[Dict[str, str]] = None
+            proxies: Optional[Dict[str, str]] = None,
+            ocr_cache: Optional[OcrCache] = None
         ):
         """ Initialize a new instance of AzureComputerVisionReadApi
 
@@ -37,11 +37,14 @@ class AzureComputerVisionReadApi(OcrProvider):
             For example, 'https://{instance}.cognitiveservices.azure.com'
         :param Dict[str,str] proxies: Optional set of proxies to be used on the http
             request. If none are needed, pass None
+        :param OcrCache ocr_cache: Optional OCR cache, the process-wide cache
+            shared with the other pipelines is used by default
         """
 
         self.subscription_key = subscription_key
         self.ocr_url = ocr_url
         self.proxies = proxies
+        self.ocr_cache = ocr_cache
 
     def get_raw_ocr_results(
             self, 
@@ -49,10 +52,9 @@ class AzureComputerVisionReadApi(OcrProvider):
         ) -> Dict:
         """Gets the OCR results for the given file
 
-        If a local copy of the OCR results are already present, the code will
-        load those and return quickly. Otherwise the image will be sent to the OCR 
-        API endpoint. In this case the results are written to disk for easy access
-        the next time.
+        If the OCR results for the same image content are already in the OCR
+        cache, the code will load those and return quickly. Otherwise the image
+        will be sent to the OCR API endpoint and the results are added to the cache.
 
         :param str file_name: path to the file to run OCR on
 
@@ -62,20 +64,22 @@ class AzureComputerVisionReadApi(OcrProvider):
             HTTPError: If the OCR response is greater than 229
         """
 
-        ocr_url = self.ENDPOINT.format(self.ocr_url)
-        result_path = self.CACHE_FILE_PATTERN.format(file_name)
+        params = {'language': 'en'}
+        return self.read_through_cache(
+            file_name, self.ENDPOINT.format(""), params, self.CACHE_FILE_PATTERN.format(file_name),
+            lambda image_data: self._analyze(image_data, params))
+
+    def _analyze(
+            self,
+            image_data: bytes,
+            params: Dict[str, str]
+        ) -> Dict:
+        """Sends the image to the Read API and waits for the results"""
 
-        # If the results already exist then we return our cached version
-        if os.path.exists(result_path):
-            with open(result_path) as f:
-                return json.load(f)
+        ocr_url = self.ENDPOINT.format(self.ocr_url)
 
-        # Set fixed headers and parameters
+        # Set fixed headers
         headers = {'Ocp-Apim-Subscription-Key': self.subscription_key, 'Content-Type': 'application/octet-stream'}
-        params = {'language': 'en'}
-
-        # Open the image file
-        image_data = open(file_name, "rb").read()
 
         response = requests.post(ocr_url, headers=headers, params=params, data=image_data, proxies=self.proxies)
         result_location = response.headers['Operation-Location']
@@ -104,10 +108,6 @@ class AzureComputerVisionReadApi(OcrProvider):
         if parsed_result is None:
             raise Exception(f"Timeout of {TIMEOUT}s was exceeded waiting for Read API result")
 
-        # Dump cache file
-        with open(result_path, "w") as f:
-            json.dump(parsed_result, f)
-        
         return parsed_result
 
     def words_from_result(self, ocr_result: Dict) -> List[Word]:
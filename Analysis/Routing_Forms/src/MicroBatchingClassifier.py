@@ -0,0 +1,123 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+from __future__ import annotations
+from concurrent.futures import Future
+import queue
+import threading
+import time
+from typing import List, Optional, Tuple, Union
+
+from .RoutingModel import RoutingModel
+from .Word import Word
+
+class MicroBatchingClassifier:
+    """Groups concurrent classification requests into batches
+
+    Callers from several threads call `classify` as they would call
+    RoutingModel.classify_ocr_results. Requests received within `max_wait`
+    seconds of the first pending one (or until `max_batch_size` is reached)
+    are classified together with a single RoutingModel.classify_batch call.
+
+    Attributes:
+        routing_model: RoutingModel, model used to classify the batches
+        max_batch_size: int, maximum number of requests in a batch
+        max_wait: float, maximum time in seconds a request waits for others
+            to join its batch
+    """
+
+    def __init__(
+            self,
+            routing_model: RoutingModel,
+            max_batch_size: int = 32,
+            max_wait: float = 0.005
+        ) -> MicroBatchingClassifier:
+
+        self.routing_model = routing_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._requests = queue.Queue()
+        self._closed = False
+        # Orders the requests and the stop marker, no request is queued after close
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="routing-micro-batcher", daemon=True)
+        self._worker.start()
+
+    def __enter__(self) -> MicroBatchingClassifier:
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def classify(
+            self,
+            ocr_results: List[Word],
+            include_probability: Optional[bool] = False
+        ) -> Union[str, Tuple[str, float]]:
+        """Classifies OCR results, blocking until the batch they joined was run
+
+        :param List[Word] ocr_results: OCR results for an image
+        :param bool include_probability: set to true to return the probability
+        :returns str label: the classified layout
+        :returns float probability: the confidence score for the classification
+        """
+        return self.submit(ocr_results, include_probability).result()
+
+    def submit(
+            self,
+            ocr_results: List[Word],
+            include_probability: Optional[bool] = False
+        ) -> Future:
+        """Queues OCR results for classification and returns a Future of the prediction"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The classifier is closed")
+            self._requests.put((ocr_results, include_probability, future))
+        return future
+
+    def close(self) -> None:
+        """Classifies the pending requests and stops the worker thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._requests.put(None)
+        self._worker.join()
+
+    def _next_batch(self) -> Tuple[list, bool]:
+        first = self._requests.get()
+        if first is None:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+        return batch, False
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            if len(batch) == 0:
+                continue
+            try:
+                # Probabilities are always computed so that both kinds of requests share the batch
+                predictions = self.routing_model.classify_batch([request[0] for request in batch], include_probability=True)
+                for (_, include_probability, future), prediction in zip(batch, predictions):
+                    future.set_result(prediction if include_probability else prediction[0])
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
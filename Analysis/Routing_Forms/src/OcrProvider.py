@@ -4,12 +4,21 @@
 # Licensed under the MIT License.
 
 from abc import ABC, abstractmethod
-from typing import Dict, List
+import json
+import os
+import sys
+from typing import Callable, Dict, List, Optional
 
 from .Word import Word
 
+# The OCR cache is shared with the other pipelines through the common folder at the root of the repository
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from common.ocr_cache import OcrCache, get_default_cache
+
 class OcrProvider(ABC):
 
+    ocr_cache: Optional[OcrCache] = None
+
     def get_ocr_results(
             self,
             file_name: str
@@ -24,6 +33,37 @@ class OcrProvider(ABC):
 
         return words
 
+    def read_through_cache(
+            self,
+            file_name: str,
+            api: str,
+            params: Dict,
+            legacy_cache_path: str,
+            analyze: Callable[[bytes], Dict]
+        ) -> Dict:
+        """Gets the OCR results for the file content from the shared OCR cache
+
+        The cache is keyed on the file content, the API and its parameters, so
+        renamed or duplicated images are only sent to the API once. Results
+        cached next to the image by previous versions are still used.
+
+        :param str file_name: path to the file to run OCR on
+        :param str api: name and version of the OCR API
+        :param Dict params: parameters sent to the OCR API
+        :param str legacy_cache_path: path of the JSON file cached next to the image
+        :param analyze: function sending the image data to the OCR API
+        :returns Dict: Parsed JSON response from the OCR service
+        """
+        if os.path.exists(legacy_cache_path):
+            with open(legacy_cache_path) as f:
+                return json.load(f)
+
+        with open(file_name, "rb") as f:
+            image_data = f.read()
+
+        ocr_cache = self.ocr_cache if self.ocr_cache is not None else get_default_cache()
+        return ocr_cache.get_or_compute(image_data, api, params, lambda: analyze(image_data))
+
     @abstractmethod
     def get_raw_ocr_results(self, file_name: str) -> Dict:
         """Gets the OCR results for the given file as a Dictionary"""
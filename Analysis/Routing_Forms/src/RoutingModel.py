@@ -16,13 +16,14 @@ from sklearn.base import BaseEstimator
 from skl2onnx import convert_sklearn
 from skl2onnx.common.data_types import FloatTensorType
 
-from .WordAndLayoutEncoder import WordAndLayoutEncoder
+from .VectorizedWordAndLayoutEncoder import VectorizedWordAndLayoutEncoder
+from .Word import Word
 
 class RoutingModel:
     """Encapsulation of routing model logic
 
     Attributes:
-        encoder: WordAndLayoutEncoder, converts raw ocr results to feature vector
+        encoder: VectorizedWordAndLayoutEncoder, converts raw ocr results to feature vector
         tags: Dict[str, str], Unique identifiers for tracking where the model came from
         layouts: List[str], the layouts that are output by the model
         sklearn_model: BaseEstimator, trained sklearn model that classifies the
@@ -30,6 +31,10 @@ class RoutingModel:
         onnx_model: bytes, string serialized representation of the ONNX model
         onnx_session: rt.InferenceSession, running ONNX inference session which
             makes predictions using the ONNXruntime
+        intra_op_num_threads: int, threads used to run a single operator of the
+            ONNX graph, None lets ONNXruntime decide
+        inter_op_num_threads: int, threads used to run independent operators of
+            the ONNX graph in parallel, None lets ONNXruntime decide
     """
     # For the layout encoding, we use float math to identify integer indices.
     # Due to the non-perfect representation of floats, we need to define a 
@@ -43,10 +48,12 @@ class RoutingModel:
             tags: Dict[str, str] = {},
             layouts: List[str] = [], 
             sklearn_model: Optional[BaseEstimator] = None,
-            onnx_model: Optional[bytes] = None
+            onnx_model: Optional[bytes] = None,
+            intra_op_num_threads: Optional[int] = None,
+            inter_op_num_threads: Optional[int] = None
         ) -> RoutingModel:
 
-        self.encoder = WordAndLayoutEncoder(vocabulary_vector, layout_shape)
+        self.encoder = VectorizedWordAndLayoutEncoder(vocabulary_vector, layout_shape)
         self.tags = tags
         self.layouts = layouts
         self.sklearn_model = sklearn_model
@@ -66,6 +73,12 @@ class RoutingModel:
 
             self.onnx_session = None
 
+        # The session is created up front so that the first request doesn't pay for it
+        self.intra_op_num_threads = intra_op_num_threads
+        self.inter_op_num_threads = inter_op_num_threads
+        if getattr(self, "onnx_model", None) is not None:
+            self.onnx_session = self.create_onnx_session()
+
     def classify_ocr_results(
             self,
             ocr_results: Dict,
@@ -85,23 +98,71 @@ class RoutingModel:
         """
 
         encoded_vector = self.encoder.encode_ocr_results(ocr_results).reshape(1, -1)
+        labels, probabilities = self._run(encoded_vector, include_probability)
+
+        if include_probability:
+            prediction = (labels[0], probabilities[0][labels[0]])
+        else:
+            prediction = labels
+
+        return prediction
+
+    def classify_batch(
+            self,
+            ocr_results_batch: List[List[Word]],
+            include_probability: Optional[bool] = False
+        ) -> Union[List[str], List[Tuple[str, float]]]:
+        """Returns classified layouts for several OCR results at once
+
+        The encoded samples are stacked into a single tensor so that the
+        ONNX session is run once for the whole batch.
+
+        :param List[List[Word]] ocr_results_batch: OCR results for several images
+        :param bool include_probability: set to true to return the probabilities
+        :returns List[str] labels: the classified layout of each image
+        :returns List[Tuple[str, float]] predictions: the classified layout and
+            confidence score of each image, if include_probability is true
+        """
+        if len(ocr_results_batch) == 0:
+            return []
+
+        encoded_batch = np.stack([self.encoder.encode_ocr_results(ocr_results) for ocr_results in ocr_results_batch])
+        labels, probabilities = self._run(encoded_batch, include_probability)
 
+        if include_probability:
+            return [(label, probability[label]) for label, probability in zip(labels, probabilities)]
+        return list(labels)
+
+    def create_onnx_session(self) -> rt.InferenceSession:
+        """Creates the ONNX inference session with the configured thread settings"""
+        options = rt.SessionOptions()
+        options.graph_optimization_level = rt.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.intra_op_num_threads is not None:
+            options.intra_op_num_threads = self.intra_op_num_threads
+        if self.inter_op_num_threads is not None:
+            options.inter_op_num_threads = self.inter_op_num_threads
+            options.execution_mode = rt.ExecutionMode.ORT_PARALLEL
+        return rt.InferenceSession(self.onnx_model, sess_options=options, providers=["CPUExecutionProvider"])
+
+    def _run(
+            self,
+            encoded_batch: np.ndarray,
+            include_probability: bool
+        ) -> Tuple[np.ndarray, Optional[List[Dict[str, float]]]]:
+        """Runs the ONNX session on a (samples, features) matrix"""
         if self.onnx_session is None:
-            self.onnx_session = rt.InferenceSession(self.onnx_model)
-        
+            self.onnx_session = self.create_onnx_session()
+
         input_name = self.onnx_session.get_inputs()[0].name
-        
+        inputs = {input_name: encoded_batch.astype(np.float32)}
+
         if include_probability:
             label_names = [ output.name for output in self.onnx_session.get_outputs() ]
-            raw_prediction = self.onnx_session.run(label_names, {input_name: encoded_vector.astype(np.float32)})
-            label = raw_prediction[0][0]
-            probability = raw_prediction[1][0][label]
-            prediction = (label, probability)
-        else:
-            label_names = [ self.onnx_session.get_outputs()[0].name ]
-            prediction = self.onnx_session.run(label_names, {input_name: encoded_vector.astype(np.float32)})[0]
+            raw_prediction = self.onnx_session.run(label_names, inputs)
+            return raw_prediction[0], raw_prediction[1]
 
-        return prediction
+        label_names = [ self.onnx_session.get_outputs()[0].name ]
+        return self.onnx_session.run(label_names, inputs)[0], None
 
     def json_serialize(self, file_name: str) -> None:
         """Outputs the routing model as a json file
@@ -120,10 +181,16 @@ class RoutingModel:
             json.dump(json_model, f)
 
     @staticmethod
-    def json_deserialize(model_json: str) -> RoutingModel:
+    def json_deserialize(
+            model_json: str,
+            intra_op_num_threads: Optional[int] = None,
+            inter_op_num_threads: Optional[int] = None
+        ) -> RoutingModel:
         """Outputs the routing model as a json file
 
         :param str model_json: either name of the file to read the model from or the model itself
+        :param int intra_op_num_threads: threads used to run a single operator of the ONNX graph
+        :param int inter_op_num_threads: threads used to run independent operators of the ONNX graph
         
         :returns RoutingModel: class representing the loaded routing model
         """
@@ -139,4 +206,6 @@ class RoutingModel:
         layout_shape = data['shape']
         onnx_model = base64.b64decode(data['onnxModel'].encode("utf-8"))
         
-        return RoutingModel(vocabulary_vector, layout_shape, tags, layouts, onnx_model=onnx_model)
+        return RoutingModel(
+            vocabulary_vector, layout_shape, tags, layouts, onnx_model=onnx_model,
+            intra_op_num_threads=intra_op_num_threads, inter_op_num_threads=inter_op_num_threads)
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+from __future__ import annotations
+from typing import List, Dict
+import numpy as np
+
+from .Word import Word
+from .WordAndLayoutEncoder import WordAndLayoutEncoder
+
+class VectorizedWordAndLayoutEncoder(WordAndLayoutEncoder):
+    """NumPy implementation of the word and layout encoding
+
+    Produces the same encoding as WordAndLayoutEncoder, but looks words up in a
+    dictionary index of the vocabulary and computes the layout grid for all
+    the words at once instead of visiting each cell in Python.
+
+    Attributes:
+        vocabulary_vector: List[str], the vocabulary words that should be used
+            for word encoding
+        layout_shape: (int, int), shape for the layout encoding
+        vocabulary_index: Dict[str, int], position of each word in the vocabulary
+    """
+
+    def __init__(
+            self,
+            vocabulary_vector: List[str],
+            layout_shape: (int, int)
+        ) -> VectorizedWordAndLayoutEncoder:
+
+        super().__init__(vocabulary_vector, layout_shape)
+
+        # list.index returns the first occurrence, so the first position wins here as well
+        self.vocabulary_index: Dict[str, int] = {}
+        for index, word in enumerate(vocabulary_vector):
+            self.vocabulary_index.setdefault(word, index)
+
+    def encode_words(
+            self,
+            ocr_results: List[Word]
+        ) -> np.ndarray:
+        """Returns a vector the same size as self.vocabulary_vector with a 1 if the
+        word is present and a 0 otherwise
+
+        :param List[Word] ocr_results: List of Words found in the image
+
+        :returns np.ndarray: binary word count encoding of the input words against the word vector
+        """
+
+        score = np.zeros(len(self.vocabulary_vector))
+        indices = [self.vocabulary_index[word.text] for word in ocr_results if word.text in self.vocabulary_index]
+        score[indices] = 1
+        return score
+
+    def encode_locations(
+            self,
+            ocr_results: List[Word]
+        ) -> np.ndarray:
+        """Encodes bounding box information into array of new_size
+
+        The cells covered by every word are computed from the bounding box
+        arrays in a single pass. The products and sums are carried out in the
+        same order as WordAndLayoutEncoder.encode_locations so that the
+        encodings are identical, not just close.
+
+        :param List[Word] ocr_results: List of Words found in the image
+
+        :returns np.ndarray encoding: location encoding for the OCR results
+        """
+
+        boxes = np.array(
+            [(word.top, word.left, word.bottom, word.right) for word in ocr_results],
+            dtype=np.float64)
+
+        return self.encode_boxes(boxes)
+
+    def encode_boxes(
+            self,
+            boxes: np.ndarray
+        ) -> np.ndarray:
+        """Encodes an array of bounding boxes into array of new_size
+
+        :param np.ndarray boxes: (number of words, 4) array with the top, left,
+            bottom and right boundaries of each word
+
+        :returns np.ndarray encoding: location encoding for the bounding boxes
+        """
+
+        tops, lefts, bottoms, rights = np.asarray(boxes, dtype=np.float64).T
+
+        # External crop box that holds all of the bounding boxes
+        top = tops.min()
+        left = lefts.min()
+        bottom = bottoms.max()
+        right = rights.max()
+
+        height, width = self.layout_shape
+        horizontal_scaler = (width - 1) / (right - left)
+        vertical_scaler = (height - 1) / (bottom - top)
+
+        scaled_top = (tops - top) * vertical_scaler
+        scaled_left = (lefts - left) * horizontal_scaler
+        scaled_bottom = (bottoms - top) * vertical_scaler
+        scaled_right = (rights - left) * horizontal_scaler
+
+        # Indices for the boxes that we are going to affect
+        top_index = np.floor(scaled_top).astype(np.int64)
+        left_index = np.floor(scaled_left).astype(np.int64)
+
+        # Tolerance is to handle float errors
+        bottom_index = np.floor(scaled_bottom + self.TOLERANCE).astype(np.int64)
+        right_index = np.floor(scaled_right + self.TOLERANCE).astype(np.int64)
+
+        # Percent of index that is represented by the bounding box
+        top_scaler = (top_index + 1) - scaled_top
+        left_scaler = (left_index + 1) - scaled_left
+        bottom_scaler = scaled_bottom - bottom_index
+        right_scaler = scaled_right - right_index
+
+        # Correction for float errors
+        bottom_scaler[bottom_scaler <= self.TOLERANCE] = 1
+        right_scaler[right_scaler <= self.TOLERANCE] = 1
+
+        # One entry per (word, cell) pair covered by the word, in word order
+        row_counts = bottom_index - top_index + 1
+        column_counts = right_index - left_index + 1
+        cell_counts = row_counts * column_counts
+        word_ids = np.repeat(np.arange(len(tops)), cell_counts)
+        offsets = np.arange(cell_counts.sum()) - np.repeat(np.cumsum(cell_counts) - cell_counts, cell_counts)
+        ix = top_index[word_ids] + offsets // column_counts[word_ids]
+        iy = left_index[word_ids] + offsets % column_counts[word_ids]
+
+        # Same sequence of products as the loop, so the values are bit for bit identical
+        value = np.ones(len(ix))
+        value = np.where(ix == top_index[word_ids], value * top_scaler[word_ids], value)
+        value = np.where(ix == bottom_index[word_ids], value * bottom_scaler[word_ids], value)
+        value = np.where(iy == left_index[word_ids], value * left_scaler[word_ids], value)
+        value = np.where(iy == right_index[word_ids], value * right_scaler[word_ids], value)
+
+        # np.add.at is unbuffered: each cell receives the words one after the other
+        result = np.zeros(self.layout_shape)
+        np.add.at(result, (ix, iy), value)
+
+        return result
@@ -20,7 +20,7 @@ from sklearn.pipeline import Pipeline
 
 from src.Secrets import Secrets
 import src.routing_helpers as rh
-from src.WordAndLayoutEncoder import WordAndLayoutEncoder
+from src.VectorizedWordAndLayoutEncoder import VectorizedWordAndLayoutEncoder
 from src.RoutingModel import RoutingModel
 from src.AzureComputerVisionReadApi import AzureComputerVisionReadApi
 
@@ -63,7 +63,7 @@ def main(data_dir, model_name, number_of_words, shape):
     log.info(f"Vocabulary of {len(vocabulary_vector)} words created")
 
     # Encode the data
-    routing_encoder = WordAndLayoutEncoder(vocabulary_vector, shape)
+    routing_encoder = VectorizedWordAndLayoutEncoder(vocabulary_vector, shape)
     num_features = len(vocabulary_vector) + shape[0] * shape[1]
 
     # Initializes arrays to receive the encoded results
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import random
+import threading
+import time
+
+import requests
+
+
+class OperationFailedError(Exception):
+    """The service reported the operation as failed"""
+
+
+class OperationTimeoutError(Exception):
+    """The operation did not complete before the deadline"""
+
+
+class OperationCancelledError(Exception):
+    """The polling was cancelled"""
+
+
+def backoff_delays(initial_delay, max_delay, multiplier, jitter, rng=random):
+    """
+    Jittered exponential backoff: initial_delay, initial_delay * multiplier, ... capped at max_delay,
+    each delay being reduced by a random fraction of up to jitter so that documents submitted
+    together don't poll the service in lockstep
+    """
+    delay = initial_delay
+    while True:
+        yield delay * (1 - jitter * rng.random())
+        delay = min(delay * multiplier, max_delay)
+
+
+class LongRunningOperationPoller(object):
+    """
+    Polls Form Recognizer analyze operations until they complete.
+    The waits between polls follow a jittered exponential backoff, and the Retry-After delay is respected
+    when the service throttles the requests (429 response). Each operation has an overall deadline and
+    cancel() stops all the operations polled by this instance. Waiting threads sleep, so a poller can be
+    shared by many threads polling different documents at once.
+    """
+
+    def __init__(self, subscription_key, initial_delay=0.5, max_delay=10.0, multiplier=1.5, jitter=0.2,
+                 deadline=300.0, session=None):
+        self.subscription_key = subscription_key
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.deadline = deadline
+        self.session = session if session is not None else requests.Session()
+        self.polls = 0
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def poll(self, status_url, deadline=None):
+        """
+        Waits for an operation to complete
+        :param status_url: The Operation-Location returned when the operation was submitted
+        :param deadline: Maximum time in seconds to wait for the operation, defaults to the poller deadline
+        :return: The json response of the completed operation
+        """
+        end = time.monotonic() + (deadline if deadline is not None else self.deadline)
+        headers = {"Ocp-Apim-Subscription-Key": self.subscription_key}
+
+        for delay in backoff_delays(self.initial_delay, self.max_delay, self.multiplier, self.jitter):
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                raise OperationTimeoutError(f"Operation {status_url} did not complete in time")
+            if self._cancelled.wait(min(delay, remaining)):
+                raise OperationCancelledError(f"Polling of operation {status_url} was cancelled")
+
+            resp = self.session.get(url=status_url, headers=headers)
+            self.polls += 1
+            if resp.status_code == 429:
+                retry_after = float(resp.headers.get('Retry-After', delay))
+                # Waiting for the service before the next backoff delay
+                if self._cancelled.wait(min(retry_after, max(end - time.monotonic(), 0))):
+                    raise OperationCancelledError(f"Polling of operation {status_url} was cancelled")
+                continue
+            resp.raise_for_status()
+
+            result = resp.json()
+            status = result.get('status')
+            if status == 'succeeded':
+                return result
+            if status == 'failed':
+                raise OperationFailedError(f"Operation {status_url} failed: {result}")
+            # Other statuses are "notStarted" and "running"
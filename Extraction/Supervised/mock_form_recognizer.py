@@ -0,0 +1,158 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""
+Local mock of the Form Recognizer v2.0 custom model analyze endpoint, to measure the prediction code offline.
+Operations succeed `latency` seconds after they were submitted, status requests are counted.
+
+Compare the previous busy-wait polling with the backoff poller (sequential and concurrent):
+    python mock_form_recognizer.py --documents 40 --latency 2
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from requests import get, post
+
+KEY = "mock-key"
+
+ANALYZE_RESULT = {
+    "readResults": [{"page": 1, "lines": []}],
+    "documentResults": [{"fields": {
+        "TOTAL": {"text": "1,234.00", "page": 1, "confidence": 0.99},
+        "INVOICE_NUMBER": {"text": "INV-001", "page": 1, "confidence": 0.98}}}]
+}
+
+
+class MockFormRecognizer(object):
+
+    def __init__(self, latency=2.0, port=0):
+        self.latency = latency
+        self.operations = {}
+        self.counters = {'submitted': 0, 'polls': 0}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._make_handler())
+        self.server.daemon_threads = True
+        self.endpoint = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _make_handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body=None, headers=None):
+                data = json.dumps(body).encode('utf-8') if body is not None else b""
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.headers.get('Ocp-Apim-Subscription-Key') != KEY:
+                    return self._reply(401, {"error": {"code": "401", "message": "Access denied"}})
+                if not re.match(r"^/formrecognizer/v2.0/custom/models/[^/]+/analyze", self.path):
+                    return self._reply(404, {"error": {"code": "404"}})
+                operation_id = str(uuid.uuid4())
+                with mock.lock:
+                    mock.operations[operation_id] = time.monotonic() + mock.latency
+                    mock.counters['submitted'] += 1
+                self._reply(202, headers={"Operation-Location": f"{mock.endpoint}/operations/{operation_id}"})
+
+            def do_GET(self):
+                operation_id = self.path.split('/')[-1]
+                with mock.lock:
+                    mock.counters['polls'] += 1
+                    done_at = mock.operations.get(operation_id)
+                if done_at is None:
+                    return self._reply(404, {"error": {"code": "404"}})
+                if time.monotonic() < done_at:
+                    return self._reply(200, {"status": "running"})
+                self._reply(200, {"status": "succeeded", "analyzeResult": ANALYZE_RESULT})
+
+        return Handler
+
+
+def busy_wait_analyse(endpoint, model_id, file_name, file_name_path):
+    """The polling loop used before the backoff poller: no wait between status requests"""
+    headers = {"Ocp-Apim-Subscription-Key": KEY, "Content-Type": "application/pdf"}
+    url = f"{endpoint}/formrecognizer/v2.0/custom/models/{model_id}/analyze?includeTextDetails=True"
+    files = {'file': (file_name, open(file_name_path + '/' + file_name, 'rb'), 'application/pdf', {'Expires': '0'})}
+    resp = post(url=url, files=files, headers=headers)
+    status_url = resp.headers['Operation-Location']
+    headers = {"Ocp-Apim-Subscription-Key": KEY}
+    resp = get(url=status_url, headers=headers)
+    while not resp.json()['status'] == 'succeeded':
+        resp = get(url=status_url, headers=headers)
+    return resp.json()
+
+
+def benchmark(documents, latency, max_in_flight):
+    import prediction_supervised
+
+    folder = tempfile.mkdtemp()
+    file_names = [f"doc{i}.pdf" for i in range(documents)]
+    for file_name in file_names:
+        with open(os.path.join(folder, file_name), 'wb') as f:
+            f.write(os.urandom(64 * 1024))
+
+    def run_busy_wait(endpoint):
+        return [busy_wait_analyse(endpoint, "model", f, folder) for f in file_names]
+
+    def run_sequential(endpoint):
+        return [prediction_supervised.form_recognizerv2_analyse(None, KEY, "model", f, folder, endpoint=endpoint)
+                for f in file_names]
+
+    def run_concurrent(endpoint):
+        return [r for _, r, _ in prediction_supervised.form_recognizerv2_analyse_many(
+            None, KEY, "model", file_names, folder, max_in_flight, endpoint=endpoint)]
+
+    try:
+        for name, method in [("busy-wait (before)", run_busy_wait), ("backoff poller", run_sequential),
+                             (f"backoff poller, {max_in_flight} in flight", run_concurrent)]:
+            mock = MockFormRecognizer(latency).start()
+            wall, cpu = time.perf_counter(), time.process_time()
+            results = method(mock.endpoint)
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            mock.stop()
+            succeeded = sum(1 for r in results if r is not None and r['status'] == 'succeeded')
+            print(f"{name}: {succeeded}/{documents} documents in {wall:.1f}s "
+                  f"({documents / wall:.2f} docs/s), client CPU {cpu:.1f}s, {mock.counters['polls']} status requests")
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    args = parser.parse_args()
+    benchmark(args.documents, args.latency, args.max_in_flight)
@@ -9,7 +9,7 @@ import random
 import shutil
 import sys
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import pandas as pd
 from azure.storage.blob import (
@@ -18,6 +18,11 @@ from azure.storage.blob import (
 from dotenv import load_dotenv
 from requests import get, post
 
+try:
+    from .lro_poller import LongRunningOperationPoller
+except ImportError:
+    from lro_poller import LongRunningOperationPoller
+
 load_dotenv()
 
 
@@ -144,6 +149,83 @@ def download_input_files_from_blob_storage(
     return input_doc_files
 
 
+def score_prediction(keys, input_file_name, resp, df_gt_row, anchor_keys, issuer_name):
+    """
+    Compares the fields extracted by Form Recognizer for a file with its Ground Truth
+    :param keys: Our data structure to store the results of every file prediction
+    :param input_file_name: The file we are scoring
+    :param resp: The prediction json response object
+    :param df_gt_row: The Ground Truth rows of the file
+    :param anchor_keys: The fields we want to extract
+    :param issuer_name: The unique identifier of the form being processed
+    :return: The appended json dict
+    """
+    fieldcount = 0
+    field_match_count = 0
+
+    keys[issuer_name + ':' + input_file_name] = []
+
+    # loop through anchor keys and identify what was extracted by Form Recognizer
+    for anchor_key in anchor_keys:
+        anchor_key = anchor_key.strip()
+        fields = resp['analyzeResult']['documentResults'][0]['fields']
+
+        if anchor_key in fields:
+            fieldcount += 1
+
+            anchor_key_value = str(fields[anchor_key]['text'])
+            anchor_key_page_num = str(fields[anchor_key]['page'])
+            confidence = fields[anchor_key]['confidence']
+
+            if anchor_key == 'TOTAL':
+                # TODO add custom total formatting here
+                anchor_key_value = anchor_key_value.replace(",", "")
+
+            #  TODO add your custom formatting here if required
+            """
+            anchor_key_value = extract_anchor_key_value(
+                anchor_key,
+                anchor_key_value)
+            """
+            # TODO add your custom formatting/normalisation of your Ground Truth here
+            gt_original_value = str(df_gt_row.iloc[0][anchor_key])
+            gt_key_value = gt_preprocessing(anchor_key, df_gt_row)
+
+            # Does the post processed predicted field match the preprocessed ground truth
+            if anchor_key_value.lower().strip() == gt_key_value:
+                field_match_count += 1
+
+            print(f'{input_file_name} {anchor_key} Ground Truth: {gt_key_value.upper()} Extracted:'
+                  f' {anchor_key_value.upper()}')
+
+            actual_accuracy = field_match_count / fieldcount
+
+            # Add key extraction to the output json
+            keys = build_keys_json_object(keys, input_file_name,
+                                          anchor_key, gt_original_value.strip(),
+                                          anchor_key_value.strip(),
+                                          confidence,
+                                          issuer_name,
+                                          actual_accuracy,
+                                          anchor_key_page_num)
+
+    return keys
+
+
+def summarize_timings(records):
+    """
+    Summary of the per-stage timings of a run
+    :param records: The metrics records of the files
+    :return: For each stage, the total, mean and maximum time in seconds
+    """
+    summary = {}
+    for stage in ['upload', 'queue_wait', 'poll', 'post_process', 'total']:
+        values = [r[stage] for r in records if r.get(stage) is not None]
+        if len(values) > 0:
+            summary[stage] = {'total': sum(values), 'mean': sum(values) / len(values), 'max': max(values)}
+    return summary
+
+
 def process_folder_and_predict(
         keys,
         input_folder_path,
@@ -154,6 +236,9 @@ def process_folder_and_predict(
         key_field_names,
         region,
         subscription_key,
+        max_in_flight=8,
+        results_path=None,
+        metrics_path=None,
 ):
     """
     Iterate through our storage accounts, download, correlate with Ground Truth and invoke downstream
@@ -168,89 +253,80 @@ def process_folder_and_predict(
     :param key_field_names: The fields we want to extract
     :param region: The region where Form Recognizer is deployed
     :param subscription_key: The Form Recognizer key
+    :param max_in_flight: Maximum number of predictions in progress at the same time
+    :param results_path: Optional json lines file the results of each file are appended to as soon as it is scored
+    :param metrics_path: Optional json lines file receiving the per-stage timings (seconds) of each file,
+        followed by a summary of the run
     :return:
     """
 
     # Let's get the fields we want to extract into a list
     anchor_keys = [f for f in key_field_names.split(',')]
 
-    for input_file_name in input_doc_files:
-        fieldcount = 0
-        field_match_count = 0
-
-        keys[issuer_name + ':' + input_file_name] = []
-
-        try:
-
-            before_call_time = datetime.now().strftime("%H:%M:%S")
-
-            # Call to the Form Recognizer service
-            resp = form_recognizerv2_analyse(region,
-                                             subscription_key,
-                                             model_id, input_file_name, input_folder_path)
-
-            after_call_time = datetime.now().strftime("%H:%M:%S")
-
-            short_file_name = str(input_file_name[:len(input_file_name) - 4])
-            print(f'Searching for GT record {short_file_name}')
-
-            # TODO add your file name identifier here from your Ground Truth
-            df_gt_row = ground_truth_df[ground_truth_df['FILENAME'] == short_file_name]
-
-            # loop through anchor keys and identify what was extracted by Form Recognizer
-            for anchor_key in anchor_keys:
-                anchor_key = anchor_key.strip()
-                fields = resp['analyzeResult']['documentResults'][0]['fields']
-
-                if anchor_key in fields:
-                    fieldcount += 1
-
-                    anchor_key_value = str(fields[anchor_key]['text'])
-                    anchor_key_page_num = str(fields[anchor_key]['page'])
-                    confidence = fields[anchor_key]['confidence']
-
-                    if anchor_key == 'TOTAL':
-                        # TODO add custom total formatting here
-                        anchor_key_value = anchor_key_value.replace(",", "")
+    # TODO add your file name identifier here from your Ground Truth
+    # The Ground Truth is grouped by file once instead of being filtered for every file
+    gt_by_file = {str(name): rows for name, rows in ground_truth_df.groupby('FILENAME')}
+    no_gt = ground_truth_df.iloc[0:0]
 
-                    #  TODO add your custom formatting here if required
-                    """
-                    anchor_key_value = extract_anchor_key_value(
-                        anchor_key,
-                        anchor_key_value)
-                    """
-                    # TODO add your custom formatting/normalisation of your Ground Truth here
-                    gt_original_value = str(df_gt_row.iloc[0][anchor_key])
-                    gt_key_value = gt_preprocessing(anchor_key, df_gt_row)
+    results_file = open(results_path, 'a') if results_path is not None else None
+    metrics_file = open(metrics_path, 'a') if metrics_path is not None else None
+    records = []
+    run_start = time.monotonic()
 
-                    # Does the post processed predicted field match the preprocessed ground truth
-                    if anchor_key_value.lower().strip() == gt_key_value:
-                        field_match_count += 1
-
-                    print(f'{input_file_name} {anchor_key} Ground Truth: {gt_key_value.upper()} Extracted:'
-                          f' {anchor_key_value.upper()}')
-
-                    actual_accuracy = field_match_count / fieldcount
-
-                    # Add key extraction to the output json
-                    keys = build_keys_json_object(keys, input_file_name,
-                                                  anchor_key, gt_original_value.strip(),
-                                                  anchor_key_value.strip(),
-                                                  confidence,
-                                                  issuer_name,
-                                                  actual_accuracy,
-                                                  anchor_key_page_num)
-
-            after_processing_time = datetime.now().strftime("%H:%M:%S")
-
-            print(f"start call: {before_call_time} "
-                  f"end_call_time: {after_call_time} "
-                  f"end processing: {after_processing_time}")
-
-        except Exception as e:
-            exc_type, _, exc_tb = sys.exc_info()
-            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-            print(f'Predict Error {e} {exc_type} {fname} {exc_tb.tb_lineno}')
+    try:
+        # Calls to the Form Recognizer service, several documents are predicted at once
+        predictions = form_recognizerv2_analyse_many(region,
+                                                     subscription_key,
+                                                     model_id, input_doc_files, input_folder_path,
+                                                     max_in_flight)
+
+        for input_file_name, resp, timings in predictions:
+            record = {'file': input_file_name, 'status': 'failed' if resp is None else resp.get('status')}
+            record.update(timings)
+            post_process_start = time.monotonic()
+
+            try:
+                short_file_name = str(input_file_name[:len(input_file_name) - 4])
+                print(f'Searching for GT record {short_file_name}')
+                df_gt_row = gt_by_file.get(short_file_name, no_gt)
+
+                keys = score_prediction(keys, input_file_name, resp, df_gt_row, anchor_keys, issuer_name)
+
+                if results_file is not None:
+                    results_file.write(json.dumps({'file': input_file_name,
+                                                   'keys': keys[issuer_name + ':' + input_file_name]}) + '\n')
+                    results_file.flush()
+
+            except Exception as e:
+                exc_type, _, exc_tb = sys.exc_info()
+                fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+                print(f'Predict Error {e} {exc_type} {fname} {exc_tb.tb_lineno}')
+                record['error'] = str(e)
+
+            record['post_process'] = time.monotonic() - post_process_start
+            record['total'] = sum(record.get(stage) or 0 for stage in ['queue_wait', 'upload', 'poll', 'post_process'])
+            records.append(record)
+            print(f"{input_file_name} upload: {record.get('upload') or 0:.2f}s "
+                  f"queue wait: {record['queue_wait']:.2f}s "
+                  f"poll: {record.get('poll') or 0:.2f}s "
+                  f"post-process: {record['post_process']:.2f}s")
+            if metrics_file is not None:
+                metrics_file.write(json.dumps(record) + '\n')
+                metrics_file.flush()
+
+        wall_time = time.monotonic() - run_start
+        print(f"Predicted {len(records)} files in {wall_time:.1f}s")
+        if metrics_file is not None:
+            metrics_file.write(json.dumps({'summary': {
+                'issuer': issuer_name, 'model_id': model_id, 'files': len(records),
+                'failed': sum(1 for r in records if r['status'] != 'succeeded'),
+                'max_in_flight': max_in_flight, 'wall_time': wall_time,
+                'stages': summarize_timings(records)}}) + '\n')
+    finally:
+        if results_file is not None:
+            results_file.close()
+        if metrics_file is not None:
+            metrics_file.close()
 
     return keys
 
@@ -316,14 +392,18 @@ def get_prediction(region, subscription_key, blob_sas_url, model_id, predict_typ
     return prediction
 
 
-def form_recognizerv2_analyse(region, subscription_key, model_id, file_name, file_name_path):
+def form_recognizerv2_analyse(region, subscription_key, model_id, file_name, file_name_path, poller=None,
+                              endpoint=None, timings=None):
     """
     Analyses a document with the Form Recognizer supervised model
-    :param base_url: Prefix url for service
+    :param region: The region where Form Recognizer is deployed
     :param subscription_key: CogSvc key
     :param model_id: Model associated with the document to predict
     :param file_name: File name we a predicting
     :param file_name_path: Path for file we are predicting
+    :param poller: LongRunningOperationPoller used to wait for the result, can be shared between documents
+    :param endpoint: Prefix url for service, defaults to the regional endpoint
+    :param timings: Optional dictionary receiving the upload and poll durations in seconds
     :return: Prediction json response object
     """
 
@@ -333,24 +413,29 @@ def form_recognizerv2_analyse(region, subscription_key, model_id, file_name, fil
     }
     print(f'Evaluating against model_id {model_id}')
 
-    url = f"https://{region}.api.cognitive.microsoft.com/formrecognizer/v2.0/custom/models/{model_id}/analyze?includeTextDetails=True"
+    if endpoint is None:
+        endpoint = f"https://{region}.api.cognitive.microsoft.com"
+    url = f"{endpoint}/formrecognizer/v2.0/custom/models/{model_id}/analyze?includeTextDetails=True"
 
     print(f'Predict {file_name} {file_name_path}')
     try:
-        files = {'file': (file_name, open(file_name_path + '/' + file_name, 'rb'),
-                          'application/pdf', {'Expires': '0'})}
+        upload_start = time.monotonic()
+        with open(file_name_path + '/' + file_name, 'rb') as document:
+            files = {'file': (file_name, document, 'application/pdf', {'Expires': '0'})}
+            resp = post(url=url, files=files, headers=headers)
+        if timings is not None:
+            timings['upload'] = time.monotonic() - upload_start
 
-        resp = post(url=url, files=files, headers=headers)
         if resp.status_code == 202:
-
             status_url = resp.headers['Operation-Location']
-            headers = {"Ocp-Apim-Subscription-Key": subscription_key}
-            resp = get(url=status_url, headers=headers)
-
-            while not resp.json()['status'] == 'succeeded':
-                resp = get(url=status_url, headers=headers)
-
-            return resp.json()
+            if poller is None:
+                poller = LongRunningOperationPoller(subscription_key)
+            poll_start = time.monotonic()
+            try:
+                return poller.poll(status_url)
+            finally:
+                if timings is not None:
+                    timings['poll'] = time.monotonic() - poll_start
         else:
             print(f"Error predicting {resp.text}")
 
@@ -360,6 +445,39 @@ def form_recognizerv2_analyse(region, subscription_key, model_id, file_name, fil
         print(f'Predict error {e} {exc_type} {fname} {exc_tb.tb_lineno}')
 
 
+def form_recognizerv2_analyse_many(region, subscription_key, model_id, file_names, file_name_path,
+                                   max_in_flight=8, poller=None, endpoint=None):
+    """
+    Analyses several documents at once, with up to max_in_flight predictions in progress
+    The results are yielded as they complete; if the caller stops iterating, the pending predictions are cancelled
+    :param file_names: File names we are predicting
+    :param max_in_flight: Maximum number of documents submitted or polled at the same time
+    :return: Generator of (file name, prediction json response object or None, timings), the timings holding
+        the time waited for a free slot (queue_wait), the upload and poll durations in seconds
+    """
+
+    if poller is None:
+        poller = LongRunningOperationPoller(subscription_key)
+
+    def analyse(file_name, submitted):
+        timings = {'queue_wait': time.monotonic() - submitted, 'upload': None, 'poll': None}
+        resp = form_recognizerv2_analyse(region, subscription_key, model_id, file_name, file_name_path, poller,
+                                         endpoint, timings)
+        return resp, timings
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        futures = {executor.submit(analyse, file_name, time.monotonic()): file_name for file_name in file_names}
+        try:
+            for future in as_completed(futures):
+                resp, timings = future.result()
+                yield futures[future], resp, timings
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            poller.cancel()
+            raise
+
+
 def get_ground_truth():
     """
     TODO Add code to retrieve the ground truth from your datastore
@@ -414,6 +532,7 @@ class Config:
     SAMPLE_NUMBER = os.environ.get("SAMPLE_NUMBER")  # Sample number of files for prediction
     KEY_FIELD_NAMES = os.environ.get("KEY_FIELD_NAMES")  # The fields we want to extract
     REGION = os.environ.get("REGION")  # The region Form Recognizer and OCR are deployed
+    MAX_IN_FLIGHT = os.environ.get("MAX_IN_FLIGHT", "8")  # Number of predictions in progress at the same time
 
 
 def main():
@@ -477,7 +596,11 @@ def main():
             issuer_name,
             input_doc_files,
             Config.KEY_FIELD_NAMES,
-            Config.REGION
+            Config.REGION,
+            Config.SUBSCRIPTION_KEY,
+            int(Config.MAX_IN_FLIGHT),
+            Config.LOCAL_WORKING_DIR + '/supervised_predict_' + str(issuer_name) + '_.jsonl',
+            Config.LOCAL_WORKING_DIR + '/supervised_predict_metrics_' + str(issuer_name) + '_.jsonl'
         )
 
         # Let's clean up to save space
@@ -1,4 +1,5 @@
 import argparse
+import collections
 import os
 import json
 import time
@@ -18,15 +19,24 @@ parser.add_argument("--output", type=str, required=True)
 parser.add_argument("--fr_endpoint", type=str, required=True)
 parser.add_argument("--fr_key", type=str, required=True)
 parser.add_argument("--training_folder", type=str, required=True)
+# Number of models trained at the same time, within the quota of the Form Recognizer resource
+parser.add_argument("--max_trainings", type=int, default=4)
+# Progress of the trainings, a step started again after a crash skips the trained models. It must be on storage
+# kept between runs of the step (a mounted datastore path), the output folder by default is only kept for a retry
+# of the same run. It is deleted once every folder is trained
+parser.add_argument("--checkpoint", type=str, default=None,
+                    help="Checkpoint file on persistent storage, deleted once every folder is trained")
+parser.add_argument("--timeout", type=int, default=1800)
 args = parser.parse_args()
 
 os.makedirs(args.output, exist_ok=True)
-    
+
 subfolders = os.listdir(args.training_folder)
 
 endpoint = args.fr_endpoint
 post_url = endpoint + r"/formrecognizer/v2.0/custom/models"
 source = args.sas_uri
+checkpoint_path = args.checkpoint if args.checkpoint is not None else os.path.join(args.output, 'checkpoint.json')
 
 includeSubFolders = False
 useLabelFile = False
@@ -36,66 +46,136 @@ headers = {
     'Ocp-Apim-Subscription-Key': args.fr_key,
 }
 
-model_metadata = {}
+wait_sec = 5
+max_wait_sec = 60
+
+
+def get_wait_sec(resp, backoff):
+    # The backoff, or the Retry-After header of the service when it asks to wait longer
+    try:
+        retry_after = float(resp.headers["Retry-After"])
+    except Exception:
+        retry_after = 0
+    return min(max(retry_after, backoff), max_wait_sec)
+
 
+def save_checkpoint(checkpoint):
+    with open(checkpoint_path + '.tmp', 'w') as outfile:
+        json.dump(checkpoint, outfile)
+    os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+
+checkpoint = {}
+if os.path.isfile(checkpoint_path):
+    with open(checkpoint_path) as infile:
+        checkpoint = json.load(infile)
+
+model_metadata = {}
+errors = []
+# Folders waiting for a training slot, and trainings in progress with the time of their next poll
+pending = collections.deque()
+trainings = {}
 for prefix in subfolders:
-    log.info(f"Training for folder {prefix}")
+    state = checkpoint.get(prefix, {})
+    if 'modelId' in state:
+        log.info(f"Folder {prefix} already trained: {state['modelId']}")
+        model_metadata[prefix] = state['modelId']
+    elif 'location' in state:
+        log.info(f"Resuming training for folder {prefix}")
+        trainings[prefix] = {'location': state['location'], 'next_poll': 0, 'wait_sec': wait_sec,
+                             'deadline': time.monotonic() + args.timeout}
+    else:
+        pending.append(prefix)
 
-    body = 	{
-        "source": source,
-        "sourceFilter": {
-            "prefix": prefix,
-            "includeSubFolders": includeSubFolders
-        },
-        "useLabelFile": useLabelFile
-    }
+# All the folders are trained at the same time, at most max_trainings at once
+next_submit = 0
+submit_wait_sec = wait_sec
+while len(pending) > 0 or len(trainings) > 0:
 
-    try:
-        resp = post(url = post_url, json = body, headers = headers)
-        if resp.status_code != 201:
-            log.error("POST model failed (%s):\n%s" % (resp.status_code, json.dumps(resp.json())))
-            run.fail(error_details=json.dumps(resp.json()), error_code=resp.status_code)
-        log.info("POST model succeeded:\n%s" % resp.headers)
-        get_url = resp.headers["location"]
-    except Exception as e:
-        log.error("POST model failed:\n%s" % str(e))
-        run.fail(error_details=str(e)) 
-    
-    n_tries = 15
-    n_try = 0
-    wait_sec = 5
-    max_wait_sec = 60
-    is_completed = False
-    while n_try < n_tries:
+    while len(pending) > 0 and len(trainings) < args.max_trainings and time.monotonic() >= next_submit:
+        prefix = pending[0]
+        log.info(f"Training for folder {prefix}")
+
+        body = 	{
+            "source": source,
+            "sourceFilter": {
+                "prefix": prefix,
+                "includeSubFolders": includeSubFolders
+            },
+            "useLabelFile": useLabelFile
+        }
+
+        try:
+            resp = post(url = post_url, json = body, headers = headers)
+            if resp.status_code == 429:
+                # Throttled by the service, submitted again after a backoff
+                next_submit = time.monotonic() + get_wait_sec(resp, submit_wait_sec)
+                submit_wait_sec = min(2*submit_wait_sec, max_wait_sec)
+                break
+            pending.popleft()
+            if resp.status_code != 201:
+                log.error("POST model failed (%s):\n%s" % (resp.status_code, json.dumps(resp.json())))
+                errors.append(f"{prefix}: POST model failed ({resp.status_code})")
+                continue
+            log.info("POST model succeeded:\n%s" % resp.headers)
+            submit_wait_sec = wait_sec
+            trainings[prefix] = {'location': resp.headers["location"], 'next_poll': time.monotonic() + wait_sec,
+                                 'wait_sec': wait_sec, 'deadline': time.monotonic() + args.timeout}
+            checkpoint[prefix] = {'location': resp.headers["location"]}
+            save_checkpoint(checkpoint)
+        except Exception as e:
+            log.error("POST model failed:\n%s" % str(e))
+            pending.popleft()
+            errors.append(f"{prefix}: {e}")
+
+    for prefix, training in list(trainings.items()):
+        if time.monotonic() < training['next_poll']:
+            continue
         try:
-            resp = get(url = get_url, headers = headers)
+            resp = get(url = training['location'], headers = headers)
             resp_json = resp.json()
-            if resp.status_code != 200:
-                log.error("GET model failed (%s):\n%s" % (resp.status_code, json.dumps(resp_json)))
-                run.fail(error_details=json.dumps(resp.json()), error_code=resp.status_code)
-            model_status = resp_json["modelInfo"]["status"]
-            if model_status == "ready":
+            if resp.status_code == 200 and resp_json["modelInfo"]["status"] == "ready":
                 log.info("Training succeeded:\n%s" % json.dumps(resp_json))
-                is_completed = True
                 model_metadata[prefix] = resp_json['modelInfo']['modelId']
-                break
-            if model_status == "invalid":
+                checkpoint[prefix] = {'modelId': resp_json['modelInfo']['modelId']}
+                del trainings[prefix]
+            elif resp.status_code == 200 and resp_json["modelInfo"]["status"] == "invalid":
                 log.error("Training failed. Model is invalid:\n%s" % json.dumps(resp_json))
-                run.fail(error_details=json.dumps(resp.json()))
-            time.sleep(wait_sec)
-            n_try += 1
-            wait_sec = min(2*wait_sec, max_wait_sec)     
+                errors.append(f"{prefix}: model is invalid")
+                del trainings[prefix]
+            elif resp.status_code != 200 and resp.status_code != 429:
+                log.error("GET model failed (%s):\n%s" % (resp.status_code, json.dumps(resp_json)))
+                errors.append(f"{prefix}: GET model failed ({resp.status_code})")
+                del trainings[prefix]
+            elif time.monotonic() > training['deadline']:
+                log.error(f"Train operation for folder {prefix} did not complete within the allocated time.")
+                errors.append(f"{prefix}: train operation did not complete within the allocated time")
+                del trainings[prefix]
+            else:
+                training['next_poll'] = time.monotonic() + get_wait_sec(resp, training['wait_sec'])
+                training['wait_sec'] = min(2*training['wait_sec'], max_wait_sec)
         except Exception as e:
-            msg = "GET model failed:\n%s" % str(e)
-            log.error(msg)
-            run.fail(error_details=str(e))
-        
-    if is_completed is False:     
-        log.error("Train operation did not complete within the allocated time.")
-        run.fail(error_details="Train operation did not complete within the allocated time.")
-    
-    #sleep 60 seconds as a workaround around preview limitation
-    time.sleep(60)
-        
+            log.error("GET model failed:\n%s" % str(e))
+            errors.append(f"{prefix}: {e}")
+            del trainings[prefix]
+        if prefix not in trainings:
+            if 'location' in checkpoint.get(prefix, {}):
+                # Failed trainings are submitted again by the next run
+                del checkpoint[prefix]
+            save_checkpoint(checkpoint)
+
+    # Sleep until the next poll or submission is due
+    next_times = [training['next_poll'] for training in trainings.values()]
+    if len(pending) > 0 and len(trainings) < args.max_trainings:
+        next_times.append(next_submit)
+    if len(next_times) > 0:
+        time.sleep(max(0, min(next_times) - time.monotonic()))
+
 with open(os.path.join(args.output, 'model.json'), 'w') as outfile:
-    json.dump(model_metadata, outfile)
\ No newline at end of file
+    json.dump(model_metadata, outfile)
+
+if len(errors) > 0:
+    run.fail(error_details="\n".join(errors))
+elif os.path.isfile(checkpoint_path):
+    # Every folder is trained, the next run trains them again
+    os.remove(checkpoint_path)
@@ -3,7 +3,9 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
+import hashlib
 import json
+import mimetypes
 import os
 import shutil
 import sys
@@ -20,9 +22,18 @@ from requests import get, post
 
 sys.path.insert(1, '../../common/')
 from common.common import find_anchor_keys_in_form
+from common.ocr_cache import get_default_cache
+from common.ocr_index import OcrTokenIndex
+
+sys.path.insert(1, '../')
+from shared_code import fr_client
+from shared_code.training_scheduler import TrainingScheduler
 
 load_dotenv()
 
+# Blob etags and content hashes, and label inputs of the last run, kept with the downloaded documents
+AUTOLABEL_STATE_FILE = 'autolabel_state.json'
+
 
 def load_json_file(file_path):
     """
@@ -46,6 +57,98 @@ def save_json(data, output_file_path):
         json.dump(data, out_file, indent=4)
 
 
+def save_json_if_changed(data, output_file_path):
+    """
+    Writes the json file only when its content differs from the file on disk, so that
+    unchanged labels keep their timestamp and are not rewritten on every run
+    :param data: To data to write
+    :param output_file_path: The path to write
+    :return: True if the file was written
+    """
+    content = json.dumps(data, indent=4)
+    if os.path.isfile(output_file_path):
+        with open(output_file_path) as json_file:
+            if json_file.read() == content:
+                return False
+    with open(output_file_path, 'w') as out_file:
+        out_file.write(content)
+    return True
+
+
+def link_file(source_file_path, output_file_path):
+    """
+    Makes a file available in another folder without copying it: hard link where the
+    file system supports it, copy otherwise
+    :param source_file_path: The file to link
+    :param output_file_path: The path of the link
+    :return: Nothing
+    """
+    if os.path.exists(output_file_path):
+        if os.path.samefile(source_file_path, output_file_path):
+            return
+        os.remove(output_file_path)
+    try:
+        os.link(source_file_path, output_file_path)
+    except OSError:
+        shutil.copy2(source_file_path, output_file_path)
+
+
+def hash_file(file_path):
+    """
+
+    :param file_path: path to file
+    :return: The sha256 of the file content
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as in_file:
+        for chunk in iter(lambda: in_file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_documents_folder_path(vendor_folder_path_pass1):
+    """
+    :param vendor_folder_path_pass1: First pass folder
+    :return: The folder where the documents, OCR and run state are kept, next to the pass folders
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(vendor_folder_path_pass1)), 'documents')
+
+
+def record_uploaded_blobs(documents_folder_path, uploaded_etags):
+    """
+    Records the etags of the blobs uploaded from the documents folder, so that the next run does not
+    download them again: their content is the one already kept in the documents folder
+    :param documents_folder_path: Where the documents, OCR and run state are kept
+    :param uploaded_etags: A dictionary blob name -> etag returned by the upload
+    :return: Nothing
+    """
+    state_file_path = f"{documents_folder_path}/{AUTOLABEL_STATE_FILE}"
+    if not os.path.isfile(state_file_path):
+        return
+    state = load_json_file(state_file_path)
+    for blob_name, etag in uploaded_etags.items():
+        blob_file_path = f"{documents_folder_path}/{blob_name}"
+        if blob_name in state['blobs']:
+            state['blobs'][blob_name]['etag'] = etag
+        elif os.path.isfile(blob_file_path):
+            # OCR generated by the last run and uploaded with the training set
+            state['blobs'][blob_name] = {'etag': etag, 'sha256': hash_file(blob_file_path)}
+    save_json(state, state_file_path)
+
+
+def remove_document_files(folder_path, doc_file_name):
+    """
+    Removes a document and its OCR and label files from a folder
+    :param folder_path: The folder we are working with
+    :param doc_file_name: The document name.ext
+    :return: Nothing
+    """
+    for file_name in [doc_file_name, doc_file_name + '.ocr.json', doc_file_name + '.labels.json']:
+        file_path = f"{folder_path}/{file_name}"
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+
+
 def get_label_file_template(doc_name):
     """
     VOTT header file version
@@ -230,66 +333,6 @@ def create_label_file(file_name, key_fields, key_field_details):
     return label_file, unique_fields_extracted
 
 
-def form_recognizerv2_train(region, subscription_key, training_data_blob_sas_url, prefix=None,
-                            includeSubFolders=False,
-                            useLabelFile=True):
-    """
-    Simple rest call to FR V2
-    :param base_url: The prefix of the full url
-    :param subscription_key: CogSvc key
-    :param training_data_blob_sas_url: SAS URL for storage containing training set
-    :param prefix: The account name suffix e.g, https://[account].blob.core.windows.net
-    :param includeSubFolders: True/False
-    :param useLabelFile: Train with labels for Supervised - Always true
-    :return: The modelId and accuracy etc
-    """
-
-    """Trains a document with the Form Recognizer supervised model """
-
-    headers = {
-        # Request headers
-        "Content-Type": "application/json",
-        "Ocp-Apim-Subscription-Key": subscription_key,
-    }
-    url = f"https://{region}.api.cognitive.microsoft.com/formrecognizer/v2.0/custom/models"
-
-    print('url', url)
-    print('subscription_key', subscription_key)
-    print('training_data_blob_sas_url', training_data_blob_sas_url)
-
-    body = {
-        "source": training_data_blob_sas_url,
-        "sourceFilter": {
-            "prefix": prefix,
-            "includeSubFolders": includeSubFolders
-        },
-        "useLabelFile": useLabelFile}
-
-    try:
-        resp = post(url=url, json=body, headers=headers)
-
-        if resp.status_code == 201:
-            status_url = resp.headers['Location']
-            print(f"Model analyse submitted. Operation Location: {status_url}")
-            headers = {"Ocp-Apim-Subscription-Key": subscription_key}
-            resp = get(url=status_url, headers=headers)
-            count = 0
-            max_retry = 500
-            while (count < max_retry and resp.status_code == 200 and (
-                    resp.json()['modelInfo']['status'] == 'running' or resp.json()['modelInfo'][
-                'status'] == 'creating')):
-                resp = get(url=status_url, headers=headers)
-                time.sleep(0.5)
-                count += 1
-            return resp.json()
-        else:
-            print(f"Error training: {str(resp.text)}")
-    except Exception as e:
-        print(f"Error training model : {e}")
-
-    return None
-
-
 def call_ocr(file_path, file_name, language_code, region, subscription_key, content_type):
     """
     Let's only call OCR if we need to
@@ -306,6 +349,14 @@ def call_ocr(file_path, file_name, language_code, region, subscription_key, cont
     with open(os.path.join(file_path, file_name), 'rb') as ocr_file:
         file_content = ocr_file.read()
 
+    # Documents already analyzed, even under another name or in another folder, are read from the OCR cache
+    ocr_cache = get_default_cache()
+    cache_key = ocr_cache.make_key(file_content, 'formrecognizer/v2.0/layout')
+    analyze_result_response = ocr_cache.get(cache_key)
+    if analyze_result_response is not None:
+        print(f"OCR for file {file_name} found in cache")
+        return analyze_result_response
+
     operation_location = ""
     print(f"Analyzing file {file_name}...")
     analyze_result_response = None
@@ -333,6 +384,8 @@ def call_ocr(file_path, file_name, language_code, region, subscription_key, cont
                 time.sleep(0.5)
                 count += 1
             print(f"File {file_name} status: {analyze_result_response['status']}")
+            if analyze_result_response['status'] == 'succeeded':
+                ocr_cache.put(cache_key, analyze_result_response)
         except Exception as e:
             print(f"Error analyzing file: {e}")
 
@@ -344,7 +397,8 @@ def create_training_files_for_document(
         key_field_names,
         ground_truth_df,
         ocr_data,
-        pass_number):
+        pass_number,
+        ocr_index=None):
     """
     Create the ocr.json file and the label file for a document
     :param file_path: location of the document
@@ -352,6 +406,7 @@ def create_training_files_for_document(
     :param key_field_names: names of the key fields to extract
     :param ocr_data: Previously OCR form
     :param pass_number: Are we processing word level or both word and line level
+    :param ocr_index: OcrTokenIndex of ocr_data, to share between the passes of a document
     """
 
     extraction_file_name = file_name[:-4] + '.ocr.json'
@@ -361,7 +416,8 @@ def create_training_files_for_document(
         filename=extraction_file_name,
         data=ocr_data,
         anchor_keys=key_field_names,
-        pass_number=pass_number)
+        pass_number=pass_number,
+        ocr_index=ocr_index)
 
     print(f"key_field_data {len(key_field_data)} {key_field_data} {file_name}")
 
@@ -479,12 +535,19 @@ def process_folder(
         blob_service,
         container_name,
         region,
-        subscription_key
+        subscription_key,
+        documents_folder_path=None
 ):
     """
     Iterate through our storage accounts, download,correlate with Ground Truth and invoke downstream
     functions
 
+    The documents and their OCR are kept in documents_folder_path between runs, and only the blobs that
+    changed since the last run are downloaded: main records the etags of the blobs it uploads with
+    record_uploaded_blobs. Each OCR is parsed once for both passes, the pass folders hold links to the
+    documents and OCR files and only the label files that changed are written. A document whose inputs
+    (content of the document and OCR, Ground Truth record and key fields) are unchanged since the last run
+    is not labelled again.
 
     :param vendor_folder_path_pass1: First pass folder
     :param vendor_folder_path_pass2: Second pass folder
@@ -496,93 +559,148 @@ def process_folder(
     :param container_name: The storage blob container that we are processing
     :param region: The region the Cognitive Services are deployed
     :param subscription_key: The subscription key for the cognitive services
+    :param documents_folder_path: Where the documents, OCR and run state are kept, the documents folder
+    next to the pass folders by default
     :return: A dictionary object containing lists of filenames for OCR and labels generated for the pass level
     """
 
-    blob_names = blob_service.list_blobs(container_name)
-    for blob in blob_names:
-        blob_service.get_blob_to_path(container_name, blob.name, file_path=vendor_folder_path_pass1 + '/' + blob.name)
-
-    input_doc_files = [f for f in os.listdir(vendor_folder_path_pass1) if f.endswith(ext)]
+    if documents_folder_path is None:
+        documents_folder_path = get_documents_folder_path(vendor_folder_path_pass1)
+    paths = [vendor_folder_path_pass1, vendor_folder_path_pass2]
+    for folder_path in [documents_folder_path] + paths:
+        os.makedirs(folder_path, exist_ok=True)
+
+    state_file_path = f"{documents_folder_path}/{AUTOLABEL_STATE_FILE}"
+    state = {'blobs': {}, 'documents': {}}
+    if os.path.isfile(state_file_path):
+        state = load_json_file(state_file_path)
+
+    # Only the documents and OCR files that changed since the last run are downloaded, the label
+    # files in the container are generated again. The labels depend on the content of the blobs,
+    # their etags change whenever they are uploaded again
+    blobs_state = {}
+    downloaded = []
+    for blob in blob_service.list_blobs(container_name):
+        if not (blob.name.endswith(ext) or blob.name.endswith(ext + '.ocr.json')):
+            continue
+        blob_file_path = f"{documents_folder_path}/{blob.name}"
+        blob_state = state['blobs'].get(blob.name)
+        if not isinstance(blob_state, dict) or blob_state['etag'] != blob.properties.etag \
+                or not os.path.isfile(blob_file_path):
+            blob_service.get_blob_to_path(container_name, blob.name, file_path=blob_file_path)
+            blob_state = {'etag': blob.properties.etag, 'sha256': hash_file(blob_file_path)}
+            downloaded.append(blob.name)
+        blobs_state[blob.name] = blob_state
+
+    # The OCR generated for a document that changed is generated again
+    for blob_name in downloaded:
+        ocr_file_path = f"{documents_folder_path}/{blob_name}.ocr.json"
+        if blob_name.endswith(ext) and blob_name + '.ocr.json' not in blobs_state and os.path.isfile(ocr_file_path):
+            os.remove(ocr_file_path)
+
+    # Documents removed from the container since the last run
+    for folder_path in [documents_folder_path] + paths:
+        for doc_file_name in os.listdir(folder_path):
+            if doc_file_name.endswith(ext) and doc_file_name not in blobs_state:
+                remove_document_files(folder_path, doc_file_name)
+
+    input_doc_files = sorted(f for f in os.listdir(documents_folder_path) if f.endswith(ext))
 
     num_files = len(input_doc_files)
     print(f"Number of files for OCR {len(input_doc_files)} {ext}")
 
+    ground_truth_by_file = {
+        file_id: df_file_gt for file_id, df_file_gt in ground_truth_df.groupby('FILENAME') if isinstance(file_id, str)}
+    inputs_key = json.dumps([key_field_names, Config.MULTI_PAGE_FIELDS])
+
     # This object stores a list of filenames for the original file, the OCR and the label file
     pass_level = {}
+    output_files = {pass_number: [] for pass_number in range(1, len(paths) + 1)}
+    documents_state = {}
+    labelled = 0
+    labels_written = 0
 
     # Counter for number of corresponding Ground Truth files found
     file_ground_truth = 0
 
-    # Now we check if we have OCR files, if not we call OCR
     for input_file_name in input_doc_files:
 
         # check that we have ground truth for the file
-        df_vendor_gt = ground_truth_df[ground_truth_df['FILENAME'] == str(input_file_name[:len(input_file_name) - 4])]
-        if len(df_vendor_gt) == 0:
-            print(f"No GT record for {str(input_file_name[:len(input_file_name) - 4])}")
+        file_id = input_file_name[:len(input_file_name) - 4]
+        df_vendor_gt = ground_truth_by_file.get(file_id)
+        if df_vendor_gt is None:
+            print(f"No GT record for {file_id}")
+            for pass_path in paths:
+                remove_document_files(pass_path, input_file_name)
             continue
         else:
-            print(f"GT Filename {df_vendor_gt['FILENAME'].iloc[0]} {str(input_file_name[:len(input_file_name) - 4])}")
+            print(f"GT Filename {df_vendor_gt['FILENAME'].iloc[0]} {file_id}")
 
         file_ground_truth += 1
 
-        ocr_file_path = vendor_folder_path_pass1 + '/' + input_file_name + '.ocr.json'
+        ocr_file_path = f"{documents_folder_path}/{input_file_name}.ocr.json"
         # Let's check if the file has already been OCR'd
         print(f"Checking for previous OCR {ocr_file_path}")
         ocr_data = None
-        if os.path.isfile(ocr_file_path):
-            with open(ocr_file_path) as ocr_file:
-                ocr_data = json.load(ocr_file)
-
-        if ocr_data is None:
-            analyze_layout_ocr = call_ocr(vendor_folder_path_pass1, input_file_name, language_code, region,
-                                          subscription_key)
-            analyze_layout_ocr_output_file_path = \
-                f"{vendor_folder_path_pass1}/{input_file_name}.ocr.json"
-            save_json(analyze_layout_ocr, analyze_layout_ocr_output_file_path)
-
-    # Now we copy all OCR'd files to our second pass directory
-    if os.path.isdir(vendor_folder_path_pass2):
-        shutil.rmtree(vendor_folder_path_pass2)
-
-    # Linux OS
-    shutil.copytree(vendor_folder_path_pass1, vendor_folder_path_pass2)
-    paths = [vendor_folder_path_pass1, vendor_folder_path_pass2]
-    pass_number = 0
-
-    for pass_path in paths:
-        # Let's auto-label for pass_path in paths:
-        pass_number += 1
-        pass_level[pass_number] = []
-        output_files = []
-
-        input_doc_files = [f for f in os.listdir(pass_path) if f.endswith(ext)]
-        for input_file_name in input_doc_files:
-            ocr_file_path = pass_path + '/' + input_file_name + '.ocr.json'
-
-            with open(ocr_file_path) as ocr_file:
-                ocr_data = json.load(ocr_file)
-
-            analyze_layout_ocr, label_file, key_length = create_training_files_for_document(
-                input_file_name,
-                key_field_names,
-                ground_truth_df,
-                ocr_data,
-                pass_number)
-
-            output_files.append([input_file_name, key_length])
-
-            # save files
-            label_output_file_path = f"{pass_path}/{input_file_name}.labels.json"
-            save_json(label_file, label_output_file_path)
-
-            fields_file = create_fields_json_file(key_field_names)
-            fields_output_file_path = f"{pass_path}/fields.json"
-            save_json(fields_file, fields_output_file_path)
-
+        if not os.path.isfile(ocr_file_path):
+            content_type = mimetypes.guess_type(input_file_name)[0] or 'application/pdf'
+            ocr_data = call_ocr(documents_folder_path, input_file_name, language_code, region,
+                                subscription_key, content_type)
+            save_json(ocr_data, ocr_file_path)
+
+        ocr_blob_state = blobs_state.get(input_file_name + '.ocr.json')
+        inputs_hash = hashlib.sha256(json.dumps([
+            blobs_state[input_file_name]['sha256'],
+            ocr_blob_state['sha256'] if ocr_blob_state is not None else hash_file(ocr_file_path),
+            df_vendor_gt.to_json(orient='records', default_handler=str),
+            inputs_key]).encode('utf-8')).hexdigest()
+
+        label_file_paths = []
+        for pass_path in paths:
+            link_file(f"{documents_folder_path}/{input_file_name}", f"{pass_path}/{input_file_name}")
+            link_file(ocr_file_path, f"{pass_path}/{input_file_name}.ocr.json")
+            label_file_paths.append(f"{pass_path}/{input_file_name}.labels.json")
+
+        previous = state['documents'].get(input_file_name)
+        if previous != None and previous['inputs'] == inputs_hash and all(
+                os.path.isfile(label_file_path) for label_file_path in label_file_paths):
+            key_lengths = previous['key_lengths']
+        else:
+            # The OCR is parsed and indexed once for both passes
+            if ocr_data is None:
+                ocr_data = load_json_file(ocr_file_path)
+            try:
+                ocr_index = OcrTokenIndex(ocr_data)
+            except Exception:
+                ocr_index = None
+
+            key_lengths = []
+            for pass_number, label_file_path in enumerate(label_file_paths, 1):
+                analyze_layout_ocr, label_file, key_length = create_training_files_for_document(
+                    input_file_name,
+                    key_field_names,
+                    df_vendor_gt,
+                    ocr_data,
+                    pass_number,
+                    ocr_index)
+                key_lengths.append(key_length)
+                if save_json_if_changed(label_file, label_file_path):
+                    labels_written += 1
+            labelled += 1
+
+        documents_state[input_file_name] = {'inputs': inputs_hash, 'key_lengths': key_lengths}
+        for pass_number, key_length in enumerate(key_lengths, 1):
+            output_files[pass_number].append([input_file_name, key_length])
+
+    fields_file = create_fields_json_file(key_field_names)
+    for pass_number, pass_path in enumerate(paths, 1):
+        save_json_if_changed(fields_file, f"{pass_path}/fields.json")
         # Add to the top level dict data structure
-        pass_level[pass_number].append(output_files)
+        pass_level[pass_number] = [output_files[pass_number]]
+
+    save_json({'blobs': blobs_state, 'documents': documents_state}, state_file_path)
+    print(f"Labelled {labelled} documents, {file_ground_truth - labelled} unchanged since the last run, "
+          f"{labels_written} label files written")
 
     return pass_level, num_files, file_ground_truth
 
@@ -594,10 +712,11 @@ def upload_blobs_to_container(block_blob_service, input_folder_path, container_n
     :param input_folder_path: The folder we are working with
     :param container_name: The blob storage container name
     :param ext: File extension 'pdf'
-    :return: Nothing
+    :return: A dictionary blob name -> etag of the uploaded documents and OCR files
     """
 
     print(f"Upload_blobs_to_container {input_folder_path}")
+    uploaded_etags = {}
     document_files = [f for f in os.listdir(input_folder_path) if f.endswith(ext)]
 
     for i, doc_file_name in enumerate(document_files):
@@ -610,11 +729,11 @@ def upload_blobs_to_container(block_blob_service, input_folder_path, container_n
         label_file_path = input_folder_path + os.path.sep + label_file_name
 
         try:
-            block_blob_service.create_blob_from_path(
-                container_name, doc_file_name, doc_file_path)
+            uploaded_etags[doc_file_name] = block_blob_service.create_blob_from_path(
+                container_name, doc_file_name, doc_file_path).etag
 
-            block_blob_service.create_blob_from_path(
-                container_name, ocr_file_name, ocr_file_path)
+            uploaded_etags[ocr_file_name] = block_blob_service.create_blob_from_path(
+                container_name, ocr_file_name, ocr_file_path).etag
 
             if i > int(Config.LIMIT_TRAINING_SET):
                 continue
@@ -626,6 +745,8 @@ def upload_blobs_to_container(block_blob_service, input_folder_path, container_n
             print(f"Unable to upload blob {doc_file_name} {e}")
             continue
 
+    return uploaded_etags
+
 
 def create_container(block_blob_service, account_name, container_name):
     """
@@ -744,7 +865,7 @@ class Config:
     LANGUAGE_CODE = os.environ.get("LANGUAGE_CODE")  # The language we invoke Read OCR in only en supported now
     GROUND_TRUTH_PATH = os.environ.get("GROUND_TRUTH_PATH")  # This is the path to our Ground Truth
     LOCAL_WORKING_DIR = os.environ.get(
-        "LOCAL_WORKING_DIR")  # The local temporary directory to which we write and remove
+        "LOCAL_WORKING_DIR")  # The local working directory, kept between runs to only process changed documents
     CONTAINER_SUFFIX = os.environ.get(
         "CONTAINER_SUFFIX")  # The suffix name of the containers that store the training datasets
     LIMIT_TRAINING_SET = os.environ.get("LIMIT_TRAINING_SET")  # For testing models by file qty trained on
@@ -754,6 +875,8 @@ class Config:
     REGION = os.environ.get("REGION")  # The region Form Recognizer and OCR are deployed
     MINIMUM_LABELLED_DATA = os.environ.get("MINIMUM_LABELLED_DATA")  # The minimum number of well labelled samples to
     #  train on
+    MAX_CONCURRENT_TRAININGS = int(os.environ.get("MAX_CONCURRENT_TRAININGS", 4))  # The models trained at the same
+    # time, within the quota of the Form Recognizer resource
 
 
 def main():
@@ -778,6 +901,8 @@ def main():
     lst_accuracy = []
     lst_num_files = []
     lst_num_ground_truth = []
+    training_jobs = []
+    containers_files = {}
 
     # get the ground truth file for the key value extraction from Azure Data Lake
     ground_truth_df = get_ground_truth_from_adls(
@@ -836,18 +961,31 @@ def main():
             file.write(json.dumps(pass_level))
 
         # Upload the best training set to the container
-        upload_blobs_to_container(block_blob_service, selected_training_set, container.name, Config.DOC_EXT)
+        uploaded_etags = upload_blobs_to_container(
+            block_blob_service, selected_training_set, container.name, Config.DOC_EXT)
         print(f"Uploaded files to blob {container.name} training set {selected_training_set}")
-
-        # Let's clean up - Linux
-        shutil.rmtree(vendor_folder_path_pass1)
-        shutil.rmtree(vendor_folder_path_pass2)
-
-        # Train the model on the optimised dataset
-        sasurl = sas_prefix + container.name + sas
-        train_response = form_recognizerv2_train(Config.REGION,
-                                                 Config.SUBSCRIPTION_KEY,
-                                                 sasurl)
+        # The uploaded blobs have new etags but the content kept locally, they are not downloaded again
+        record_uploaded_blobs(get_documents_folder_path(vendor_folder_path_pass1), uploaded_etags)
+
+        # The working folders are kept, the next run only processes the documents that changed
+
+        # The models of all the containers are trained at the same time, after their training sets are uploaded
+        training_jobs.append((container.name, sas_prefix + container.name + sas, '', True))
+        containers_files[container.name] = (num_files, num_ground_truth)
+
+    # The progress is saved in the checkpoint file, a run started again after a crash resumes the trainings
+    checkpoint_path = f"{rf}/{Config.CONTAINER_SUFFIX}_training_checkpoint.json"
+    scheduler = TrainingScheduler(fr_client.get_client(Config.REGION, Config.SUBSCRIPTION_KEY),
+                                  Config.MAX_CONCURRENT_TRAININGS, checkpoint_path)
+    train_responses = fr_client.run_sync(scheduler.train(training_jobs))
+    print(f"Training stats {scheduler.get_stats()}")
+    if all(train_response != None and train_response['modelInfo']['status'] == 'ready'
+           for train_response in train_responses.values()) and os.path.isfile(checkpoint_path):
+        # Every model is trained, the next run trains the updated training sets again
+        os.remove(checkpoint_path)
+
+    for container_name, train_response in train_responses.items():
+        num_files, num_ground_truth = containers_files[container_name]
         print(f"Trained {train_response}")
 
         modelId = 'None'
@@ -861,7 +999,7 @@ def main():
             accuracy = train_response['trainResult']['averageModelAccuracy']
 
             print(train_response['trainResult']['modelId'])
-            lst_vendorId.append(container.name[:9])
+            lst_vendorId.append(container_name[:9])
             lst_modelId.append(train_response['trainResult']['modelId'])
             lst_fieldslen.append(fieldlen)
             lst_accuracy.append(accuracy)
@@ -870,19 +1008,19 @@ def main():
 
         except Exception as e:
             print(f"Training error {e}")
-            lst_vendorId.append(container.name[:9])
+            lst_vendorId.append(container_name[:9])
             lst_modelId.append(modelId)
             lst_fieldslen.append(fieldlen)
             lst_accuracy.append(accuracy)
             lst_num_files.append(num_files)
             lst_num_ground_truth.append(num_ground_truth)
 
-        with open("./" + container.name[:9] +
+        with open("./" + container_name[:9] +
                   Config.CONTAINER_SUFFIX + ".txt", "a+") as autolabel:
-            autolabel.write("\n" + container.name[:9] + "," + modelId + "," +
+            autolabel.write("\n" + container_name[:9] + "," + modelId + "," +
                             str(fieldlen) + "," + str(accuracy) + "," +
                             str(num_files) + "," + str(num_ground_truth))
-        print(f"Updated ./ {container.name[:9] + Config.CONTAINER_SUFFIX} .csv")
+        print(f"Updated ./ {container_name[:9] + Config.CONTAINER_SUFFIX} .csv")
 
     data = {'vendorId': lst_vendorId, 'modelId': lst_modelId,
             'fieldNumber': lst_fieldslen, 'accuracy': lst_accuracy,
@@ -892,6 +1030,10 @@ def main():
     df_lookup.to_csv(autolabel_pdf, sep=',')
     print(f"Wrote lookup file {autolabel_pdf}")
 
+    # The run is complete, the next one trains all the models again
+    if os.path.isfile(checkpoint_path):
+        os.remove(checkpoint_path)
+
 
 if __name__ == "__main__":
     main()
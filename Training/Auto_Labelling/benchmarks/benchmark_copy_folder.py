@@ -0,0 +1,77 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""
+Compares copy_folder (server-side copies, and streaming to another container client) with
+downloading and re-uploading every blob one after the other.
+Runs against Azurite: start it with `azurite-blob` or pass a connection string with --connection-string.
+
+Run from the Auto_Labelling folder: python -m benchmarks.benchmark_copy_folder
+"""
+
+import argparse
+import logging
+import os
+import time
+import uuid
+
+from azure.storage.blob import BlobServiceClient
+
+from shared_code import storage_helpers
+
+AZURITE_CONNECTION_STRING = ("DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;"
+    "AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;"
+    "BlobEndpoint=http://127.0.0.1:10000/devstoreaccount1;")
+
+
+def sequential_copy(container_client, src_folder, dest_folder):
+    for blob in storage_helpers.list_blobs(container_client, src_folder, True, True):
+        data = container_client.download_blob(blob).readall()
+        container_client.upload_blob(name=blob.replace(src_folder, dest_folder, 1), data=data, overwrite=True)
+
+
+def stream_copy(container_client, src_folder, dest_folder, max_concurrency):
+    # A second client object with another account name forces the streaming path
+    class OtherAccount(object):
+        def __init__(self, client):
+            self._client = client
+            self.account_name = "other-" + client.account_name
+        def __getattr__(self, name):
+            return getattr(self._client, name)
+    storage_helpers.copy_folder(container_client, src_folder, dest_folder, dest_container_client=OtherAccount(container_client),
+        max_concurrency=max_concurrency)
+
+
+def run(connection_string, blobs, size, max_concurrency):
+    logging.getLogger().setLevel(logging.WARNING)
+    service = BlobServiceClient.from_connection_string(connection_string)
+    container_client = service.create_container(f"benchmark-copy-{uuid.uuid4().hex[:8]}")
+    try:
+        for i in range(blobs):
+            container_client.upload_blob(f"doctype/train/doc{i}.pdf", os.urandom(size))
+
+        methods = [
+            ("download/upload loop", lambda dest: sequential_copy(container_client, "doctype/train", dest)),
+            ("streaming copy", lambda dest: stream_copy(container_client, "doctype/train", dest, max_concurrency)),
+            ("server-side copy", lambda dest: storage_helpers.copy_folder(container_client, "doctype/train", dest,
+                max_concurrency=max_concurrency)),
+        ]
+        for i, (name, method) in enumerate(methods):
+            start = time.perf_counter()
+            method(f"doctype/copy{i}")
+            elapsed = time.perf_counter() - start
+            print(f"{name}: {elapsed:.2f}s for {blobs} blobs of {size // 1024}KB")
+    finally:
+        container_client.delete_container()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connection-string", default=os.environ.get('AZURITE_CONNECTION_STRING', AZURITE_CONNECTION_STRING))
+    parser.add_argument("--blobs", type=int, default=200)
+    parser.add_argument("--size", type=int, default=256 * 1024)
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    args = parser.parse_args()
+    run(args.connection_string, args.blobs, args.size, args.max_concurrency)
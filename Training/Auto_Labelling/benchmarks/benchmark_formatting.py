@@ -0,0 +1,109 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""
+Compares the Normalizer (patterns compiled once, memoised normalisations) with the former per-call formatting.
+Synthetic workload: ground truth columns and OCR lines of invoices where the same dates, amounts, postal codes
+and vendors come back from one document to the other. The results of both are checked to be the same.
+
+Run from the Auto_Labelling folder: python -m benchmarks.benchmark_formatting
+"""
+
+import argparse
+import random
+import re
+import time
+
+from shared_code import formatting
+
+
+def legacy_find_subtext(text, field_type):
+    # Former find_subtext, building and compiling the date patterns on every call
+    months_en = ['jan', 'feb', 'febr', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec',
+                'january', 'february', 'march', 'april', 'june', 'july', 'august', 'september', 'october', 'november', 'december']
+    months_fr = ['jan', 'fev', 'mar', 'avr', 'mai', 'juin', 'juil', 'aout', 'sep', 'sept', 'oct', 'nov', 'dec',
+                'janvier', 'fevrier', 'février', 'mars', 'avril', 'juillet', 'août', 'septembre', 'octobre', 'novembre', 'decembre', 'décembre']
+    date_regex = [re.compile(r'\d{1,2}\/\d{1,2}\/\d{2,4}'),
+                  re.compile(r'\d{1,2}\/\d{1,2}'),
+                  re.compile(r'(?:%s)\s+\d{1,2}\s*\d{2,4}' % '|'.join(months_en)),
+                  re.compile(r'\d{1,2}\s+(?:%s)\s*\d{2,4}' % '|'.join(months_fr)),
+                  re.compile(r'%s\s+\d{1,2}' % '|'.join(months_en)),
+                  re.compile(r'\d{1,2}\s+(?:%s)' % '|'.join(months_fr))]
+    if field_type == 'date':
+        text = text.replace('.', '')
+        for regex in date_regex:
+            reg_date = regex.findall(text)
+            if len(reg_date) > 0:
+                return reg_date[0]
+    return text
+
+
+def legacy_remove_trailing_spaces(text):
+    try:
+        if text != '':
+            while(text[-1] == ' '):
+                text = text[:-1]
+            while(text[0] == ' '):
+                text = text[1:]
+            while(text.count('  ') > 0):
+                text = text.replace('  ', ' ')
+    except Exception:
+        pass
+    return text
+
+
+def build_workload(rng, documents):
+    dates = [f"{rng.randint(1, 12)}/{rng.randint(1, 28)}/20{rng.randint(18, 21)}" for _ in range(300)]
+    amounts = [f"${rng.randint(1, 99)},{rng.randint(100, 999)}.{rng.randint(10, 99)}" for _ in range(2000)]
+    postal_codes = [f"{rng.randint(10000, 99999)}-{rng.randint(1000, 9999)}" for _ in range(200)]
+    vendors = [f"Vendor {i}, Inc." for i in range(100)]
+    columns = {
+        'date': [rng.choice(dates) for _ in range(documents)],
+        'money': [rng.choice(amounts) for _ in range(documents)],
+        'postalCode': [rng.choice(postal_codes) for _ in range(documents)],
+        'text': [rng.choice(vendors) for _ in range(documents)],
+    }
+    lines = [f"  Invoice   date:  {rng.choice(dates)}   due  {rng.choice(dates)}  " for _ in range(documents)]
+    return columns, lines
+
+
+def legacy_run(columns, lines):
+    results = {method: [formatting.normalize_value(v, method) for v in values] for method, values in columns.items()}
+    subtexts = [legacy_remove_trailing_spaces(legacy_find_subtext(line, 'date')) for line in lines]
+    return results, subtexts
+
+
+def normalizer_run(normalizer, columns, lines):
+    results = {method: normalizer.normalize_many(values, method) for method, values in columns.items()}
+    subtexts = [formatting.remove_trailing_spaces(normalizer.find_subtext(line, 'date')) for line in lines]
+    return results, subtexts
+
+
+def run(documents, seed):
+    columns, lines = build_workload(random.Random(seed), documents)
+    values = sum(len(v) for v in columns.values())
+    print(f"{documents} documents, {values} ground truth values and {len(lines)} OCR lines")
+
+    start = time.perf_counter()
+    legacy = legacy_run(columns, lines)
+    legacy_time = time.perf_counter() - start
+    print(f"per-call formatting: {legacy_time:.2f}s")
+
+    normalizer = formatting.Normalizer()
+    start = time.perf_counter()
+    result = normalizer_run(normalizer, columns, lines)
+    elapsed = time.perf_counter() - start
+    print(f"normalizer: {elapsed:.2f}s (x{legacy_time / elapsed:.1f}), {normalizer.cache_info()}")
+
+    assert result == legacy, "The normalizer results differ from the per-call formatting"
+    print("Same results")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(args.documents, args.seed)
@@ -0,0 +1,67 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""
+Compares column mapping through the lookup registry with parsing the lookup file on every call.
+Synthetic workload: 10k documents x 20 fields (one map_columns and one lookup_compare per column).
+
+Run from the Auto_Labelling folder: python -m benchmarks.benchmark_lookup_registry
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+
+from shared_code import autolabeling
+from shared_code import utils
+
+
+def build_lookup_file(n_fields):
+    lookup = {"types": {}, "keys": {}}
+    for i in range(n_fields):
+        lookup["keys"][f"Field {i}"] = [f"Column{i}"]
+        lookup["types"][f"Column{i}"] = "text"
+    f = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    json.dump(lookup, f)
+    f.close()
+    return f.name
+
+
+def map_document_reparse(lookup_path, fields):
+    for field in fields:
+        for col in utils.get_lookup_fields(lookup_path)['keys'][field]:
+            utils.get_lookup_fields(lookup_path)['types'][col]
+
+
+def map_document_registry(lookup_path, fields):
+    for field in fields:
+        for col in autolabeling.map_columns(field, lookup_path):
+            autolabeling.lookup_compare(col, lookup_path)
+
+
+def run(documents, n_fields):
+    logging.getLogger().setLevel(logging.WARNING)
+    lookup_path = build_lookup_file(n_fields)
+    fields = [f"Field {i}" for i in range(n_fields)]
+    try:
+        for name, method in [("re-parse per call", map_document_reparse), ("registry", map_document_registry)]:
+            start = time.perf_counter()
+            for _ in range(documents):
+                method(lookup_path, fields)
+            elapsed = time.perf_counter() - start
+            print(f"{name}: {elapsed:.2f}s total, {1e6 * elapsed / documents:.1f}us per document")
+    finally:
+        os.remove(lookup_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=10000)
+    parser.add_argument("--fields", type=int, default=20)
+    args = parser.parse_args()
+    run(args.documents, args.fields)
@@ -3,16 +3,30 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
-from services import ProcessDoc, QueueProcessor
+import click
+from services import ProcessDoc, QueueProcessor, QueueWorkerPool
 
 from dotenv import load_dotenv
 load_dotenv()
 
+@click.command()
+@click.option('-w','--workers', default=1,
+              help='Number of documents processed at once, messages are received in batches when greater than 1')
+@click.option('-v','--visibility-timeout', default=300,
+              help='Seconds a message stays hidden from other consumers, extended while the document is processed')
 
-def main():
+def main(workers, visibility_timeout):
     process_doc = ProcessDoc()
     queue_processor = QueueProcessor()
-    
+
+    if workers > 1:
+        pool = QueueWorkerPool(queue_processor.get_queue_client(), process_doc.run, workers, visibility_timeout)
+        # On SIGTERM, no new message is received and the documents in progress are finished
+        pool.install_signal_handlers()
+        counters = pool.run()
+        print(f"processed {counters['processed']} documents, {counters['failed']} failed")
+        return
+
     msg = ""
     while msg != None:
         msg = queue_processor.get_queue_message_str()
@@ -14,12 +14,14 @@ load_dotenv()
               help='The document type you would like to trigger processing for.')
 @click.option('-s','--status', prompt='Status',
               help='Set status to new, ocr-done, keep or done')
+@click.option('-p','--snapshot', default=None,
+              help='Local file keeping the listing of the last run, only new or modified files will be processed')
 
-def main(doctype, status):
+def main(doctype, status, snapshot):
     try:
       trigger_processor = TriggerProcessor()
       queue_processor = QueueProcessor()
-      trigger_processor.run(doctype, status, queue_processor, True)
+      trigger_processor.run(doctype, status, queue_processor, True, snapshot)
       print(f"Processing for doctype {doctype} started.")
     except NameError as ne:
       print(ne)
@@ -5,4 +5,5 @@ from .trigger_processor import TriggerProcessor
 from .process_doc import ProcessDoc
 from .train_model import TrainModel
 from .model_evaluation import ModelEvaluation
-from .predict_doc import PredictDoc
\ No newline at end of file
+from .predict_doc import PredictDoc
+from .queue_worker_pool import QueueWorkerPool
\ No newline at end of file
@@ -20,11 +20,15 @@ class PredictDoc(BaseProcessor):
     def __init__(self):
         super(PredictDoc, self).__init__()
 
-    def get_predict(self, doctype, sas_url, predict_type):
+    def get_model_id(self, doctype, predict_type):
 
         # Getting model ID from doc type
         partition_key = self.app_settings.environment + '_' + predict_type
-        model_id = storage_helpers.query_entity_model(self.table_service, self.app_settings.models_table, partition_key, doctype)
+        return storage_helpers.query_entity_model(self.table_service, self.app_settings.models_table, partition_key, doctype)
+
+    def get_predict(self, doctype, sas_url, predict_type):
+
+        model_id = self.get_model_id(doctype, predict_type)
 
         # Getting prediction result
         prediction = fr_helpers.get_prediction(self.app_settings.fr_region, self.app_settings.fr_key, sas_url, model_id, predict_type)
@@ -34,8 +38,10 @@ class PredictDoc(BaseProcessor):
     
     def run(self, doctype, sas_url):
 
-        prediction_supervised = self.get_predict(doctype, sas_url, "supervised")
-        prediction_unsupervised = self.get_predict(doctype, sas_url, "unsupervised")
+        # Both models are called at once
+        models = [(self.get_model_id(doctype, predict_type), predict_type) for predict_type in ["supervised", "unsupervised"]]
+        prediction_supervised, prediction_unsupervised = fr_helpers.get_predictions(
+            self.app_settings.fr_region, self.app_settings.fr_key, sas_url, models)
        
         response = {}
         if len(prediction_supervised) > 0 and len(prediction_unsupervised) > 0:
@@ -0,0 +1,131 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import logging
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    from shared_code import storage_helpers
+except ModuleNotFoundError:
+    from ..shared_code import storage_helpers
+
+class QueueWorkerPool(object):
+
+    """
+    Runs a handler on queue messages with a pool of worker threads.
+    Messages are received in batches when workers are free, hidden from the other consumers while they are
+    processed (their visibility is extended for long jobs) and deleted once the handler succeeded.
+    A message whose handler failed is made visible again, after max_dequeue_count attempts it is deleted.
+    stop() (called on SIGTERM/SIGINT when the signal handlers are installed) stops receiving messages
+    and lets the documents in progress finish.
+    """
+
+    def __init__(self, queue_client, handler, workers = 8, visibility_timeout = 300, renew_interval = None,
+                 max_dequeue_count = 5, poll_interval = 5, stop_when_empty = True):
+        self.queue_client = queue_client
+        self.handler = handler
+        self.workers = workers
+        self.visibility_timeout = visibility_timeout
+        self.renew_interval = renew_interval if renew_interval != None else visibility_timeout / 2
+        self.max_dequeue_count = max_dequeue_count
+        self.poll_interval = poll_interval
+        self.stop_when_empty = stop_when_empty
+        self.counters = {'received': 0, 'processed': 0, 'failed': 0, 'discarded': 0, 'extended': 0}
+        # Messages in progress with their lock: the updates and the deletion of a message are made one at a time,
+        # as each of them needs the pop receipt returned by the previous one. The pool lock only guards the
+        # shared state, the queue is called outside of it
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._finished = threading.Event()
+
+    def install_signal_handlers(self):
+        for sig in [signal.SIGTERM, signal.SIGINT]:
+            signal.signal(sig, self._on_signal)
+
+    def _on_signal(self, signum, frame):
+        logging.info(f"Received signal {signum}, finishing the documents in progress...")
+        self.stop()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        renewer = threading.Thread(target=self._renew_visibility, name="queue-visibility-renewer", daemon=True)
+        renewer.start()
+        futures = set()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while not self._stopping.is_set():
+                futures = {f for f in futures if not f.done()}
+                if len(futures) >= self.workers:
+                    wait(futures, return_when=FIRST_COMPLETED)
+                    continue
+
+                messages = storage_helpers.receive_queue_messages(self.queue_client, min(self.workers - len(futures), 32), self.visibility_timeout)
+                if len(messages) == 0:
+                    if self.stop_when_empty and len(futures) == 0:
+                        break
+                    if len(futures) > 0:
+                        wait(futures, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                    else:
+                        self._stopping.wait(self.poll_interval)
+                    continue
+
+                for message in messages:
+                    self.counters['received'] += 1
+                    if message.dequeue_count != None and message.dequeue_count > self.max_dequeue_count:
+                        logging.error(f"Discarding message {message.content} after {str(message.dequeue_count - 1)} failed attempts.")
+                        storage_helpers.delete_queue_message(self.queue_client, message)
+                        self.counters['discarded'] += 1
+                        continue
+                    with self._lock:
+                        self._in_flight[message.id] = (message, threading.Lock())
+                    futures.add(executor.submit(self._process, message))
+
+            # Draining: the documents in progress are finished before leaving
+            wait(futures)
+        self._finished.set()
+        renewer.join()
+        logging.info(f"Queue worker pool stopped: {self.counters}")
+        return self.counters
+
+    def _process(self, message):
+        try:
+            self.handler(message.content)
+            success = True
+        except Exception as e:
+            logging.error(f"Error processing message {message.content}: {e}")
+            success = False
+
+        with self._lock:
+            message_lock = self._in_flight[message.id][1]
+        with message_lock:
+            with self._lock:
+                del self._in_flight[message.id]
+            if success:
+                storage_helpers.delete_queue_message(self.queue_client, message)
+            else:
+                # Retrying without waiting for the visibility timeout
+                storage_helpers.update_queue_message_visibility(self.queue_client, message, 0)
+        with self._lock:
+            self.counters['processed' if success else 'failed'] += 1
+
+    def _renew_visibility(self):
+        # Keeps running while the pool drains after stop()
+        while not self._finished.wait(self.renew_interval):
+            with self._lock:
+                in_flight = list(self._in_flight.values())
+            for message, message_lock in in_flight:
+                with message_lock:
+                    with self._lock:
+                        if message.id not in self._in_flight:
+                            # Finished since the snapshot
+                            continue
+                    extended = storage_helpers.update_queue_message_visibility(self.queue_client, message, self.visibility_timeout)
+                if extended:
+                    with self._lock:
+                        self.counters['extended'] += 1
@@ -17,7 +17,7 @@ class TriggerProcessor(BaseProcessor):
     def list_doctype_folders(self):
         return storage_helpers.list_doctype_folders(self.container_client)
 
-    def run(self,doctype, status, msg, skip_folder_validation = False):
+    def run(self,doctype, status, msg, skip_folder_validation = False, snapshot_path = None):
         if(skip_folder_validation == False):
             folders = self.list_doctype_folders()
             if not doctype in folders:
@@ -25,42 +25,74 @@ class TriggerProcessor(BaseProcessor):
 
         logging.info(f"Found {doctype} folder in storage.")
     
-        blobs = self.get_blobs_by(doctype,self.container_client)
-        if any(blobs):
-            self.process_blobs(blobs, status, self.table_service, msg)
+        blobs, snapshot = self.get_blobs_by(doctype,self.container_client, snapshot_path)
+        if blobs != None and any(blobs):
+            processed = self.process_blobs(blobs, status, self.table_service, msg)
+            # The snapshot is only saved once the files are queued, otherwise they are listed again on the next scan
+            if snapshot != None and processed:
+                storage_helpers.save_listing_snapshot(snapshot_path, snapshot)
+        elif snapshot_path != None and blobs != None:
+            logging.info(f"No new or modified training files for {doctype} since the last scan.")
+            storage_helpers.save_listing_snapshot(snapshot_path, snapshot)
         else:        
             raise NameError(f"Didn't find any training files in storage for {doctype}")
         
+    # Returns True when the status of every file was updated and the files were put in the queue
     def process_blobs(self, blobs, status, table_service, queue):
         logging.info(f"Adding files to processing queue...")
-        messages = []
+        messages = list(blobs)
+        # Add files status in the status table
+        stats = self.sync_status(blobs, status, table_service)
+        if queue:
+          try:
+              queue.set(messages)
+              logging.info(f"Put {str(len(messages))} messages in processing queue.")
+          except Exception as e:
+              logging.error(f"Error putting messages in processing queue: {e}")
+              return False
+        return stats['failed'] == 0
+
+    # Status-sync stage: the current statuses are read with one query per document type and the new ones
+    # are written with entity group transactions, instead of a read and a write per document
+    def sync_status(self, blobs, status, table_service):
+        entities = []
+        current_status = {}
+        round_trips = 0
         for blob in blobs:
-            # Add message to queue
-            messages.append(blob)
-            # Add file status in the status table
             doctype = blob.split('/')[0]
             file_name = blob.split('/')[-1]
             # If the status value is "keep", we keep the current status
             if(status == 'keep'):
-                file_status = storage_helpers.query_entity_status(table_service, self.app_settings.status_table, doctype, file_name)
+                if doctype not in current_status:
+                    statuses, requests = storage_helpers.query_partition_status(table_service, self.app_settings.status_table, doctype)
+                    current_status[doctype] = statuses if statuses != None else {}
+                    round_trips += requests
+                file_status = current_status[doctype].get(file_name)
                 if file_status == None:
                     file_status = 'new'
             else:
                 file_status = status
-            entity = {'PartitionKey': doctype, 'RowKey': file_name, 'status': file_status}
-            if storage_helpers.insert_or_replace_entity(table_service, self.app_settings.status_table, entity):
-                logging.info(f"Updated {blob} status in status table.")
-            else:
-                logging.error(f"Could not update {blob} status in status table.")
-        if queue:
-          try:
-              queue.set(messages)
-              logging.info(f"Put {str(len(messages))} messages in processing queue.")
-          except Exception as e:
-              logging.error(f"Error putting messages in processing queue: {e}")        
+            entities.append({'PartitionKey': doctype, 'RowKey': file_name, 'status': file_status})
+
+        failed, requests = storage_helpers.insert_or_replace_entities(table_service, self.app_settings.status_table, entities)
+        round_trips += requests
+        for entity in failed:
+            logging.error(f"Could not update {entity['PartitionKey']}/{entity['RowKey']} status in status table.")
+
+        # One read (with "keep") and one write per document before batching
+        sequential_round_trips = len(entities) * (2 if status == 'keep' else 1)
+        stats = {'documents': len(entities), 'failed': len(failed), 'round_trips': round_trips,
+            'round_trips_saved': sequential_round_trips - round_trips}
+        logging.info(f"Updated status of {str(len(entities) - len(failed))} files in status table with {str(round_trips)} requests ({str(stats['round_trips_saved'])} round-trips saved).")
+        return stats
 
-    def get_blobs_by(self,doctype, container_client):
+    # Returns the blobs and the updated listing snapshot, None without a snapshot path
+    def get_blobs_by(self,doctype, container_client, snapshot_path = None):
         training_path = doctype + '/train'
+        # With a snapshot, only the blobs added or modified since the last scan are returned
+        if snapshot_path != None:
+            blobs, _, snapshot = storage_helpers.list_changed_blobs(container_client, training_path, snapshot_path)
+            return blobs, snapshot
         blobs = storage_helpers.list_blobs(container_client, training_path) 
-        return blobs
+        return blobs, None
 
@@ -8,6 +8,8 @@ import logging
 import numpy as np
 
 from . import formatting
+from . import gt_store
+from . import lookup_registry
 from . import utils
 
 
@@ -213,10 +215,10 @@ def find_anchor_keys_in_invoice(df_gt, filename, data, key_field_names, lookup_p
 
 
 def map_columns(key_name, lookup_path="./lookup_fields.json"):
-    lookup_fields = utils.get_lookup_fields(lookup_path)
+    lookup_fields = lookup_registry.get_lookup(lookup_path)
     columns = []
     try:
-        columns = lookup_fields['keys'][key_name]
+        columns = lookup_fields.map_columns(key_name)
         logging.info(f"Columns for field {key_name} are {str(columns)}.")
     except Exception as e:
         logging.error(f"Error looking up columns for field {key_name}: {e}")
@@ -224,10 +226,10 @@ def map_columns(key_name, lookup_path="./lookup_fields.json"):
 
 
 def lookup_compare(column_name, lookup_path="./lookup_fields.json"):
-    lookup_fields = utils.get_lookup_fields(lookup_path)
+    lookup_fields = lookup_registry.get_lookup(lookup_path)
     compare_method = ""
     try:
-        compare_method = lookup_fields["types"][column_name]
+        compare_method = lookup_fields.lookup_compare(column_name)
         logging.info(f"Compare method for field {column_name} is {compare_method}.")
     except Exception as e:
         logging.error(f"Error looking up compare method for field {column_name}: {e}")
@@ -373,7 +375,9 @@ def analyze_labels(gt_path, file_path, analyze_result, key_field_names, lookup_p
     gt_df = None
     try:
         if (type(gt_path).__name__ == "str"):
-            gt_df = utils.load_excel(gt_path)
+            # Only the rows of the current document are read from the ground truth store
+            file_id = file_path.split('/')[-1][:-4]
+            gt_df = gt_store.get_store(gt_path).get_rows(file_id)
         else:
             gt_df = gt_path
 
@@ -381,7 +385,8 @@ def analyze_labels(gt_path, file_path, analyze_result, key_field_names, lookup_p
     except Exception as e:
         logging.error(f"Could not load ground truth: {e}")
 
-    if len(gt_df) > 0:
+    # A document missing from the ground truth still gets a label file, without labels
+    if gt_df is not None and len(gt_df.columns) > 0:
 
         try:
             file_name = file_path.split('/')[-1]
@@ -3,6 +3,7 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
+import functools
 import logging
 import re
 from decimal import Decimal
@@ -10,7 +11,166 @@ import moment
 import string
 import datetime
 
+PUNCTUATION_TABLE = str.maketrans(string.punctuation, ' ' * len(string.punctuation))
+MULTIPLE_SPACES = re.compile(r' {2,}')
+WHITESPACES = re.compile(r'\s+')
+
+MONTHS_EN = ['jan', 'feb', 'febr', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec',
+            'january', 'february', 'march', 'april', 'june', 'july', 'august', 'september', 'october', 'november', 'december']
+MONTHS_FR = ['jan', 'fev', 'mar', 'avr', 'mai', 'juin', 'juil', 'aout', 'sep', 'sept', 'oct', 'nov', 'dec',
+            'janvier', 'fevrier', 'février', 'mars', 'avril', 'juillet', 'août', 'septembre', 'octobre', 'novembre', 'decembre', 'décembre']
+DATE_MONTHS = {"january", "february", "march", "april", "may", "june", "july", "september", "october", "november", "december",
+               "jan", "feb", "febr", "mar", "apr", "jun", "jul", "sep", "sept", "oct", "nov", "dec"}
+
+# Patterns of the dates searched by find_subtext, by order of preference
+DATE_PATTERNS = [r'\d{1,2}\/\d{1,2}\/\d{2,4}',
+                 r'\d{1,2}\/\d{1,2}',
+                 r'(?:%s)\s+\d{1,2}\s*\d{2,4}' % '|'.join(MONTHS_EN),
+                 r'\d{1,2}\s+(?:%s)\s*\d{2,4}' % '|'.join(MONTHS_FR),
+                 r'%s\s+\d{1,2}' % '|'.join(MONTHS_EN),
+                 r'\d{1,2}\s+(?:%s)' % '|'.join(MONTHS_FR)]
+
+MAIN_ROADTYPES = {"road", "street", "highway", "way", "avenue", "alley", "boulevard", "lane", "route", "terrace", "court", "drive", "parkway", "circle"}
+ROADTYPES_MAPPING = {
+    "rd": "road",
+    "st": "street",
+    "hwy": "highway",
+    "av":"avenue",
+    "blvd": "boulevard",
+    "bd": "boulevard",
+    "bvd": "boulevard",
+    "ln": "lane",
+    "aly": "alley",
+    "ave": "avenue",
+    "dr": "drive",
+    "pkwy": "parkway",
+    "cir": "circle"
+}
+
+DIRECTIONS_MAPPING = {
+    "n": "north",
+    "s": "south",
+    "w": "west",
+    "e": "east"
+}
+ABBREV_MAPPING = {
+    "ste": "suite"
+}
+SKIP_WORDS = {'ofc', 'apt', 'llc'}
+
+COUNTRIES_MAPPING = {
+    "fr": "france",
+    "us": "united states",
+    "usa": "united states",
+    "uk": "united kingdom",
+    "gb": "great britain"
+}
+
+
+class Normalizer(object):
+
+    """
+    Normalisation of the values compared during autolabelling and evaluation.
+    The patterns are compiled once when the normaliser is built, and as the same values (dates, amounts,
+    postal codes...) come back in every document, normalised values are memoised: the cache_size most
+    recently used (value, method) pairs are kept. Dates are memoised for the current day, as the dates without
+    a year are completed with the current year and date_format falls back to the date of the day.
+    """
+
+    def __init__(self, cache_size=65536):
+        self.date_regex = [re.compile(pattern) for pattern in DATE_PATTERNS]
+        self._normalize = functools.lru_cache(maxsize=cache_size, typed=True)(normalize_value_on)
+
+    def normalize(self, value, method):
+        try:
+            hash(value)
+        except TypeError:
+            return normalize_value(value, method)
+        return self._normalize(value, method, datetime.date.today() if method == 'date' else None)
+
+    def normalize_many(self, values, method):
+        """Normalises a column of values (list, Series...) with the same method, repeated values are normalised once"""
+        return [self.normalize(value, method) for value in values]
+
+    def cache_info(self):
+        return self._normalize.cache_info()
+
+    def clear_cache(self):
+        self._normalize.cache_clear()
+
+    def format_subfields(self, text, types):
+        if len(types) == 1:
+            return self.normalize(text,types[0])
+        sub_text = text.split(" ")
+        formatted_text = ""
+        word_list = sub_text.copy()
+        try:
+            # If there is one word per sub field, we apply the corresponding formatting to each word
+            if len(sub_text) == len(types):
+                for i in range(len(sub_text)):
+                    word_list[i] = self.normalize(sub_text[i], types[i])
+            # If there are more words than there is subfields, we don't know the type of each word
+            else:
+                word_list[0] = self.normalize(sub_text[0], types[0])
+                word_list[-1] = self.normalize(sub_text[-1], types[-1])
+                for i in range(1,len(sub_text)-1):
+                    text_type = guess_type(sub_text[i])
+                    word_list[i] = self.normalize(sub_text[i], text_type)
+            formatted_text = " ".join(w for w in word_list)
+        except Exception as e:
+            print(f"Error formatting sub fields: {e}")
+        return formatted_text
+
+    def find_subtext(self, text, field_type):
+        try:
+
+            if field_type != "":
+                text_parts = text.split(' ')
+
+                # Finding sub text of type state
+                if field_type == 'state':
+                    for part in text_parts:
+                        if is_state(part):
+                            return part
+
+                # Finding sub text of type postal code
+                elif field_type == 'postalCode':
+                    for part in text_parts:
+                        if is_postalcode(part):
+                            return part
+
+                # Finding sub text of type city
+                elif field_type == 'city':
+                    city = ""
+                    for part in text_parts:
+                        if not(is_state(part)) and not(is_postalcode(part)):
+                            city = city + part + " "
+                    # Removing whitespace at the end
+                    if(city[-1] == " "):
+                        city = city[:-1]
+                    return city
+
+                # Finding sub text of type date
+                elif field_type == 'date':
+                    text = text.replace('.','')
+                    for regex in self.date_regex:
+                        reg_date = regex.findall(text)
+                        if len(reg_date) > 0:
+                            return reg_date[0]
+
+        except Exception:
+            pass
+
+        return text
+
+
 def normalize(value, method):
+    return default_normalizer.normalize(value, method)
+
+def normalize_many(values, method):
+    return default_normalizer.normalize_many(values, method)
+
+def normalize_value(value, method):
     if method == 'date':
         value = date_format(value)
     elif method == 'money':
@@ -27,40 +187,17 @@ def normalize(value, method):
         value = text_format(value)
     return value
 
+def normalize_value_on(value, method, day):
+    # The day is only part of the key of the memoised dates
+    return normalize_value(value, method)
+
 def format_subfields(text, types):
-    if len(types) == 1:
-        return normalize(text,types[0])
-    sub_text = text.split(" ")
-    formatted_text = ""
-    word_list = sub_text.copy()
-    try:
-        # If there is one word per sub field, we apply the corresponding formatting to each word
-        if len(sub_text) == len(types):
-            for i in range(len(sub_text)):
-                word_list[i] = normalize(sub_text[i], types[i])
-        # If there are more words than there is subfields, we don't know the type of each word
-        else:
-            word_list[0] = normalize(sub_text[0], types[0])
-            word_list[-1] = normalize(sub_text[-1], types[-1])
-            for i in range(1,len(sub_text)-1):
-                text_type = guess_type(sub_text[i])
-                word_list[i] = normalize(sub_text[i], text_type)
-        formatted_text = " ".join(w for w in word_list)
-    except Exception as e:
-        print(f"Error formatting sub fields: {e}")
-    return formatted_text
+    return default_normalizer.format_subfields(text, types)
 
 def remove_trailing_spaces(text):
-    # removing spaces at the end and beginning of a string
+    # removing spaces at the end and beginning of a string, and replacing double spaces
     try:
-        if text != '':
-            while(text[-1] == ' '):
-                text = text[:-1]
-            while(text[0] == ' '):
-                text = text[1:]
-            # replacing double spaces
-            while(text.count('  ') > 0):
-                text = text.replace('  ',' ')  
+        text = MULTIPLE_SPACES.sub(' ', text.strip(' '))
     except Exception:
         pass
     return text
@@ -127,18 +264,17 @@ def postalcode_format(value):
 
 def state_format(value):
     # Removing all punctuation
-    value = value.translate(str.maketrans(string.punctuation,' ' * len(string.punctuation)))
+    value = value.translate(PUNCTUATION_TABLE)
     value = str(value).replace(' ', '')
     return value
 
 def text_format(value):
     try:
-        value = re.sub(r'\s+', ' ', value.encode('ascii', 'ignore')
+        value = WHITESPACES.sub(' ', value.encode('ascii', 'ignore')
                             .decode('ascii')
                             .strip()
                             .lower()
-                            .translate(str.maketrans(string.punctuation,
-                                                     ' ' * len(string.punctuation))))
+                            .translate(PUNCTUATION_TABLE))
         value = value.replace(' ','')
     except Exception:
         pass
@@ -147,7 +283,7 @@ def text_format(value):
 def address_format(value):
 
     # Removing all punctuation
-    value = value.translate(str.maketrans(string.punctuation,' ' * len(string.punctuation)))
+    value = value.translate(PUNCTUATION_TABLE)
     
     # Separating address in several parts
     address_parts = value.split(' ')
@@ -155,22 +291,6 @@ def address_format(value):
     formatted_address = ""
     road_name = ""
 
-    directions = ["n", "s", "w", "e"]
-    abbrev = ["ste"]
-
-    directions_mapping = {
-        "n": "north",
-        "s": "south",
-        "w": "west",
-        "e": "east"
-    }
-
-    abbrev_mapping = {
-        "ste": "suite"
-    }
-    
-    skip_words = ['ofc', 'apt', 'llc']
-
     for part in address_parts:
 
         # If it's the number, we keep it as is and put it in first position
@@ -180,15 +300,15 @@ def address_format(value):
         elif isroadtype(part):
             formatted_parts[2] = road_format(part)
         # If there's a direction, we replace it by the whole direction name
-        elif part.lower() in directions:
-            part = directions_mapping[part.lower()]
+        elif part.lower() in DIRECTIONS_MAPPING:
+            part = DIRECTIONS_MAPPING[part.lower()]
             road_name += part
         # If there's an abbreviation, we replace it by the whole word
-        elif part.lower() in abbrev:
-            part = abbrev_mapping[part.lower()]
+        elif part.lower() in ABBREV_MAPPING:
+            part = ABBREV_MAPPING[part.lower()]
             road_name += part
         # If there's an information that's not part of the standardized address, we skip it
-        elif part.lower() in skip_words:
+        elif part.lower() in SKIP_WORDS:
             part = ''
         # If it's the road name, we format it and put it in second position
         else:
@@ -201,55 +321,28 @@ def address_format(value):
 
 
 def isroadtype(text):
-    main_roadtypes = ["road", "street", "highway", "way", "avenue", "alley", "boulevard", "lane", "route", "terrace", "court", "drive", "parkway", "circle"]
-    abbrev_roadtypes = ["rd", "st", "hwy", "av", "blvd", "bd", "bvd", "ln", "aly", "ave", "dr", "pkwy", "cir"]
     try:
-        if(text.lower() in main_roadtypes or text.lower() in abbrev_roadtypes):
+        if(text.lower() in MAIN_ROADTYPES or text.lower() in ROADTYPES_MAPPING):
             return True
     except Exception:
         pass
     return False
 
 def road_format(text):
-    main_roadtypes = ["road", "street", "highway", "way", "avenue", "alley", "boulevard", "lane", "route", "terrace", "court", "drive", "parkway", "circle"]
-    map_abbrev = {
-        "rd": "road",
-        "st": "street", 
-        "hwy": "highway", 
-        "av":"avenue", 
-        "blvd": "boulevard", 
-        "bd": "boulevard", 
-        "bvd": "boulevard", 
-        "ln": "lane", 
-        "aly": "alley", 
-        "ave": "avenue", 
-        "dr": "drive",
-        "pkwy": "parkway",
-        "cir": "circle"
-    }
-
     text = text.lower()
-    if(text in main_roadtypes):
+    if(text in MAIN_ROADTYPES):
         return text
     else:
         try:
-            text = map_abbrev[text]
+            text = ROADTYPES_MAPPING[text]
         except Exception:
             pass
     return text
 
 def country_format(text):
-    mapping_countries = {
-        "fr": "france",
-        "us": "united states",
-        "usa": "united states",
-        "uk": "united kingdom",
-        "gb": "great britain"
-    }
-
     text = text.lower()
     try: 
-        text = mapping_countries[text]
+        text = COUNTRIES_MAPPING[text]
     except Exception:
         pass
 
@@ -267,77 +360,16 @@ def guess_type(text):
 
 
 def find_subtext(text, field_type):
-
-    months_en = ['jan', 'feb', 'febr', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec',
-                'january', 'february', 'march', 'april', 'june', 'july', 'august', 'september', 'october', 'november', 'december']
-    months_fr = ['jan', 'fev', 'mar', 'avr', 'mai', 'juin', 'juil', 'aout', 'sep', 'sept', 'oct', 'nov', 'dec',
-                'janvier', 'fevrier', 'février', 'mars', 'avril', 'juillet', 'août', 'septembre', 'octobre', 'novembre', 'decembre', 'décembre']
-
-    date_num1 = r'\d{1,2}\/\d{1,2}\/\d{2,4}'
-    date_num2 = r'\d{1,2}\/\d{1,2}'
-    date_alpha_en1 = r'(?:%s)\s+\d{1,2}\s*\d{2,4}' % '|'.join(months_en)
-    date_alpha_en2 = r'%s\s+\d{1,2}' % '|'.join(months_en)
-    date_alpha_fr1 = r'\d{1,2}\s+(?:%s)\s*\d{2,4}' % '|'.join(months_fr)
-    date_alpha_fr2 = r'\d{1,2}\s+(?:%s)' % '|'.join(months_fr)
-
-    date_regex = [re.compile(date_num1), 
-                    re.compile(date_num2),
-                    re.compile(date_alpha_en1),
-                    re.compile(date_alpha_fr1),
-                    re.compile(date_alpha_en2),
-                    re.compile(date_alpha_fr2)]
-
-    try:
-
-        if field_type != "":
-            text_parts = text.split(' ')
-
-            # Finding sub text of type state
-            if field_type == 'state':
-                for part in text_parts:
-                    if is_state(part):
-                        return part
-
-            # Finding sub text of type postal code
-            elif field_type == 'postalCode':
-                for part in text_parts:
-                    if is_postalcode(part):
-                        return part
-
-            # Finding sub text of type city
-            elif field_type == 'city':
-                city = ""
-                for part in text_parts:
-                    if not(is_state(part)) and not(is_postalcode(part)):
-                        city = city + part + " "
-                # Removing whitespace at the end
-                if(city[-1] == " "):
-                    city = city[:-1]
-                return city
-
-            # Finding sub text of type date
-            elif field_type == 'date':
-                text = text.replace('.','')     
-                for regex in date_regex:
-                    reg_date = regex.findall(text)
-                    if len(reg_date) > 0:
-                        return reg_date[0]
-
-    except Exception:
-        pass
-    
-    return text
+    return default_normalizer.find_subtext(text, field_type)
 
 def is_date(text):
     try:
         if len(text) <= 10 and len(text) >= 6 and text.count('/') == 2:
             return True
         split_date = text.lower().split(" ")
-        months = ["january", "february", "march", "april", "may", "june", "july", "september", "october", "november", "december",
-                    "jan", "feb", "febr", "mar", "apr", "jun", "jul", "sep", "sept", "oct", "nov", "dec"]
         if len(split_date) == 3:
             for i in split_date:
-                if i in months:
+                if i in DATE_MONTHS:
                     return True
     except Exception:
         pass
@@ -364,4 +396,7 @@ def is_postalcode(text):
     except Exception:
         pass
     return False
-    
\ No newline at end of file
+
+
+# Process-wide normaliser used by the module functions
+default_normalizer = Normalizer()
@@ -0,0 +1,330 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+import atexit
+import json
+import logging
+import threading
+
+import aiohttp
+
+
+def get_endpoint(region):
+    return f"https://{region}.api.cognitive.microsoft.com"
+
+
+def format_prediction(result, predict_type):
+
+    """Keeps the parts of an analyze result that are needed for a prediction"""
+
+    prediction = {}
+    if result != None:
+
+        try:
+            prediction['readResults'] = result['readResults']
+
+            if predict_type == 'supervised':
+                prediction['fields'] = []
+                for key in result['documentResults'][0]['fields'].keys():
+                    f = result['documentResults'][0]['fields'][key]
+                    if f != None:
+                        field = {}
+                        field['label'] = key
+                        field['text'] = f['text']
+                        field['confidence'] = f['confidence']
+                        field['boundingBox'] = f['boundingBox']
+                        prediction['fields'].append(field)
+            else:
+                prediction['keyValuePairs'] = result['pageResults'][0]['keyValuePairs']
+
+        except Exception as e:
+            logging.error(f"Prediction is invalid: {e}")
+
+    return prediction
+
+
+# How the documents to predict are sent to Form Recognizer:
+# 'source': the service downloads the document from its (SAS) url, the document is streamed when the
+#           service can't reach the url. 'stream': the document is streamed from its url into the analyze request.
+# 'download': the document is downloaded in memory and then posted.
+TRANSFER_MODES = ['source', 'stream', 'download']
+
+
+class FormRecognizerClient(object):
+
+    """
+    Asynchronous Form Recognizer client.
+    All the calls share a single keep-alive session, the number of requests in flight is capped
+    and long running operations are polled using the Retry-After header sent by the service.
+    """
+
+    def __init__(self, region, subscription_key, endpoint=None, max_in_flight=16,
+                 default_retry_after=1.0, max_retry_after=10.0, max_polls=500):
+        self.endpoint = endpoint if endpoint != None else get_endpoint(region)
+        self.subscription_key = subscription_key
+        self.max_in_flight = max_in_flight
+        self.default_retry_after = default_retry_after
+        self.max_retry_after = max_retry_after
+        self.max_polls = max_polls
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        if self._session == None or self._session.closed:
+            # A streamed document holds two connections (download and upload) for a single request slot
+            connector = aiohttp.TCPConnector(limit=2 * self.max_in_flight, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._session
+
+    async def close(self):
+        if self._session != None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def get_retry_after(self, headers):
+        try:
+            retry_after = float(headers['Retry-After'])
+        except Exception:
+            retry_after = self.default_retry_after
+        return min(max(retry_after, 0), self.max_retry_after)
+
+    async def _request(self, method, url, headers=None, authenticated=True, **kwargs):
+        # Each call holds a slot for the duration of a single HTTP exchange only,
+        # sleeping between polls does not count towards the in flight requests
+        headers = dict(headers or {})
+        if authenticated:
+            headers["Ocp-Apim-Subscription-Key"] = self.subscription_key
+        session = await self.open()
+        async with self._semaphore:
+            async with session.request(method, url, headers=headers, **kwargs) as resp:
+                body = await resp.read()
+                return resp.status, resp.headers, body
+
+    async def _stream_request(self, url, source_url, content_type):
+        # The document is forwarded chunk by chunk from its url to the request body, without being held in memory
+        session = await self.open()
+        async with self._semaphore:
+            async with session.get(source_url) as source:
+                if source.status != 200:
+                    raise ValueError(f"could not download document (status {source.status})")
+                headers = {"Ocp-Apim-Subscription-Key": self.subscription_key, "Content-Type": content_type}
+                if source.content_length != None:
+                    headers["Content-Length"] = str(source.content_length)
+                async with session.post(url, data=source.content, headers=headers) as resp:
+                    body = await resp.read()
+                    return resp.status, resp.headers, body
+
+    async def poll(self, status_url, is_running):
+
+        """Polls a long running operation until is_running returns False for the response body"""
+
+        status, headers, body = await self._request('GET', status_url)
+        result = json.loads(body)
+        count = 0
+        while (count < self.max_polls and (status == 429 or (status == 200 and is_running(result)))):
+            await asyncio.sleep(self.get_retry_after(headers))
+            status, headers, body = await self._request('GET', status_url)
+            result = json.loads(body)
+            count += 1
+        return status, result
+
+    async def submit_training(self, source, prefix='', use_label_file=True, include_sub_folders=False):
+
+        """Submits a training job on the documents of a container (SAS url) under a prefix"""
+
+        url = f"{self.endpoint}/formrecognizer/v2.0/custom/models"
+        body = {
+            "source": source,
+            "sourceFilter": {
+                "prefix": prefix,
+                "includeSubFolders": include_sub_folders
+            },
+            "useLabelFile": use_label_file
+        }
+        return await self._request('POST', url, json=body)
+
+    async def get_model(self, model_url):
+
+        """Gets the status of a model, returns the status code, headers and model (None if not json)"""
+
+        status, headers, body = await self._request('GET', model_url)
+        try:
+            result = json.loads(body)
+        except ValueError:
+            result = None
+        return status, headers, result
+
+    async def train_model(self, training_data_blob_sas_url, doctype, use_label_file=True):
+
+        """Trains a document with the Form Recognizer supervised model"""
+
+        logging.info(f"Training url: {training_data_blob_sas_url}")
+
+        try:
+            status, headers, text = await self.submit_training(
+                training_data_blob_sas_url, f"{doctype}/train/", use_label_file)
+
+            if status == 201:
+                status_url = headers['Location']
+                logging.info(f"Model analyse submitted. Operation Location: {status_url}")
+                status, result = await self.poll(
+                    status_url,
+                    lambda r: r['modelInfo']['status'] == 'running' or r['modelInfo']['status'] == 'creating')
+                logging.info(result)
+                return result
+            else:
+                logging.error(f"Error training: {text.decode('utf-8', 'ignore')}")
+        except Exception as e:
+            logging.error(f"Error training model : {e}")
+
+        return None
+
+    async def analyze(self, url, data, content_type='application/pdf'):
+
+        """Submits a document to an analyze endpoint and waits for the result"""
+
+        status, headers, text = await self._request(
+            'POST', url, data=data, headers={"Content-Type": content_type})
+        return await self.wait_analyze(status, headers, text)
+
+    async def analyze_url(self, url, source_url, transfer='source', content_type='application/pdf'):
+
+        """Submits a document stored at source_url to an analyze endpoint (see TRANSFER_MODES) and waits for the result"""
+
+        if transfer not in TRANSFER_MODES:
+            raise ValueError(f"unknown transfer mode {transfer}")
+
+        if transfer == 'source':
+            status, headers, text = await self._request('POST', url, json={"source": source_url})
+            if status != 400:
+                return await self.wait_analyze(status, headers, text)
+            # The service could not use the url (not reachable from the service, unsupported...)
+            logging.warning(f"Source url rejected ({text.decode('utf-8', 'ignore')}), streaming the document.")
+            transfer = 'stream'
+
+        if transfer == 'stream':
+            status, headers, text = await self._stream_request(url, source_url, content_type)
+            return await self.wait_analyze(status, headers, text)
+
+        status, _, content = await self._request('GET', source_url, authenticated=False)
+        if status != 200:
+            raise ValueError(f"could not download document (status {status})")
+        return await self.analyze(url, content, content_type)
+
+    async def wait_analyze(self, status, headers, text):
+
+        """Waits for the result of a submitted analyze operation"""
+
+        if status != 202:
+            logging.error(f"Error during analysis: {text.decode('utf-8', 'ignore')}")
+            return None
+
+        operation_location = headers['Operation-Location']
+        logging.info(f"Analyze Operation Location: {operation_location}")
+        status, result = await self.poll(
+            operation_location,
+            lambda r: r['status'] == 'running' or r['status'] == 'notStarted')
+        return result
+
+    async def get_prediction(self, blob_sas_url, model_id, predict_type, transfer='source'):
+
+        """Gets a prediction for a document with the Form Recognizer supervised model"""
+
+        url = f"{self.endpoint}/formrecognizer/v2.0/custom/models/{model_id}/analyze?includeTextDetails=True"
+        result = None
+        try:
+            response = await self.analyze_url(url, blob_sas_url, transfer)
+            if response != None:
+                logging.info(response['status'])
+                result = response['analyzeResult']
+        except Exception as e:
+            logging.error(f"Error analyzing invoice : {e}")
+
+        return format_prediction(result, predict_type)
+
+    async def analyze_layout(self, file_content, file_name):
+
+        """Gets the OCR (layout) of a document, returns None if it could not be submitted"""
+
+        url = f"{self.endpoint}/formrecognizer/v2.0/layout/analyze"
+        logging.info(f"Analyzing file {file_name}...")
+        analyze_result_response = None
+        try:
+            analyze_result_response = await self.analyze(url, file_content)
+            if analyze_result_response != None:
+                logging.info(f"File {file_name} status: {analyze_result_response['status']}")
+        except Exception as e:
+            logging.error(f"Error analyzing file: {e}")
+
+        return analyze_result_response
+
+
+###################
+# SYNCHRONOUS CALLS
+###################
+
+# The synchronous helpers all run on one background event loop so that
+# clients (and their connection pools) are shared between calls and threads
+_loop = None
+_loop_lock = threading.Lock()
+_clients = {}
+
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop == None:
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever, name="fr-client-loop", daemon=True)
+            thread.start()
+    return _loop
+
+
+def run_sync(coro):
+    """Runs a coroutine on the shared event loop and waits for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+def iterate_sync(async_iterator):
+    """Iterates over an asynchronous generator running on the shared event loop"""
+    loop = _get_loop()
+    try:
+        while True:
+            try:
+                item = asyncio.run_coroutine_threadsafe(async_iterator.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        asyncio.run_coroutine_threadsafe(async_iterator.aclose(), loop).result()
+
+
+def get_client(region, subscription_key, endpoint=None):
+    """Returns the shared client for a region and key, creating it on first use"""
+    key = (region, subscription_key, endpoint)
+    with _loop_lock:
+        client = _clients.get(key)
+        if client == None:
+            client = FormRecognizerClient(region, subscription_key, endpoint)
+            _clients[key] = client
+    return client
+
+
+@atexit.register
+def close_clients():
+    """Closes the sessions of the shared clients"""
+    if _loop != None:
+        for client in list(_clients.values()):
+            run_sync(client.close())
+        _clients.clear()
@@ -3,10 +3,12 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
+import asyncio
 import logging
-from requests import get, post
-import time
 
+from . import fr_client
+from . import prediction_scheduler
+from . import training_scheduler
 from . import utils
 from . import formatting
 
@@ -15,121 +17,88 @@ def train_model(region, subscription_key, training_data_blob_sas_url, doctype, u
 
     """Trains a document with the Form Recognizer supervised model"""
 
-    headers = {
-        "Content-Type": "application/json",
-        "Ocp-Apim-Subscription-Key": subscription_key,
-    }
-    url = f"https://{region}.api.cognitive.microsoft.com/formrecognizer/v2.0/custom/models"
-    prefix = f"{doctype}/train/"
-    body = {
-        "source": training_data_blob_sas_url,
-        "sourceFilter": {
-            "prefix": prefix,
-            "includeSubFolders": False
-        },
-        "useLabelFile": use_label_file
-    }
-
-    logging.info(f"Training url: {training_data_blob_sas_url}")
+    client = fr_client.get_client(region, subscription_key)
+    return fr_client.run_sync(client.train_model(training_data_blob_sas_url, doctype, use_label_file))
 
-    try:
-        resp = post(url=url, json=body, headers=headers)
-
-        if resp.status_code == 201:
-            status_url = resp.headers['Location']
-            logging.info(f"Model analyse submitted. Operation Location: {status_url}")
-            headers = {"Ocp-Apim-Subscription-Key": subscription_key}
-            resp = get(url=status_url, headers=headers)
-            logging.info(resp.json())
-            count = 0
-            max_retry = 500
-            while (count < max_retry and resp.status_code == 200 and (resp.json()['modelInfo']['status'] == 'running' or resp.json()['modelInfo']['status'] == 'creating')):
-                resp = get(url=status_url, headers=headers)
-                time.sleep(0.5)
-                count += 1
-            logging.info(resp.json())
-            return resp.json()
-        else:
-            logging.error(f"Error training: {str(resp.text)}")
-    except Exception as e:
-        logging.error(f"Error training model : {e}")
-    
-    return None
 
+def train_models(jobs, region, subscription_key, max_trainings=4, checkpoint_path=None, endpoint=None, scheduler=None):
+
+    """
+    Trains models concurrently, at most max_trainings at a time
+    :param jobs: Iterable of (key, training_data_blob_sas_url, prefix, use_label_file)
+    :param checkpoint_path: File where the progress is saved, to resume the trainings after a crash
+    :param scheduler: The TrainingScheduler to use, to read its counters afterwards
+    :return: Dictionary of the model returned by the service for each key, None when the training failed
+    """
 
-def get_prediction(region, subscription_key, blob_sas_url, model_id, predict_type):
+    if scheduler == None:
+        client = fr_client.get_client(region, subscription_key, endpoint)
+        scheduler = training_scheduler.TrainingScheduler(client, max_trainings, checkpoint_path)
+    models = fr_client.run_sync(scheduler.train(jobs))
+    logging.info(f"Training stats: {scheduler.get_stats()}")
+    return models
 
-    """Gets a prediction for a document with the Form Recognizer supervised model"""
+
+def get_prediction(region, subscription_key, blob_sas_url, model_id, predict_type, transfer='source'):
+
+    """
+    Gets a prediction for a document with the Form Recognizer supervised model
+    By default the service downloads the document from its url, see fr_client.TRANSFER_MODES
+    """
 
     print(f"MODEL ID : {model_id}")
-    headers = {
-        "Content-Type": "application/pdf",
-        "Ocp-Apim-Subscription-Key": subscription_key,
-    }
-    url = f"https://{region}.api.cognitive.microsoft.com/formrecognizer/v2.0/custom/models/{model_id}/analyze?includeTextDetails=True"
-    result = None
-    try:
-        f = get(blob_sas_url)
-        resp = post(url=url, data=f.content, headers=headers)
-
-        if resp.status_code == 202:
-            status_url = resp.headers['Operation-Location']
-            logging.info(f"Invoice analyze submitted. Operation Location: {status_url}")
-            headers = {"Ocp-Apim-Subscription-Key": subscription_key}
-            resp = get(url=status_url, headers=headers)
-            logging.info(resp.json())
-            count = 0
-            max_retry = 100
-            while (count < max_retry and (resp.status_code == 200 or resp.status_code == 429) and (resp.json()['status'] == 'running' or resp.json()['status'] == 'notStarted')):
-                resp = get(url=status_url, headers=headers)
-                time.sleep(1)
-                count += 1
-            logging.info(resp.json()['status'])
-            #print(resp.json())
-            result = resp.json()['analyzeResult']
-        else:
-            logging.error(f"Error during analysis: {str(resp.text)}")
-    except Exception as e:
-        logging.error(f"Error analyzing invoice : {e}")
-
-    prediction = {}
-    if result != None:
-
-        try:
-            prediction['readResults'] = result['readResults']
-
-            if predict_type == 'supervised':     
-                prediction['fields'] = []
-                for key in result['documentResults'][0]['fields'].keys():
-                    f = result['documentResults'][0]['fields'][key]
-                    if f != None:
-                        field = {}
-                        field['label'] = key
-                        field['text'] = f['text']
-                        field['confidence'] = f['confidence']
-                        field['boundingBox'] = f['boundingBox']
-                        prediction['fields'].append(field)
-            else:
-                prediction['keyValuePairs'] = result['pageResults'][0]['keyValuePairs']
-                
-        except Exception as e:
-            logging.error(f"Prediction is invalid: {e}")
-                
-    return prediction
+    client = fr_client.get_client(region, subscription_key)
+    return fr_client.run_sync(client.get_prediction(blob_sas_url, model_id, predict_type, transfer))
+
+
+def get_predictions(region, subscription_key, blob_sas_url, models, transfer='source'):
+
+    """
+    Gets the predictions of a document with several models at once
+    :param models: List of (model_id, predict_type)
+    :return: The list of the predictions of each model
+    """
+
+    client = fr_client.get_client(region, subscription_key)
 
+    async def predict():
+        return await asyncio.gather(
+            *[client.get_prediction(blob_sas_url, model_id, predict_type, transfer) for model_id, predict_type in models])
 
-def batch_predictions(blobs, model_id, storage_url, container, sas, region, subscription_key):
+    return list(fr_client.run_sync(predict()))
+
+
+def stream_predictions(documents, region, subscription_key, max_in_flight=16, transfer='source', scheduler=None):
+
+    """
+    Predicts documents concurrently, yielding the results in the order of the documents as soon as they are available
+    :param documents: Iterable of (key, blob_sas_url, models), models being a list of (model_id, predict_type)
+    :param scheduler: The PredictionScheduler to use, to read its counters afterwards
+    :return: A generator of (key, list of the predictions of each model)
+    """
+
+    if scheduler == None:
+        scheduler = prediction_scheduler.PredictionScheduler(fr_client.get_client(region, subscription_key), max_in_flight)
+    return fr_client.iterate_sync(scheduler.predict(documents, transfer))
+
+
+def batch_predictions(blobs, model_id, storage_url, container, sas, region, subscription_key,
+                      max_in_flight=16, transfer='source'):
+
+    """Gets the supervised predictions of a list of blobs, max_in_flight documents being analyzed at once"""
     
     predictions = []
+    count_analyzed = 0
+    count_total = 0
 
     try:
-        count_analyzed = 0
-        count_total = 0
-        for blob in blobs:
-            blob_url = storage_url + '/' + container + '/' + blob + sas
-            logging.info(f"#{count_total} - Analyzing blob {blob}...")
-            analyze_result = get_prediction(region, subscription_key, blob_url, model_id, "supervised")
-            if len(analyze_result['fields']) > 0:
+        scheduler = prediction_scheduler.PredictionScheduler(fr_client.get_client(region, subscription_key), max_in_flight)
+        documents = ((blob, storage_url + '/' + container + '/' + blob + sas, [(model_id, "supervised")]) for blob in blobs)
+        logging.info(f"Analyzing {len(blobs)} blobs...")
+        for blob, [analyze_result] in stream_predictions(documents, region, subscription_key, transfer=transfer,
+                                                         scheduler=scheduler):
+            logging.info(f"#{count_total} - Analyzed blob {blob}.")
+            if len(analyze_result.get('fields', [])) > 0:
                 logging.info("Done.")
                 prediction = {}
                 # Getting file ID from blob name
@@ -138,8 +107,9 @@ def batch_predictions(blobs, model_id, storage_url, container, sas, region, subs
                 predictions.append(prediction)
                 count_analyzed += 1
             else:
-                logging.error(f"Error analyzing blob {blob_url}: no fields were found.")
+                logging.error(f"Error analyzing blob {blob}: no fields were found.")
             count_total += 1
+        logging.info(f"Batch prediction stats: {scheduler.get_stats()}")
     except Exception as e:
         logging.error(f"Error during batch prediction: {e}")
 
@@ -147,42 +117,6 @@ def batch_predictions(blobs, model_id, storage_url, container, sas, region, subs
 
 
 def analyze_layout(region, subscription_key, file_content, file_name):
-    
-    headers = {
-        "Ocp-Apim-Subscription-Key": subscription_key,
-        "Content-Type": 'application/pdf'
-    }
-
-    operation_location = ""
-    logging.info(f"Analyzing file {file_name}...")
-    analyze_result_response = None
-
-    try:
-        url = f"https://{region}.api.cognitive.microsoft.com/formrecognizer/v2.0/layout/analyze"
-        resp = post(url=url, data=file_content, headers=headers)
-        logging.info(resp)
-        operation_location = resp.headers['Operation-Location']
-        logging.info(f"Analyze Operation Location: {operation_location}")
-    except Exception as e:
-        logging.error(f"Error analyzing file: {e}")
-
-    # Getting response result
-    if(operation_location != ""):
-        resp_analyze = get(url=operation_location, headers=headers)
-        analyze_result_response = resp_analyze.json()
-        logging.info(analyze_result_response)
-        count = 0
-        max_retry = 30
-        try:
-            while(count < max_retry and resp_analyze.status_code == 200 and (analyze_result_response['status'] == 'running' or analyze_result_response['status'] == 'notStarted')):
-                resp_analyze = get(url=operation_location, headers=headers)
-                analyze_result_response = resp_analyze.json()
-                time.sleep(0.5)
-                count += 1
-            logging.info(f"File {file_name} status: {analyze_result_response['status']}")
-        except Exception as e:
-            logging.error(f"Error analyzing file: {e}")
-        
-    return analyze_result_response
-
 
+    client = fr_client.get_client(region, subscription_key)
+    return fr_client.run_sync(client.analyze_layout(file_content, file_name))
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import logging
+import os
+import hashlib
+import tempfile
+import threading
+
+import pandas as pd     # type:ignore
+import pyarrow as pa    # type:ignore
+import pyarrow.parquet as pq    # type:ignore
+
+from . import utils
+
+
+class GroundTruthStore(object):
+
+    """
+    Ground truth indexed by file ID.
+    The Excel workbook is converted once to a Parquet cache, which is then memory-mapped and
+    only the rows of the requested documents are materialized. The cache is rebuilt when the
+    modification time or size of the workbook changes.
+    """
+
+    def __init__(self, gt_path, file_header='FileID', cache_dir=None):
+        self.gt_path = gt_path
+        self.file_header = file_header
+        self.cache_dir = cache_dir if cache_dir != None else os.path.join(tempfile.gettempdir(), 'gt_cache')
+        self.version = None
+        self._table = None
+        self._index = {}
+        self._lock = threading.Lock()
+
+    @property
+    def empty(self):
+        self.refresh()
+        return self._table is None or self._table.num_rows == 0
+
+    def __len__(self):
+        self.refresh()
+        return 0 if self._table is None else self._table.num_rows
+
+    def get_source_version(self):
+        if isinstance(self.gt_path, str) and os.path.isfile(self.gt_path):
+            stat = os.stat(self.gt_path)
+            return f"{stat.st_mtime_ns}-{stat.st_size}"
+        return None
+
+    def get_cache_path(self):
+        name = hashlib.sha1(os.path.abspath(self.gt_path).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{name}_{self.file_header}.parquet")
+
+    def refresh(self):
+        """Loads the ground truth if it was never loaded or if the workbook changed"""
+        version = self.get_source_version()
+        if self._table is not None and version == self.version:
+            return
+        with self._lock:
+            if self._table is not None and version == self.version:
+                return
+            table = None
+            if version != None:
+                table = self._read_cache(version)
+            if table is None:
+                table = self._load_workbook(version)
+            self._table = table
+            self.version = version
+            self._build_index()
+
+    def _read_cache(self, version):
+        cache_path = self.get_cache_path()
+        try:
+            if os.path.isfile(cache_path):
+                table = pq.read_table(cache_path, memory_map=True)
+                metadata = table.schema.metadata or {}
+                if metadata.get(b'gt_version') == version.encode('utf-8'):
+                    logging.info(f"Ground truth loaded from cache {cache_path}.")
+                    return table
+        except Exception as e:
+            logging.warning(f"Could not read ground truth cache {cache_path}: {e}")
+        return None
+
+    def _load_workbook(self, version):
+        df = utils.load_excel(self.gt_path)
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except Exception as e:
+            # Mixed type columns can't be converted, keeping them as text
+            logging.warning(f"Converting mixed type ground truth columns to text: {e}")
+            df = df.apply(lambda c: c.astype(str) if c.dtype == object else c)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+
+        if version != None and table.num_rows > 0:
+            cache_path = self.get_cache_path()
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                metadata = dict(table.schema.metadata or {})
+                metadata[b'gt_version'] = version.encode('utf-8')
+                table = table.replace_schema_metadata(metadata)
+                tmp_path = cache_path + f".{os.getpid()}.tmp"
+                pq.write_table(table, tmp_path)
+                os.replace(tmp_path, cache_path)
+                table = pq.read_table(cache_path, memory_map=True)
+                logging.info(f"Ground truth cached to {cache_path}.")
+            except Exception as e:
+                logging.warning(f"Could not cache ground truth to {cache_path}: {e}")
+        return table
+
+    def _build_index(self):
+        self._index = {}
+        if self._table is None or self.file_header not in self._table.column_names:
+            return
+        file_ids = self._table.column(self.file_header).to_pylist()
+        for position, file_id in enumerate(file_ids):
+            self._index.setdefault(str(file_id), []).append(position)
+
+    def get_rows(self, file_id):
+        """Returns the ground truth rows of a document as a dataframe (empty if the document is unknown)"""
+        self.refresh()
+        if self._table is None:
+            return pd.DataFrame()
+        positions = self._index.get(str(file_id), [])
+        return self._table.take(pa.array(positions, type=pa.int64())).to_pandas()
+
+    def get_row(self, file_id):
+        """Returns the first ground truth row of a document, raises KeyError if the document is unknown"""
+        rows = self.get_rows(file_id)
+        if len(rows) == 0:
+            raise KeyError(f"{file_id} not found in ground truth")
+        return rows.iloc[0]
+
+    def to_dataframe(self):
+        self.refresh()
+        return pd.DataFrame() if self._table is None else self._table.to_pandas()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(gt_path, file_header='FileID'):
+    """Returns the process-wide store for a ground truth workbook"""
+    key = (gt_path, file_header)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store == None:
+            store = GroundTruthStore(gt_path, file_header)
+            _stores[key] = store
+    return store
+
+
+def clear():
+    with _stores_lock:
+        _stores.clear()
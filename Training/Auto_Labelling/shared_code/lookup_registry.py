@@ -0,0 +1,115 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import logging
+import os
+import threading
+import time
+
+import requests
+
+from . import utils
+
+
+class LookupFields(object):
+
+    """
+    Parsed lookup file with the indexes used during autolabelling and evaluation:
+    field name -> GT columns, GT column -> compare method and GT column -> field names
+    """
+
+    def __init__(self, lookup_fields, version=None):
+        self.lookup_fields = lookup_fields
+        self.version = version
+        self.keys = lookup_fields['keys']
+        self.types = lookup_fields['types']
+        self.fields_by_column = {}
+        for field_name, columns in self.keys.items():
+            for col in columns:
+                self.fields_by_column.setdefault(col, []).append(field_name)
+
+    def map_columns(self, key_name):
+        return list(self.keys[key_name])
+
+    def lookup_compare(self, column_name):
+        return self.types[column_name]
+
+    def fields_for_column(self, column_name):
+        return list(self.fields_by_column.get(column_name, []))
+
+
+class LookupRegistry(object):
+
+    """
+    Process-wide cache of lookup files.
+    Files are reloaded when their modification time or size changes, urls are revalidated
+    with their ETag at most once every url_ttl seconds.
+    """
+
+    def __init__(self, url_ttl=60):
+        self.url_ttl = url_ttl
+        self._entries = {}
+        self._checked = {}
+        self._is_url = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._checked.clear()
+            self._is_url.clear()
+
+    def get(self, lookup_path):
+        try:
+            with self._lock:
+                is_url = self._is_url.get(lookup_path)
+                if is_url == None:
+                    is_url = self._is_url[lookup_path] = utils.is_url(lookup_path)
+                if is_url:
+                    return self._get_from_url(lookup_path)
+                return self._get_from_file(lookup_path)
+        except Exception as e:
+            logging.error(f"Error loading lookup file: {e}")
+        return None
+
+    def _get_from_file(self, lookup_path):
+        stat = os.stat(lookup_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        entry = self._entries.get(lookup_path)
+        if entry == None or entry.version != version:
+            lookup_fields = utils.get_lookup_fields_from_file(lookup_path)
+            entry = LookupFields(lookup_fields, version)
+            self._entries[lookup_path] = entry
+        return entry
+
+    def _get_from_url(self, lookup_path):
+        entry = self._entries.get(lookup_path)
+        now = time.monotonic()
+        if entry != None and now - self._checked[lookup_path] < self.url_ttl:
+            return entry
+
+        headers = {}
+        if entry != None and entry.version != None:
+            headers['If-None-Match'] = entry.version
+        logging.info(f"Loading lookup file from url. Url: {lookup_path}")
+        r = requests.get(url=lookup_path, headers=headers)
+        if r.status_code != 304 or entry == None:
+            r.raise_for_status()
+            entry = LookupFields(r.json(), r.headers.get('ETag'))
+            self._entries[lookup_path] = entry
+        self._checked[lookup_path] = now
+        return entry
+
+
+_registry = LookupRegistry()
+
+
+def get_lookup(lookup_path):
+    """Returns the indexed lookup fields for a path or url, loading them only when they changed"""
+    return _registry.get(lookup_path)
+
+
+def clear():
+    _registry.clear()
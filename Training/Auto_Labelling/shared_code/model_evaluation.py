@@ -6,19 +6,19 @@
 import logging
 import pandas as pd
 
-from . import autolabeling, formatting, utils
+from . import autolabeling, formatting, gt_store, utils
 
 
 def evaluate(predictions, gt_path, lookup_path, count_analyzed, count_total, file_header='FileID'):
 
-    gt_df = utils.load_excel(gt_path)
+    gt = gt_store.get_store(gt_path, file_header)
     evaluation = []
 
-    if not(gt_df.empty):
+    if not(gt.empty):
 
         logging.info("Ground truth loaded.")
 
-        if len(gt_df) > 0 and len(predictions) > 0:
+        if len(gt) > 0 and len(predictions) > 0:
 
             try:
                 for p in predictions:
@@ -27,7 +27,7 @@ def evaluate(predictions, gt_path, lookup_path, count_analyzed, count_total, fil
                     ev['count_analyzed'] = count_analyzed
                     ev['count_total'] = count_total
                     ev['fields'] = []
-                    row_document = gt_df.loc[gt_df[file_header] == p['file_id']].iloc[0]
+                    row_document = gt.get_row(p['file_id'])
                     for f in p['fields']:
                         f['subfields'] = []
                         columns = autolabeling.map_columns(f['label'], lookup_path)
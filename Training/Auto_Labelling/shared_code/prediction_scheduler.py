@@ -0,0 +1,112 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+import collections
+import logging
+import time
+
+
+def summarize_latencies(latencies):
+    """Mean, median, 95th percentile and maximum of a list of latencies in seconds"""
+    if len(latencies) == 0:
+        return {'count': 0}
+    ordered = sorted(latencies)
+    return {
+        'count': len(ordered),
+        'mean': sum(ordered) / len(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'p95': ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+        'max': ordered[-1]
+    }
+
+
+class PredictionScheduler(object):
+
+    """
+    Runs the predictions of many documents concurrently with a Form Recognizer client.
+    All the model calls of a document (supervised and unsupervised for instance) are sent at once, and at most
+    max_in_flight calls are in progress across documents. Results are yielded in the order of the documents as
+    soon as the documents before them are done; at most max_pending documents are started ahead of the next
+    result to yield, which bounds the results waiting for a slow document.
+    The counters give the calls waiting for a slot (queued), in progress (in_flight), the documents done and
+    waiting for an earlier one (waiting), and the call and document latencies.
+    """
+
+    def __init__(self, client, max_in_flight=16, max_pending=None):
+        self.client = client
+        self.max_in_flight = max_in_flight
+        self.max_pending = max_pending if max_pending != None else 2 * max_in_flight
+        self.counters = {'documents': 0, 'calls': 0, 'failed': 0, 'queued': 0, 'in_flight': 0, 'waiting': 0,
+                         'max_queued': 0, 'max_waiting': 0}
+        self.call_latencies = []
+        self.document_latencies = []
+
+    def get_stats(self):
+        stats = dict(self.counters)
+        stats['call_latency'] = summarize_latencies(self.call_latencies)
+        stats['document_latency'] = summarize_latencies(self.document_latencies)
+        return stats
+
+    async def _call(self, semaphore, blob_sas_url, model_id, predict_type, transfer):
+        self.counters['queued'] += 1
+        self.counters['max_queued'] = max(self.counters['max_queued'], self.counters['queued'])
+        async with semaphore:
+            self.counters['queued'] -= 1
+            self.counters['in_flight'] += 1
+            start = time.monotonic()
+            try:
+                prediction = await self.client.get_prediction(blob_sas_url, model_id, predict_type, transfer)
+            finally:
+                self.counters['in_flight'] -= 1
+                self.call_latencies.append(time.monotonic() - start)
+        self.counters['calls'] += 1
+        if len(prediction) == 0:
+            self.counters['failed'] += 1
+        return prediction
+
+    async def _predict_document(self, semaphore, blob_sas_url, models, transfer):
+        start = time.monotonic()
+        predictions = await asyncio.gather(
+            *[self._call(semaphore, blob_sas_url, model_id, predict_type, transfer) for model_id, predict_type in models])
+        self.document_latencies.append(time.monotonic() - start)
+        return list(predictions)
+
+    async def predict(self, documents, transfer='source'):
+
+        """
+        Predicts documents, yielding (key, predictions) in the order of the documents
+        :param documents: Iterable of (key, blob_sas_url, models), models being a list of (model_id, predict_type)
+        :param transfer: How the documents are sent to the service, see fr_client.TRANSFER_MODES
+        :return: An asynchronous generator of (key, list of the predictions of each model)
+        """
+
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        pending = collections.deque()
+        documents = iter(documents)
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < self.max_pending:
+                    try:
+                        key, blob_sas_url, models = next(documents)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    task = asyncio.ensure_future(self._predict_document(semaphore, blob_sas_url, models, transfer))
+                    pending.append((key, task))
+                if len(pending) == 0:
+                    break
+
+                key, task = pending.popleft()
+                predictions = await task
+                self.counters['waiting'] = sum(1 for _, t in pending if t.done())
+                self.counters['max_waiting'] = max(self.counters['max_waiting'], self.counters['waiting'])
+                self.counters['documents'] += 1
+                yield key, predictions
+        finally:
+            for _, task in pending:
+                task.cancel()
+            logging.info(f"Prediction scheduler stats: {self.counters}")
@@ -9,11 +9,16 @@ import base64
 import hmac
 import datetime
 import urllib 
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from azure.storage.blob import BlobServiceClient, ContainerClient, PublicAccess
+from azure.storage.blob import BlobServiceClient, ContainerClient, PublicAccess, BlobPrefix
 from azure.storage.queue import QueueServiceClient, QueueClient, QueueMessage
 from azure.cosmosdb.table.tableservice import TableService
 from azure.cosmosdb.table.models import Entity
+from azure.cosmosdb.table.tablebatch import TableBatch
 
 ##############
 # BLOB STORAGE
@@ -30,12 +35,30 @@ def create_container_client(account_url, container_name, sas):
         logging.error(f"Could not create container client for container {container_name} in account {account_url}: {e}")
     return container_client
 
+# Lazily iterates over the blobs whose name starts with a prefix, one page at a time
+# The prefix is applied by the service, with a delimiter only the direct children of the prefix are returned
+def iter_blobs(container_client, prefix=None, delimiter=None, results_per_page=5000):
+    if delimiter:
+        pages = container_client.walk_blobs(name_starts_with=prefix, delimiter=delimiter, results_per_page=results_per_page)
+    else:
+        pages = container_client.list_blobs(name_starts_with=prefix, results_per_page=results_per_page)
+    for page in pages.by_page():
+        for blob in page:
+            if not isinstance(blob, BlobPrefix):
+                yield blob
+
+def get_folder_prefix(folder_name):
+    return folder_name + '/' if folder_name else None
+
 # Lists all the pdf blobs in a given folder within a container
 def list_blobs(container_client, folder_name, show_all = False, recursive = False):
     blobs = []
     try:
-        blob_list = container_client.list_blobs()
-        print(blob_list)
+        if recursive:
+            # Folders starting with the folder name are included as well, so the prefix has no trailing slash
+            blob_list = iter_blobs(container_client, folder_name or None)
+        else:
+            blob_list = iter_blobs(container_client, get_folder_prefix(folder_name), delimiter='/')
         for blob in blob_list:
             path_parts = blob.name.split('/')
             folder = '/'.join(path_parts[i] for i in range(len(path_parts)-1))
@@ -47,6 +70,53 @@ def list_blobs(container_client, folder_name, show_all = False, recursive = Fals
         logging.error(f"Could not list blobs in folder {folder_name}: {e}")
     return blobs
 
+# Loads a listing snapshot saved by list_changed_blobs, returns an empty snapshot if there is none
+def load_listing_snapshot(snapshot_path):
+    try:
+        with open(snapshot_path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logging.error(f"Could not load listing snapshot {snapshot_path}: {e}")
+        return {}
+
+def save_listing_snapshot(snapshot_path, snapshot):
+    try:
+        tmp_path = snapshot_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, snapshot_path)
+        return True
+    except Exception as e:
+        logging.error(f"Could not save listing snapshot {snapshot_path}: {e}")
+        return False
+
+# Lists the pdf blobs of a folder that were added or modified since the last scan
+# The listing is compared with a local snapshot (blob name -> etag). The updated snapshot is returned and not saved:
+# the caller saves it with save_listing_snapshot once the changed blobs are processed, so that they are listed again otherwise
+def list_changed_blobs(container_client, folder_name, snapshot_path, show_all = False, recursive = False):
+    snapshot = load_listing_snapshot(snapshot_path)
+    previous = snapshot.get(folder_name, {})
+    current = {}
+    changed = []
+    try:
+        blob_list = iter_blobs(container_client, get_folder_prefix(folder_name), delimiter=None if recursive else '/')
+        for blob in blob_list:
+            if blob.size == 0 or not(show_all or blob.name.split('.')[-1] == 'pdf'):
+                continue
+            current[blob.name] = blob.etag
+            if previous.get(blob.name) != blob.etag:
+                changed.append(blob.name)
+    except Exception as e:
+        logging.error(f"Could not list blobs in folder {folder_name}: {e}")
+        return None, [], None
+
+    removed = [name for name in previous if name not in current]
+    snapshot[folder_name] = current
+    logging.info(f"Found {str(len(changed))} new or modified blobs and {str(len(removed))} removed blobs in folder {folder_name}.")
+    return changed, removed, snapshot
+
 def delete_folder(container_client, folder_name):
     for blob in list_blobs(container_client, folder_name, True, True):
         blob_client = container_client.get_blob_client(blob)
@@ -61,24 +131,135 @@ def get_blob_root_folder(name):
     return name[:index]
   return None
 
-def copy_folder(container_client, src_folder, dest_folder, recursive = True, recreate_destination = True):
+# Copies a folder to another folder, in the same container or in dest_container_client
+# Within a storage account the copies are done by the service and the data never goes through the worker,
+# between accounts the blobs are streamed with a bounded number of concurrent transfers
+# Returns the list of copied blobs and the list of blobs that could not be copied after max_retries attempts
+def copy_folder(container_client, src_folder, dest_folder, recursive = True, recreate_destination = True,
+                dest_container_client = None, max_concurrency = 16, max_retries = 3, poll_interval = 0.5, copy_timeout = 300):
+    if dest_container_client == None:
+        dest_container_client = container_client
+    copied, failed = [], []
     blobs = list_blobs(container_client, src_folder, True, recursive)
     if(len(blobs) > 0):
-        if(recreate_destination == True): delete_folder(container_client, dest_folder)
-        for blob in blobs:
-            blob_data = download_blob(container_client, blob)
-            new_blob_name = blob.replace(src_folder, dest_folder)
-            upload_blob(container_client, new_blob_name, blob_data)
+        if(recreate_destination == True): delete_folder(dest_container_client, dest_folder)
+        copies = {blob: blob.replace(src_folder, dest_folder, 1) for blob in blobs}
+        if dest_container_client.account_name == container_client.account_name:
+            copied, failed = server_side_copy(container_client, dest_container_client, copies, max_concurrency, max_retries, poll_interval, copy_timeout)
+        else:
+            copied, failed = stream_copy(container_client, dest_container_client, copies, max_concurrency, max_retries)
+        logging.info(f"Copied {str(len(copied))} blobs from {src_folder} to {dest_folder}, {str(len(failed))} failed.")
+    return copied, failed
+
+# Starts a copy done by the storage service, the source is read through its url (including the SAS token)
+def start_blob_copy(container_client, dest_container_client, blob_name, new_blob_name):
+    source_url = container_client.get_blob_client(blob_name).url
+    dest_blob_client = dest_container_client.get_blob_client(new_blob_name)
+    copy = dest_blob_client.start_copy_from_url(source_url)
+    return dest_blob_client, copy['copy_status'], copy.get('copy_id')
+
+def get_blob_copy_status(dest_blob_client):
+    return dest_blob_client.get_blob_properties().copy.status
+
+# The copies still pending copy_timeout seconds after they were started are aborted and count as a failed attempt
+def server_side_copy(container_client, dest_container_client, copies, max_concurrency = 16, max_retries = 3, poll_interval = 0.5, copy_timeout = 300):
+    copied, failed = [], []
+    attempts = {blob: 0 for blob in copies}
+    pending = list(copies)
+
+    def retry_or_fail(blob, reason, retries):
+        if attempts[blob] < max_retries:
+            logging.warning(f"Copy of blob {blob} failed ({reason}), retrying.")
+            retries.append(blob)
+        else:
+            logging.error(f"Could not copy blob {blob}: {reason}")
+            failed.append(blob)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        while len(pending) > 0:
+            retries = []
+            in_progress = {}
+
+            # Starting all the copies, the service copies the blobs concurrently
+            futures = {executor.submit(start_blob_copy, container_client, dest_container_client, blob, copies[blob]): blob for blob in pending}
+            for future in as_completed(futures):
+                blob = futures[future]
+                attempts[blob] += 1
+                try:
+                    dest_blob_client, status, copy_id = future.result()
+                    if status == 'success':
+                        copied.append(blob)
+                    else:
+                        in_progress[blob] = (dest_blob_client, copy_id)
+                except Exception as e:
+                    retry_or_fail(blob, e, retries)
+
+            # Tracking the copies that are not done yet
+            deadline = time.monotonic() + copy_timeout
+            while len(in_progress) > 0:
+                if time.monotonic() >= deadline:
+                    for blob, (dest_blob_client, copy_id) in in_progress.items():
+                        try:
+                            dest_blob_client.abort_copy(copy_id)
+                        except Exception as e:
+                            logging.warning(f"Could not abort copy of blob {blob}: {e}")
+                        retry_or_fail(blob, f"copy not done after {copy_timeout} seconds", retries)
+                    break
+                time.sleep(poll_interval)
+                futures = {executor.submit(get_blob_copy_status, dest_blob_client): blob for blob, (dest_blob_client, _) in in_progress.items()}
+                for future in as_completed(futures):
+                    blob = futures[future]
+                    try:
+                        status = future.result()
+                    except Exception:
+                        status = 'failed'
+                    if status == 'success':
+                        copied.append(blob)
+                        del in_progress[blob]
+                    elif status != 'pending':
+                        del in_progress[blob]
+                        retry_or_fail(blob, f"copy status {status}", retries)
+
+            pending = retries
+
+    return copied, failed
+
+# Streams one blob to another container chunk by chunk, without holding it in memory
+def stream_blob(container_client, dest_container_client, blob_name, new_blob_name):
+    downloader = container_client.download_blob(blob_name)
+    dest_container_client.upload_blob(name=new_blob_name, data=downloader.chunks(), length=downloader.size, overwrite=True)
+
+def stream_copy(container_client, dest_container_client, copies, max_concurrency = 16, max_retries = 3):
+    copied, failed = [], []
+
+    def copy_with_retries(blob):
+        for attempt in range(max_retries):
+            try:
+                stream_blob(container_client, dest_container_client, blob, copies[blob])
+                return True
+            except Exception as e:
+                logging.warning(f"Copy of blob {blob} failed (attempt {attempt + 1}/{max_retries}): {e}")
+        return False
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        for blob, success in zip(copies, executor.map(copy_with_retries, copies)):
+            if success:
+                copied.append(blob)
+            else:
+                logging.error(f"Could not copy blob {blob}.")
+                failed.append(blob)
+
+    return copied, failed
 
 # Lists all the folders in a given container
 def list_doctype_folders(container_client):
     folders = []
     try:
-        blobs = container_client.list_blobs()
-        for blob in blobs:
-            root_folder = get_blob_root_folder(blob.name)
-            if root_folder:
-                folders.append(root_folder)
+        # With a delimiter the service only returns the top level virtual folders
+        prefixes = container_client.walk_blobs(delimiter='/')
+        for prefix in prefixes:
+            if isinstance(prefix, BlobPrefix):
+                folders.append(prefix.name.rstrip('/'))
         logging.info(f"Found {str(len(folders))} folders.")
     except Exception as e:
         logging.error(f"Could not list folders: {e}")
@@ -181,6 +362,59 @@ def query_entity_status(table_service, table_name, partition_key, row_key):
         logging.info("Could not query entity %s in table %s:%s"%(row_key,table_name,e))
         return None
 
+# Queries the status of all the entities of a partition, page by page (the service returns up to 1000 entities per page)
+# Returns a dictionary row key -> status (None if the query failed) and the number of requests made
+def query_partition_status(table_service, table_name, partition_key, page_size = 1000):
+    statuses = {}
+    round_trips = 0
+    marker = None
+    # Single quotes are doubled in OData string literals
+    partition_filter = "PartitionKey eq '{}'".format(partition_key.replace("'", "''"))
+    try:
+        while True:
+            page = table_service.query_entities(table_name, filter=partition_filter,
+                select='RowKey,status', num_results=page_size, marker=marker)
+            round_trips += 1
+            for entity in page:
+                statuses[entity.RowKey] = entity.get('status')
+            marker = page.next_marker
+            if not marker:
+                break
+        logging.info(f"Retrieved status of {str(len(statuses))} entities with partition key {partition_key}.")
+        return statuses, round_trips
+    except Exception as e:
+        logging.error(f"Could not query entities with partition key {partition_key}: {e}")
+        return None, round_trips
+
+# Creates or updates entities with entity group transactions of up to batch_size operations
+# A transaction only holds entities of a single partition, and each row key at most once (the last entity wins)
+# Returns the list of entities that could not be written and the number of requests made
+def insert_or_replace_entities(table_service, table_name, entities, batch_size = 100):
+    partitions = {}
+    for entity in entities:
+        partitions.setdefault(entity['PartitionKey'], {})[entity['RowKey']] = entity
+
+    failed = []
+    round_trips = 0
+    for partition_key, partition in partitions.items():
+        partition_entities = list(partition.values())
+        for i in range(0, len(partition_entities), batch_size):
+            chunk = partition_entities[i:i + batch_size]
+            try:
+                batch = TableBatch()
+                for entity in chunk:
+                    batch.insert_or_replace_entity(entity)
+                round_trips += 1
+                table_service.commit_batch(table_name, batch)
+            except Exception as e:
+                # A transaction fails as a whole, writing the entities one by one so that a single bad entity doesn't block the others
+                logging.warning(f"Could not commit batch of {str(len(chunk))} entities with partition key {partition_key}, writing them one by one: {e}")
+                for entity in chunk:
+                    round_trips += 1
+                    if not insert_or_replace_entity(table_service, table_name, entity):
+                        failed.append(entity)
+    return failed, round_trips
+
 def query_entity_model(table_service, table_name, partition_key, row_key):
     try:
         entity = table_service.get_entity(table_name, partition_key, row_key)
@@ -225,6 +459,26 @@ def get_queue_message(queue_client):
         logging.error(f"Could not retrieve queue messages: {e}")
         return None
 
+# Receives up to max_messages messages (32 at most), hidden from the other consumers for visibility_timeout seconds
+def receive_queue_messages(queue_client, max_messages = 32, visibility_timeout = 300):
+    try:
+        pages = queue_client.receive_messages(messages_per_page=max_messages, visibility_timeout=visibility_timeout).by_page()
+        return list(next(pages, []))[:max_messages]
+    except Exception as e:
+        logging.error(f"Could not retrieve queue messages: {e}")
+        return []
+
+# Hides a message for visibility_timeout more seconds
+# The message keeps the new pop receipt, which is needed for the next update or its deletion
+def update_queue_message_visibility(queue_client, message, visibility_timeout = 300):
+    try:
+        updated = queue_client.update_message(message.id, pop_receipt=message.pop_receipt, visibility_timeout=visibility_timeout)
+        message.pop_receipt = updated.pop_receipt
+        return True
+    except Exception as e:
+        logging.error(f"Could not update visibility of queue message {message.id}: {e}")
+        return False
+
 def delete_queue_message(queue_client, message):
     try:
         queue_client.delete_message(message)
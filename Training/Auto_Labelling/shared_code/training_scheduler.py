@@ -0,0 +1,160 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+import json
+import logging
+import os
+import time
+
+from .prediction_scheduler import summarize_latencies
+
+# Model status reported by the service while it is training
+TRAINING_STATUSES = ['creating', 'running']
+
+
+class TrainingScheduler(object):
+
+    """
+    Trains many Form Recognizer models at once with a Form Recognizer client.
+    At most max_trainings jobs are training at the same time (the quota of the service), the others wait for a
+    slot. A submission throttled by the service (429) is retried, and each model is polled, with an exponential
+    backoff from initial_poll to max_poll seconds (longer when the Retry-After header of the service asks so).
+    With a checkpoint file, the location of each submitted job and the trained models are saved as they come,
+    so that a run started again after a crash polls the jobs already submitted and skips the ready models.
+    """
+
+    def __init__(self, client, max_trainings=4, checkpoint_path=None, initial_poll=5.0, max_poll=60.0,
+                 timeout=3600.0, max_submit_retries=10):
+        self.client = client
+        self.max_trainings = max_trainings
+        self.checkpoint_path = checkpoint_path
+        self.initial_poll = initial_poll
+        self.max_poll = max_poll
+        self.timeout = timeout
+        self.max_submit_retries = max_submit_retries
+        self.checkpoint = self.load_checkpoint()
+        self.counters = {'jobs': 0, 'submitted': 0, 'resumed': 0, 'skipped': 0, 'ready': 0, 'invalid': 0,
+                         'failed': 0, 'throttled': 0, 'polls': 0, 'training': 0, 'max_training': 0}
+        self.training_durations = []
+
+    def load_checkpoint(self):
+        if self.checkpoint_path == None or not os.path.isfile(self.checkpoint_path):
+            return {}
+        with open(self.checkpoint_path) as checkpoint_file:
+            return json.load(checkpoint_file)
+
+    def save_checkpoint(self):
+        if self.checkpoint_path == None:
+            return
+        # Written aside and renamed, a crash while writing leaves the previous checkpoint
+        temp_path = self.checkpoint_path + '.tmp'
+        with open(temp_path, 'w') as checkpoint_file:
+            json.dump(self.checkpoint, checkpoint_file)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def get_stats(self):
+        stats = dict(self.counters)
+        stats['training_duration'] = summarize_latencies(self.training_durations)
+        return stats
+
+    def get_delay(self, headers, backoff):
+        """The backoff, or the Retry-After header of the service when it asks to wait longer"""
+        try:
+            retry_after = float(headers['Retry-After'])
+        except Exception:
+            retry_after = 0
+        return min(max(retry_after, backoff), self.max_poll)
+
+    async def _submit(self, key, source, prefix, use_label_file):
+        backoff = self.initial_poll
+        for _ in range(self.max_submit_retries + 1):
+            status, headers, text = await self.client.submit_training(source, prefix, use_label_file)
+            if status == 201:
+                return headers['Location']
+            if status != 429 and status < 500:
+                logging.error(f"Training {key} rejected ({status}): {text.decode('utf-8', 'ignore')}")
+                return None
+            self.counters['throttled'] += 1
+            await asyncio.sleep(self.get_delay(headers, backoff))
+            backoff = min(2 * backoff, self.max_poll)
+        logging.error(f"Training {key} could not be submitted after {self.max_submit_retries} retries")
+        return None
+
+    async def _wait(self, key, model_url):
+        backoff = self.initial_poll
+        deadline = time.monotonic() + self.timeout
+        while True:
+            status, headers, model = await self.client.get_model(model_url)
+            self.counters['polls'] += 1
+            if status == 200 and model['modelInfo']['status'] not in TRAINING_STATUSES:
+                return model
+            if status != 200 and status != 429 and status < 500:
+                logging.error(f"Training {key} could not be followed ({status}): {model}")
+                return None
+            if time.monotonic() > deadline:
+                logging.error(f"Training {key} did not complete within {self.timeout}s")
+                return None
+            await asyncio.sleep(self.get_delay(headers, backoff))
+            backoff = min(2 * backoff, self.max_poll)
+
+    async def _train(self, semaphore, key, source, prefix, use_label_file):
+        self.counters['jobs'] += 1
+        entry = self.checkpoint.get(key, {})
+        if 'model' in entry:
+            self.counters['skipped'] += 1
+            return entry['model']
+
+        model = None
+        async with semaphore:
+            self.counters['training'] += 1
+            self.counters['max_training'] = max(self.counters['max_training'], self.counters['training'])
+            start = time.monotonic()
+            try:
+                model_url = entry.get('location')
+                if model_url == None:
+                    model_url = await self._submit(key, source, prefix, use_label_file)
+                    if model_url != None:
+                        self.counters['submitted'] += 1
+                        self.checkpoint[key] = {'location': model_url}
+                        self.save_checkpoint()
+                else:
+                    logging.info(f"Training {key} resumed from the checkpoint")
+                    self.counters['resumed'] += 1
+                if model_url != None:
+                    model = await self._wait(key, model_url)
+            except Exception as e:
+                logging.error(f"Error training {key}: {e}")
+            finally:
+                self.counters['training'] -= 1
+                self.training_durations.append(time.monotonic() - start)
+
+        if model == None:
+            self.counters['failed'] += 1
+        else:
+            self.counters['ready' if model['modelInfo']['status'] == 'ready' else 'invalid'] += 1
+        if model != None and model['modelInfo']['status'] == 'ready':
+            self.checkpoint[key] = {'model': model}
+        else:
+            # Failed and invalid trainings are submitted again by the next run
+            self.checkpoint.pop(key, None)
+        self.save_checkpoint()
+        return model
+
+    async def train(self, jobs):
+
+        """
+        Trains models concurrently
+        :param jobs: Iterable of (key, source, prefix, use_label_file), source being the SAS url of the container
+        and key a unique name of the job (str), used in the checkpoint
+        :return: Dictionary of the model returned by the service for each key, None when the training failed
+        """
+
+        semaphore = asyncio.Semaphore(self.max_trainings)
+        jobs = list(jobs)
+        models = await asyncio.gather(
+            *[self._train(semaphore, key, source, prefix, use_label_file) for key, source, prefix, use_label_file in jobs])
+        logging.info(f"Training scheduler stats: {self.counters}")
+        return {job[0]: model for job, model in zip(jobs, models)}
@@ -0,0 +1,293 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""
+Local mock of the Form Recognizer v2.0 REST API.
+Analyze and training calls return 202/201 with an Operation-Location/Location header,
+the operation is reported as running (with a Retry-After header) until `latency` seconds
+have passed, which is enough to measure the throughput of the clients offline.
+
+Run `python tests/fr_mock_server.py` to benchmark the client against the mock, and
+`python tests/fr_mock_server.py --transfer` to compare how predicted documents are sent to the service
+(bytes transferred by the client and its peak memory for each transfer mode).
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+import uuid
+
+from aiohttp import web
+
+API = "/formrecognizer/v2.0"
+
+KEY = "mock-key"
+
+LAYOUT_RESULT = {
+    "readResults": [{
+        "page": 1,
+        "width": 8.5,
+        "height": 11,
+        "unit": "inch",
+        "lines": [{
+            "text": "Invoice 1234",
+            "boundingBox": [1, 1, 3, 1, 3, 1.5, 1, 1.5],
+            "words": [
+                {"text": "Invoice", "boundingBox": [1, 1, 2, 1, 2, 1.5, 1, 1.5]},
+                {"text": "1234", "boundingBox": [2, 1, 3, 1, 3, 1.5, 2, 1.5]}
+            ]
+        }]
+    }],
+    "pageResults": [{"page": 1, "keyValuePairs": [], "tables": []}]
+}
+
+PREDICTION_FIELDS = {
+    "Invoice number": {"text": "1234", "confidence": 0.99, "boundingBox": [2, 1, 3, 1, 3, 1.5, 2, 1.5]}
+}
+
+
+class MockFormRecognizer(object):
+
+    def __init__(self, latency=0.2, retry_after=0.05, documents=None, source_reachable=True, training_quota=None):
+        self.latency = latency
+        self.retry_after = retry_after
+        self.documents = documents if documents != None else {}
+        # False to reject the analyze requests with a source url, as when the storage is not reachable from the service
+        self.source_reachable = source_reachable
+        # Number of models that can train at the same time, the trainings above are throttled (429)
+        self.training_quota = training_quota
+        self.operations = {}
+        self.counters = {"requests": 0, "submitted": 0, "polls": 0, "connections": 0, "bytes_received": 0,
+                         "bytes_served": 0, "source_submitted": 0, "trainings": 0, "throttled": 0,
+                         "max_trainings": 0}
+        self.endpoint = None
+        self._peers = set()
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def _start(self):
+        # Form Recognizer accepts documents up to 50 MB
+        app = web.Application(middlewares=[self._count], client_max_size=50 * 1024 * 1024)
+        app.router.add_post(API + "/layout/analyze", self.submit_analyze)
+        app.router.add_get(API + "/layout/analyzeResults/{operation}", self.get_analyze_result)
+        app.router.add_post(API + "/custom/models", self.submit_training)
+        app.router.add_get(API + "/custom/models/{model_id}", self.get_model)
+        app.router.add_post(API + "/custom/models/{model_id}/analyze", self.submit_analyze)
+        app.router.add_get(API + "/custom/models/{model_id}/analyzeResults/{operation}", self.get_analyze_result)
+        app.router.add_get("/documents/{name}", self.get_document)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.endpoint = f"http://127.0.0.1:{port}"
+
+    @web.middleware
+    async def _count(self, request, handler):
+        self.counters["requests"] += 1
+        peer = request.transport.get_extra_info("peername")
+        if peer not in self._peers:
+            self._peers.add(peer)
+            self.counters["connections"] += 1
+        if request.path.startswith(API) and request.headers.get("Ocp-Apim-Subscription-Key") != KEY:
+            return web.json_response({"error": {"code": "401", "message": "Access denied"}}, status=401)
+        return await handler(request)
+
+    def document_url(self, name):
+        return f"{self.endpoint}/documents/{name}"
+
+    async def get_document(self, request):
+        name = request.match_info["name"]
+        if name not in self.documents:
+            return web.Response(status=404, text="BlobNotFound")
+        self.counters["bytes_served"] += len(self.documents[name])
+        return web.Response(body=self.documents[name], content_type="application/pdf")
+
+    async def submit_analyze(self, request):
+        if request.content_type == "application/json":
+            body = await request.read()
+            self.counters["bytes_received"] += len(body)
+            # The service downloads the document itself
+            source = json.loads(body).get("source", "")
+            if not self.source_reachable or source.split("?")[0].rsplit("/", 1)[-1] not in self.documents:
+                return web.json_response({"error": {"code": "FailedToDownloadImage"}}, status=400)
+            self.counters["source_submitted"] += 1
+        else:
+            # The document is only counted, large documents are not kept in memory
+            size = 0
+            async for chunk in request.content.iter_any():
+                size += len(chunk)
+            self.counters["bytes_received"] += size
+            if size == 0:
+                return web.json_response({"error": {"code": "InvalidImage"}}, status=400)
+        operation = str(uuid.uuid4())
+        self.operations[operation] = time.monotonic() + self.latency
+        self.counters["submitted"] += 1
+        location = f"{self.endpoint}{request.path.rsplit('/', 1)[0]}/analyzeResults/{operation}"
+        return web.Response(status=202, headers={"Operation-Location": location})
+
+    async def get_analyze_result(self, request):
+        self.counters["polls"] += 1
+        done_at = self.operations.get(request.match_info["operation"])
+        if done_at == None:
+            return web.json_response({"error": {"code": "404"}}, status=404)
+        if time.monotonic() < done_at:
+            return web.json_response({"status": "running"}, headers={"Retry-After": str(self.retry_after)})
+        result = dict(LAYOUT_RESULT)
+        if "model_id" in request.match_info:
+            result["documentResults"] = [{"docType": "custom", "fields": PREDICTION_FIELDS}]
+        return web.json_response({"status": "succeeded", "analyzeResult": result})
+
+    async def submit_training(self, request):
+        body = await request.json()
+        now = time.monotonic()
+        training = sum(1 for operation in self.operations.values() if isinstance(operation, tuple) and operation[0] > now)
+        if self.training_quota != None and training >= self.training_quota:
+            self.counters["throttled"] += 1
+            return web.json_response({"error": {"code": "429", "message": "Too many trainings"}}, status=429,
+                                     headers={"Retry-After": str(self.retry_after)})
+        model_id = str(uuid.uuid4())
+        # A prefix containing "invalid" gives an invalid model, as a folder without enough documents
+        invalid = "invalid" in body.get("sourceFilter", {}).get("prefix", "")
+        self.operations[model_id] = (now + self.latency, invalid)
+        self.counters["trainings"] += 1
+        self.counters["max_trainings"] = max(self.counters["max_trainings"], training + 1)
+        return web.Response(status=201, headers={"Location": f"{self.endpoint}{API}/custom/models/{model_id}"})
+
+    async def get_model(self, request):
+        self.counters["polls"] += 1
+        model_id = request.match_info["model_id"]
+        if model_id not in self.operations:
+            return web.json_response({"error": {"code": "1022", "message": "Model not found"}}, status=404)
+        done_at, invalid = self.operations[model_id]
+        model_info = {"modelId": model_id, "createdDateTime": "2020-01-01T00:00:00Z"}
+        if time.monotonic() < done_at:
+            model_info["status"] = "creating"
+            return web.json_response({"modelInfo": model_info}, headers={"Retry-After": str(self.retry_after)})
+        model_info["status"] = "invalid" if invalid else "ready"
+        response = {"modelInfo": model_info, "trainResult": {"averageModelAccuracy": 1.0, "fields": []}}
+        return web.json_response(response)
+
+
+def benchmark(documents=200, latency=0.5, max_in_flight=32):
+
+    """Compares one document at a time with the concurrent client against the mock"""
+
+    from shared_code.fr_client import FormRecognizerClient
+
+    async def run(server, in_flight, count):
+        async with FormRecognizerClient(None, KEY, server.endpoint, max_in_flight=in_flight) as client:
+            tasks = [client.analyze_layout(b"%PDF-mock", f"doc{i}.pdf") for i in range(count)]
+            return await asyncio.gather(*tasks)
+
+    with MockFormRecognizer(latency=latency) as server:
+        # A single request in flight behaves like the previous blocking helpers
+        start = time.monotonic()
+        asyncio.run(run(server, 1, min(documents, 20)))
+        serial = min(documents, 20) / (time.monotonic() - start)
+        server.counters["connections"] = 0
+        server._peers.clear()
+        start = time.monotonic()
+        asyncio.run(run(server, max_in_flight, documents))
+        concurrent = documents / (time.monotonic() - start)
+        print(f"Serial: {serial:.1f} docs/s")
+        print(f"Concurrent ({max_in_flight} in flight): {concurrent:.1f} docs/s, "
+              f"{server.counters['connections']} connections opened")
+
+
+def _predict_documents(endpoint, urls, transfer, max_concurrency, results):
+    # Runs in a child process so that its peak resident memory only accounts for the client
+    import os
+    import resource
+    import sys
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from shared_code.fr_client import FormRecognizerClient
+    from shared_code.prediction_scheduler import PredictionScheduler
+
+    async def run():
+        async with FormRecognizerClient(None, KEY, endpoint) as client:
+            scheduler = PredictionScheduler(client, max_concurrency)
+            documents = [(url, url, [("model", "supervised")]) for url in urls]
+            return [predictions[0] async for _, predictions in scheduler.predict(documents, transfer)]
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.monotonic()
+    predictions = asyncio.run(run())
+    elapsed = time.monotonic() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux
+    results.put((sum(1 for p in predictions if len(p.get('fields', [])) > 0), elapsed, (peak - baseline) * 1024))
+
+
+def benchmark_transfer(documents=16, size_mb=20, latency=0.5, max_concurrency=8):
+
+    """Compares the transfer modes of predictions: bytes sent and received by the client, and its peak memory"""
+
+    import multiprocessing
+    import os
+
+    context = multiprocessing.get_context("spawn")
+    files = {f"doc{i}.pdf": os.urandom(size_mb * 1024 * 1024) for i in range(documents)}
+    with MockFormRecognizer(latency=latency, documents=files) as server:
+        urls = [server.document_url(name) for name in files]
+        for transfer in ['download', 'stream', 'source']:
+            before = dict(server.counters)
+            results = context.Queue()
+            process = context.Process(target=_predict_documents,
+                                      args=(server.endpoint, urls, transfer, max_concurrency, results))
+            process.start()
+            predicted, elapsed, peak = results.get()
+            process.join()
+            transferred = (server.counters["bytes_served"] - before["bytes_served"]
+                           + server.counters["bytes_received"] - before["bytes_received"])
+            print(f"{transfer}: {predicted}/{documents} predicted in {elapsed:.1f}s, "
+                  f"{transferred / documents / 1024 ** 2:.2f} MB transferred by the client per document, "
+                  f"peak memory +{peak / 1024 ** 2:.0f} MB ({peak / documents / 1024 ** 2:.2f} MB per document)")
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    parser.add_argument("--transfer", action="store_true", help="compare the transfer modes of predictions")
+    parser.add_argument("--size-mb", type=int, default=20, help="size of the documents with --transfer")
+    args = parser.parse_args()
+    if args.transfer:
+        benchmark_transfer(args.documents, args.size_mb, args.latency, min(args.max_in_flight, args.documents))
+    else:
+        benchmark(args.documents, args.latency, args.max_in_flight)
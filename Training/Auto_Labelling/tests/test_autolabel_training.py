@@ -0,0 +1,113 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import pytest
+import os
+import sys
+import json
+import pandas as pd
+from types import SimpleNamespace
+from mock import patch
+
+# The basic implementation runs with the legacy blob storage and data lake SDKs
+pytest.importorskip("azure.storage.blob.blockblobservice")
+pytest.importorskip("azure.datalake.store")
+pytest.importorskip("cv2")
+pytest.importorskip("PIL")
+
+# The common package of the repository, before the module adds its own paths
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+import common.common
+from basic_implementation import autolabel_training
+
+class FakeBlobService:
+    """In memory container, every upload gives the blob a new etag"""
+
+    def __init__(self):
+        self.blobs = {}
+        self.downloads = []
+        self.uploads = 0
+
+    def put(self, name, content):
+        self.uploads += 1
+        self.blobs[name] = (content, f"0x{self.uploads}")
+        return SimpleNamespace(etag=self.blobs[name][1])
+
+    def list_blobs(self, container_name):
+        return [SimpleNamespace(name=name, properties=SimpleNamespace(etag=etag))
+                for name, (_, etag) in self.blobs.items()]
+
+    def get_blob_to_path(self, container_name, blob_name, file_path):
+        self.downloads.append(blob_name)
+        with open(file_path, 'wb') as out_file:
+            out_file.write(self.blobs[blob_name][0])
+
+    def create_blob_from_path(self, container_name, blob_name, file_path):
+        with open(file_path, 'rb') as in_file:
+            return self.put(blob_name, in_file.read())
+
+def label_document(file_name, key_field_names, ground_truth_df, ocr_data, pass_number, ocr_index):
+    return None, {'document': file_name, 'ocr': ocr_data}, 1
+
+@pytest.fixture
+def blob_service():
+    service = FakeBlobService()
+    service.put('Invoice_1.pdf', b'invoice 1')
+    service.put('Invoice_1.pdf.ocr.json', json.dumps({'text': 'invoice 1'}).encode('utf-8'))
+    service.put('Invoice_2.pdf', b'invoice 2')
+    return service
+
+@pytest.fixture
+def run(blob_service, tmp_path):
+    ground_truth_df = pd.DataFrame({'FILENAME': ['Invoice_1', 'Invoice_2'], 'Total': ['10', '20']})
+    pass1, pass2 = str(tmp_path / "pass1"), str(tmp_path / "pass2")
+
+    def run_autolabelling(ocr_text='invoice 2'):
+        with patch.object(autolabel_training, 'call_ocr', return_value={'text': ocr_text}) as call_ocr, \
+                patch.object(autolabel_training, 'create_training_files_for_document',
+                             side_effect=label_document) as create_training_files, \
+                patch.object(autolabel_training.Config, 'MULTI_PAGE_FIELDS', 'Total'), \
+                patch.object(autolabel_training.Config, 'LIMIT_TRAINING_SET', '10'):
+            blob_service.downloads = []
+            autolabel_training.process_folder(
+                pass1, pass2, ['Total'], '.pdf', 'en', ground_truth_df, blob_service, 'container', 'region', 'key')
+            uploaded_etags = autolabel_training.upload_blobs_to_container(blob_service, pass1, 'container', '.pdf')
+            autolabel_training.record_uploaded_blobs(autolabel_training.get_documents_folder_path(pass1),
+                                                     uploaded_etags)
+        return blob_service.downloads, call_ocr.call_count, create_training_files.call_count
+
+    return run_autolabelling, pass1
+
+@pytest.mark.autolabeltraining
+def test_rerun_after_upload_does_not_download_or_label_again(run):
+    #arrange
+    run_autolabelling, _ = run
+    run_autolabelling()
+
+    #act
+    downloads, ocr_calls, labels_created = run_autolabelling()
+
+    #assert
+    assert downloads == []
+    assert ocr_calls == 0
+    assert labels_created == 0
+
+@pytest.mark.autolabeltraining
+def test_changed_document_without_ocr_blob_is_ocred_again(run, blob_service):
+    #arrange
+    run_autolabelling, pass1 = run
+    run_autolabelling()
+    blob_service.blobs.pop('Invoice_2.pdf.ocr.json')
+    blob_service.put('Invoice_2.pdf', b'invoice 2 corrected')
+
+    #act
+    downloads, ocr_calls, labels_created = run_autolabelling('invoice 2 corrected')
+
+    #assert
+    assert downloads == ['Invoice_2.pdf']
+    assert ocr_calls == 1
+    assert labels_created == 2
+    with open(f"{pass1}/Invoice_2.pdf.labels.json") as label_file:
+        assert json.load(label_file)['ocr'] == {'text': 'invoice 2 corrected'}
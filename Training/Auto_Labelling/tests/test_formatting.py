@@ -141,6 +141,81 @@ class NormalizeTest(unittest.TestCase):
 
 
 
+@pytest.mark.formatting
+class NormalizerTest(unittest.TestCase):
+
+    values = ["2/8/20", "$3,214", "2/8/20", "Hello, world!", "2/8/20"]
+
+    def test_normalize_many(self):
+
+        normalizer = formatting.Normalizer()
+
+        # Expecting the same values as normalizing each value
+        result = normalizer.normalize_many(self.values, "date")
+
+        assert result == [formatting.normalize_value(v, "date") for v in self.values]
+
+    def test_normalize_many_when_repeated_values(self):
+
+        normalizer = formatting.Normalizer()
+
+        # Expecting repeated values to be normalized once
+        with patch('shared_code.formatting.date_format', side_effect=lambda v: v) as mock_date_format:
+            normalizer.normalize_many(self.values, "date")
+            normalizer.normalize("2/8/20", "date")
+
+        assert mock_date_format.call_count == 3
+        assert normalizer.cache_info().hits == 3
+
+    def test_normalize_date_when_day_changes(self):
+
+        normalizer = formatting.Normalizer()
+
+        # Expecting dates normalized on another day to be normalized again
+        with patch('shared_code.formatting.date_format', side_effect=lambda v: v) as mock_date_format, \
+                patch('shared_code.formatting.datetime') as mock_datetime:
+            mock_datetime.date.today.return_value = "2020-12-31"
+            normalizer.normalize("12 Jan", "date")
+            normalizer.normalize("12 Jan", "date")
+            mock_datetime.date.today.return_value = "2021-01-01"
+            normalizer.normalize("12 Jan", "date")
+
+        assert mock_date_format.call_count == 2
+
+    def test_normalize_when_unhashable_value(self):
+
+        normalizer = formatting.Normalizer()
+
+        # Expecting unhashable values to be normalized without the cache
+        result = normalizer.normalize(["a"], "text")
+
+        assert result == "['a']"
+        assert normalizer.cache_info().currsize == 0
+
+    def test_find_subtext_when_date(self):
+
+        # Expecting the date of the first matching pattern, the patterns are tried in order of priority
+        result = formatting.find_subtext(
+                "Invoice date: 12 Jan. 2020, due 2/14/2020",
+                "date")
+
+        assert result == "2/14/2020"
+
+    def test_remove_trailing_spaces_when_only_spaces(self):
+
+        # Expecting empty string
+        result = formatting.remove_trailing_spaces("    ")
+
+        assert result == ""
+
+    def test_remove_trailing_spaces_when_invalid(self):
+
+        # Expecting value to be returned as is
+        result = formatting.remove_trailing_spaces(None)
+
+        assert result == None
+
+
 @pytest.mark.formatting
 class FormatSubfieldsTest(unittest.TestCase):
 
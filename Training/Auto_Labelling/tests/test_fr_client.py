@@ -0,0 +1,167 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import pytest
+import unittest
+import asyncio
+import time
+from mock import patch
+
+from shared_code import fr_client
+from shared_code import fr_helpers
+
+from fr_mock_server import MockFormRecognizer, KEY
+
+
+@pytest.mark.frclient
+class FormRecognizerClientTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = MockFormRecognizer(latency=0.2, retry_after=0.05, documents={"doc.pdf": b"%PDF-mock"})
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def run_client(self, coro_factory, max_in_flight=16):
+        async def run():
+            async with fr_client.FormRecognizerClient(None, KEY, self.server.endpoint, max_in_flight) as client:
+                return await coro_factory(client)
+        return asyncio.run(run())
+
+    def test_analyze_layout_when_valid(self):
+
+        # Expecting the OCR result once the operation succeeded
+        result = self.run_client(lambda c: c.analyze_layout(b"%PDF-mock", "doc.pdf"))
+
+        assert result['status'] == 'succeeded'
+        assert len(result['analyzeResult']['readResults']) > 0
+
+    def test_analyze_layout_when_key_invalid(self):
+
+        # Expecting None when the request is rejected
+        async def run():
+            async with fr_client.FormRecognizerClient(None, "abcd", self.server.endpoint) as client:
+                return await client.analyze_layout(b"%PDF-mock", "doc.pdf")
+
+        assert asyncio.run(run()) == None
+
+    def test_analyze_layout_uses_retry_after(self):
+
+        # Expecting the polling interval to follow the Retry-After header (0.05s) and not the default one
+        polls_before = self.server.counters['polls']
+        self.run_client(lambda c: c.analyze_layout(b"%PDF-mock", "doc.pdf"))
+        polls = self.server.counters['polls'] - polls_before
+
+        assert polls >= 3
+
+    def test_analyze_layout_reuses_connections(self):
+
+        # Expecting documents to be analyzed concurrently over a bounded number of connections
+        connections_before = self.server.counters['connections']
+        start = time.monotonic()
+        results = self.run_client(
+            lambda c: asyncio.gather(*[c.analyze_layout(b"%PDF-mock", f"doc{i}.pdf") for i in range(40)]),
+            max_in_flight=8)
+        elapsed = time.monotonic() - start
+        connections = self.server.counters['connections'] - connections_before
+
+        assert all(r['status'] == 'succeeded' for r in results)
+        assert connections <= 8
+        assert elapsed < 40 * 0.2
+
+    def test_train_model_when_valid(self):
+
+        # Expecting the model to be ready once training is done
+        result = self.run_client(lambda c: c.train_model("https://storage/container?sas", "doctype"))
+
+        assert result['modelInfo']['status'] == 'ready'
+
+    def test_get_prediction_when_valid(self):
+
+        # Expecting supervised fields back for a valid document
+        url = self.server.document_url("doc.pdf")
+        result = self.run_client(lambda c: c.get_prediction(url, "model", "supervised"))
+
+        assert result['fields'][0]['label'] == 'Invoice number'
+        assert len(result['readResults']) > 0
+
+    def test_get_prediction_when_url_invalid(self):
+
+        # Expecting an empty prediction when the document can't be downloaded
+        url = self.server.document_url("missing.pdf")
+        result = self.run_client(lambda c: c.get_prediction(url, "model", "supervised"))
+
+        assert len(result) == 0
+
+    def test_get_prediction_when_source_url(self):
+
+        # Expecting the service to download the document, the client not to transfer it
+        url = self.server.document_url("doc.pdf")
+        served_before = self.server.counters['bytes_served']
+        submitted_before = self.server.counters['source_submitted']
+        result = self.run_client(lambda c: c.get_prediction(url, "model", "supervised"))
+
+        assert result['fields'][0]['label'] == 'Invoice number'
+        assert self.server.counters['bytes_served'] == served_before
+        assert self.server.counters['source_submitted'] == submitted_before + 1
+
+    def test_get_prediction_when_source_url_rejected(self):
+
+        # Expecting the document to be streamed once when the service can't download it
+        url = self.server.document_url("doc.pdf")
+        served_before = self.server.counters['bytes_served']
+        received_before = self.server.counters['bytes_received']
+        self.server.source_reachable = False
+        try:
+            result = self.run_client(lambda c: c.get_prediction(url, "model", "supervised"))
+        finally:
+            self.server.source_reachable = True
+
+        assert result['fields'][0]['label'] == 'Invoice number'
+        assert self.server.counters['bytes_served'] - served_before == len(b"%PDF-mock")
+        assert self.server.counters['bytes_received'] - received_before > len(b"%PDF-mock")
+
+    def test_get_prediction_when_stream(self):
+
+        # Expecting the document body to be forwarded to the analyze request
+        url = self.server.document_url("doc.pdf")
+        received_before = self.server.counters['bytes_received']
+        result = self.run_client(lambda c: c.get_prediction(url, "model", "supervised", transfer='stream'))
+
+        assert result['fields'][0]['label'] == 'Invoice number'
+        assert self.server.counters['bytes_received'] - received_before == len(b"%PDF-mock")
+
+    def test_get_prediction_when_transfer_invalid(self):
+
+        # Expecting an empty prediction when the transfer mode is unknown
+        url = self.server.document_url("doc.pdf")
+        result = self.run_client(lambda c: c.get_prediction(url, "model", "supervised", transfer='copy'))
+
+        assert len(result) == 0
+
+    def test_batch_predictions(self):
+
+        # Expecting the valid documents to be predicted, in order
+        with patch('shared_code.fr_client.get_endpoint', return_value=self.server.endpoint):
+            predictions, count_analyzed, count_total = fr_helpers.batch_predictions(
+                ["doc.pdf", "missing.pdf", "doc.pdf"], "model", self.server.endpoint, "documents", "", "batch", KEY,
+                max_in_flight=2)
+
+        assert [p['file_id'] for p in predictions] == ["doc", "doc"]
+        assert count_analyzed == 2
+        assert count_total == 3
+
+    def test_fr_helpers_share_client(self):
+
+        # Expecting the synchronous helpers to run through the shared client
+        with patch('shared_code.fr_client.get_endpoint', return_value=self.server.endpoint):
+            result = fr_helpers.analyze_layout("region", KEY, b"%PDF-mock", "doc.pdf")
+            client = fr_client.get_client("region", KEY)
+
+        assert result['status'] == 'succeeded'
+        assert fr_client.get_client("region", KEY) is client
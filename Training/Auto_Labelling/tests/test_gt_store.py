@@ -0,0 +1,98 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import pytest
+import os
+import datetime
+import pandas as pd
+from mock import patch
+
+from shared_code import gt_store
+from shared_code import utils
+
+gt_data = {
+    "FileID": ["Invoice_1", "Invoice_2", "Invoice_3"],
+    "Name": ["Contoso", "Fabrikam", "Northwind"],
+    "Total": [12.5, 100.0, 7.0],
+    "Date": [datetime.datetime(2020, 1, 2), datetime.datetime(2020, 2, 3), datetime.datetime(2020, 3, 4)]
+}
+
+@pytest.fixture
+def gt_path(tmp_path):
+    gt_store.clear()
+    path = str(tmp_path / "gt.xlsx")
+    pd.DataFrame(gt_data).to_excel(path, index=False)
+    yield path
+    gt_store.clear()
+
+@pytest.fixture
+def store(gt_path, tmp_path):
+    return gt_store.GroundTruthStore(gt_path, cache_dir=str(tmp_path / "cache"))
+
+@pytest.mark.gtstore
+def test_get_row_matches_excel(store, gt_path):
+    #arrange
+    df = utils.load_excel(gt_path)
+    expected = df.loc[df['FileID'] == "Invoice_2"].iloc[0]
+
+    #act
+    result = store.get_row("Invoice_2")
+
+    #assert
+    for col in df.columns:
+        assert str(result[col]) == str(expected[col])
+
+@pytest.mark.gtstore
+def test_get_rows_returns_empty_frame_when_unknown(store):
+    #act
+    result = store.get_rows("Invoice_42")
+
+    #assert
+    assert len(result) == 0
+    assert list(result.columns) == list(gt_data.keys())
+
+@pytest.mark.gtstore
+def test_get_row_raises_when_unknown(store):
+    #act
+    with pytest.raises(KeyError):
+        store.get_row("Invoice_42")
+
+@pytest.mark.gtstore
+def test_store_reads_workbook_once(store, gt_path, tmp_path):
+    #act
+    with patch('shared_code.utils.load_excel', wraps=utils.load_excel) as fake_load_excel:
+        for file_id in gt_data["FileID"] * 10:
+            store.get_row(file_id)
+        # A new store for the same workbook uses the parquet cache
+        other = gt_store.GroundTruthStore(gt_path, cache_dir=str(tmp_path / "cache"))
+        other.get_row("Invoice_1")
+
+    #assert
+    assert fake_load_excel.call_count == 1
+    assert os.path.isfile(store.get_cache_path())
+
+@pytest.mark.gtstore
+def test_store_refreshes_when_workbook_changes(store, gt_path):
+    #arrange
+    store.get_row("Invoice_1")
+    data = dict(gt_data, Name=["Contoso Ltd", "Fabrikam", "Northwind"])
+    pd.DataFrame(data).to_excel(gt_path, index=False)
+    stat = os.stat(gt_path)
+    os.utime(gt_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+    #act
+    result = store.get_row("Invoice_1")
+
+    #assert
+    assert result["Name"] == "Contoso Ltd"
+
+@pytest.mark.gtstore
+def test_store_is_empty_when_path_invalid(tmp_path):
+    #act
+    store = gt_store.GroundTruthStore("test", cache_dir=str(tmp_path / "cache"))
+
+    #assert
+    assert store.empty
+    assert len(store.get_rows("Invoice_1")) == 0
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import pytest
+import os
+import json
+from mock import MagicMock, patch
+
+from shared_code import lookup_registry
+from shared_code import autolabeling
+
+lookup_data = {
+    "types": {"Total": "money", "AddressCity": "city", "AddressPostalCode": "postalCode"},
+    "keys": {"Total amount": ["Total"], "Address line 2": ["AddressCity", "AddressPostalCode"], "City": ["AddressCity"]}
+}
+
+@pytest.fixture
+def lookup_file(tmp_path):
+    lookup_registry.clear()
+    path = tmp_path / "lookup_fields.json"
+    path.write_text(json.dumps(lookup_data))
+    yield str(path)
+    lookup_registry.clear()
+
+@pytest.mark.lookupregistry
+def test_get_lookup_builds_indexes(lookup_file):
+    #act
+    result = lookup_registry.get_lookup(lookup_file)
+
+    #assert
+    assert result.map_columns("Address line 2") == ["AddressCity", "AddressPostalCode"]
+    assert result.lookup_compare("AddressPostalCode") == "postalCode"
+    assert result.fields_for_column("AddressCity") == ["Address line 2", "City"]
+
+@pytest.mark.lookupregistry
+@patch('shared_code.utils.get_lookup_fields_from_file', side_effect=lambda path: lookup_data)
+def test_get_lookup_loads_file_once(fake_get_lookup_fields_from_file, lookup_file):
+    #act
+    for i in range(10):
+        autolabeling.map_columns("Total amount", lookup_file)
+        autolabeling.lookup_compare("Total", lookup_file)
+
+    #assert
+    assert fake_get_lookup_fields_from_file.call_count == 1
+
+@pytest.mark.lookupregistry
+def test_get_lookup_reloads_file_when_modified(lookup_file):
+    #arrange
+    lookup_registry.get_lookup(lookup_file)
+    new_data = dict(lookup_data, types={"Total": "text"})
+    with open(lookup_file, 'w') as f:
+        json.dump(new_data, f)
+    stat = os.stat(lookup_file)
+    os.utime(lookup_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+    #act
+    result = autolabeling.lookup_compare("Total", lookup_file)
+
+    #assert
+    assert result == "text"
+
+@pytest.mark.lookupregistry
+def test_get_lookup_returns_none_when_file_missing():
+    #act
+    result = lookup_registry.get_lookup("./missing_lookup_fields.json")
+
+    #assert
+    assert result == None
+    assert autolabeling.map_columns("Total amount", "./missing_lookup_fields.json") == []
+
+@pytest.mark.lookupregistry
+@patch('requests.get')
+def test_get_lookup_revalidates_url_with_etag(fake_requests_get):
+    #arrange
+    lookup_registry.clear()
+    url = "https://fake-url.com/lookup_fields.json"
+    first = MagicMock(status_code=200, headers={'ETag': '"v1"'})
+    first.json.return_value = lookup_data
+    not_modified = MagicMock(status_code=304, headers={})
+    fake_requests_get.side_effect = [first, not_modified]
+    registry = lookup_registry.LookupRegistry(url_ttl=0)
+
+    #act
+    result1 = registry.get(url)
+    result2 = registry.get(url)
+
+    #assert
+    assert result1 is result2
+    assert fake_requests_get.call_args[1]['headers'] == {'If-None-Match': '"v1"'}
+
+@pytest.mark.lookupregistry
+@patch('requests.get')
+def test_get_lookup_caches_url_within_ttl(fake_requests_get):
+    #arrange
+    url = "https://fake-url.com/lookup_fields.json"
+    response = MagicMock(status_code=200, headers={})
+    response.json.return_value = lookup_data
+    fake_requests_get.return_value = response
+    registry = lookup_registry.LookupRegistry(url_ttl=60)
+
+    #act
+    for i in range(5):
+        registry.get(url)
+
+    #assert
+    assert fake_requests_get.call_count == 1
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import pytest
+import unittest
+import asyncio
+import time
+
+from shared_code import fr_client
+from shared_code.prediction_scheduler import PredictionScheduler
+
+class FakeClient(object):
+
+    """Client answering after a latency given by document url, tracking the calls in progress"""
+
+    def __init__(self, latencies, default_latency=0.1):
+        self.latencies = latencies
+        self.default_latency = default_latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = []
+
+    async def get_prediction(self, blob_sas_url, model_id, predict_type, transfer='source'):
+        self.calls.append((blob_sas_url, model_id, predict_type, time.monotonic()))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latencies.get(blob_sas_url, self.default_latency))
+        finally:
+            self.in_flight -= 1
+        if blob_sas_url.startswith('missing'):
+            return {}
+        return {'fields': [{'label': model_id, 'text': blob_sas_url}]}
+
+
+def documents(urls, models=[("model", "supervised")]):
+    return [(url, url, models) for url in urls]
+
+
+def collect(scheduler, docs):
+    async def run():
+        results = []
+        async for key, predictions in scheduler.predict(docs):
+            results.append((key, predictions, time.monotonic()))
+        return results
+    return asyncio.run(run())
+
+
+@pytest.mark.predictionscheduler
+class PredictionSchedulerTest(unittest.TestCase):
+
+    def test_predict_keeps_order(self):
+
+        #arrange
+        client = FakeClient({'doc0': 0.3})
+        scheduler = PredictionScheduler(client, max_in_flight=8)
+
+        #act
+        start = time.monotonic()
+        results = collect(scheduler, documents([f"doc{i}" for i in range(8)]))
+        elapsed = time.monotonic() - start
+
+        #assert
+        assert [key for key, _, _ in results] == [f"doc{i}" for i in range(8)]
+        assert all(predictions[0]['fields'][0]['text'] == key for key, predictions, _ in results)
+        # The other documents were predicted while the first one was running
+        assert elapsed < 0.3 + 0.1
+        assert scheduler.counters['max_waiting'] > 0
+
+    def test_predict_streams_results(self):
+
+        #arrange
+        client = FakeClient({'doc3': 0.5})
+        scheduler = PredictionScheduler(client, max_in_flight=8)
+
+        #act
+        start = time.monotonic()
+        results = collect(scheduler, documents([f"doc{i}" for i in range(4)]))
+
+        #assert
+        # The first documents are yielded without waiting for the slowest one
+        assert results[0][2] - start < 0.3
+        assert results[3][2] - start >= 0.5
+
+    def test_predict_sends_all_models_at_once(self):
+
+        #arrange
+        client = FakeClient({}, default_latency=0.2)
+        scheduler = PredictionScheduler(client, max_in_flight=8)
+        models = [("model-s", "supervised"), ("model-u", "unsupervised")]
+
+        #act
+        start = time.monotonic()
+        results = collect(scheduler, documents(["doc"], models))
+        elapsed = time.monotonic() - start
+
+        #assert
+        assert [p['fields'][0]['label'] for p in results[0][1]] == ["model-s", "model-u"]
+        assert elapsed < 0.2 * 2
+
+    def test_predict_caps_calls_in_flight(self):
+
+        #arrange
+        client = FakeClient({}, default_latency=0.02)
+        scheduler = PredictionScheduler(client, max_in_flight=3, max_pending=10)
+        models = [("model-s", "supervised"), ("model-u", "unsupervised")]
+
+        #act
+        results = collect(scheduler, documents([f"doc{i}" for i in range(20)], models))
+
+        #assert
+        assert len(results) == 20
+        assert client.max_in_flight == 3
+        assert scheduler.counters['max_queued'] > 0
+
+    def test_predict_counters(self):
+
+        #arrange
+        client = FakeClient({}, default_latency=0.01)
+        scheduler = PredictionScheduler(client, max_in_flight=4)
+
+        #act
+        collect(scheduler, documents(["doc0", "missing1", "doc2"]))
+        stats = scheduler.get_stats()
+
+        #assert
+        assert stats['documents'] == 3
+        assert stats['calls'] == 3
+        assert stats['failed'] == 1
+        assert stats['queued'] == 0 and stats['in_flight'] == 0
+        assert stats['call_latency']['count'] == 3
+        assert stats['document_latency']['max'] >= 0.01
+
+    def test_predict_when_consumer_stops(self):
+
+        #arrange
+        client = FakeClient({}, default_latency=0.05)
+        scheduler = PredictionScheduler(client, max_in_flight=2, max_pending=4)
+
+        #act
+        iterator = fr_client.iterate_sync(scheduler.predict(documents([f"doc{i}" for i in range(50)])))
+        first = next(iterator)
+        iterator.close()
+        time.sleep(0.1)
+
+        #assert
+        # The documents started ahead are cancelled, no other document is started
+        assert first[0] == "doc0"
+        assert len(client.calls) <= 1 + 4
+        assert client.in_flight == 0
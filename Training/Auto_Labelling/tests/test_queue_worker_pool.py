@@ -0,0 +1,157 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import pytest
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+from services.queue_worker_pool import QueueWorkerPool
+
+class InMemoryQueue(object):
+
+    """Queue client keeping messages in memory, with visibility timeouts and pop receipts"""
+
+    def __init__(self, contents):
+        self.lock = threading.Lock()
+        self.messages = {}
+        for content in contents:
+            message_id = str(uuid.uuid4())
+            self.messages[message_id] = {'content': content, 'visible_at': 0, 'pop_receipt': None, 'dequeue_count': 0}
+        self.receive_calls = 0
+        self.updates = 0
+
+    def receive_messages(self, messages_per_page=None, visibility_timeout=None):
+        with self.lock:
+            self.receive_calls += 1
+            now = time.monotonic()
+            batch = []
+            for message_id, m in self.messages.items():
+                if len(batch) == messages_per_page:
+                    break
+                if m['visible_at'] <= now:
+                    m['visible_at'] = now + visibility_timeout
+                    m['pop_receipt'] = str(uuid.uuid4())
+                    m['dequeue_count'] += 1
+                    batch.append(SimpleNamespace(id=message_id, content=m['content'], pop_receipt=m['pop_receipt'], dequeue_count=m['dequeue_count']))
+        return SimpleNamespace(by_page=lambda: iter([batch]))
+
+    def update_message(self, message_id, pop_receipt=None, visibility_timeout=None):
+        with self.lock:
+            m = self.messages[message_id]
+            assert m['pop_receipt'] == pop_receipt
+            self.updates += 1
+            m['visible_at'] = time.monotonic() + visibility_timeout
+            m['pop_receipt'] = str(uuid.uuid4())
+            return SimpleNamespace(pop_receipt=m['pop_receipt'])
+
+    def delete_message(self, message):
+        with self.lock:
+            assert self.messages[message.id]['pop_receipt'] == message.pop_receipt
+            del self.messages[message.id]
+
+@pytest.mark.queueworkers
+def test_worker_pool_processes_documents_concurrently():
+    #arrange
+    queue = InMemoryQueue([f"doctype/train/doc{i}.pdf" for i in range(16)])
+    processed = []
+    def handler(blob_name):
+        time.sleep(0.2)
+        processed.append(blob_name)
+    pool = QueueWorkerPool(queue, handler, workers=8, poll_interval=0.01)
+
+    #act
+    start = time.monotonic()
+    counters = pool.run()
+    elapsed = time.monotonic() - start
+
+    #assert
+    assert sorted(processed) == sorted(f"doctype/train/doc{i}.pdf" for i in range(16))
+    assert counters['processed'] == 16
+    assert len(queue.messages) == 0
+    assert elapsed < 16 * 0.2 / 2
+
+@pytest.mark.queueworkers
+def test_worker_pool_calls_the_queue_outside_of_its_lock():
+    #arrange
+    queue = InMemoryQueue(["doctype/train/slow.pdf", "doctype/train/fast.pdf"])
+    slow_started, fast_deleted = threading.Event(), threading.Event()
+    waited = []
+    delete_message = queue.delete_message
+    def slow_delete(message):
+        # The slow deletion starts first and waits for the other worker's one
+        if queue.messages[message.id]['content'] == "doctype/train/slow.pdf":
+            slow_started.set()
+            waited.append(fast_deleted.wait(2))
+        else:
+            waited.append(slow_started.wait(2))
+            fast_deleted.set()
+        delete_message(message)
+    queue.delete_message = slow_delete
+    handled = threading.Barrier(2)
+    pool = QueueWorkerPool(queue, lambda blob_name: handled.wait(2), workers=2, renew_interval=0.01, poll_interval=0.01)
+
+    #act
+    counters = pool.run()
+
+    #assert
+    assert waited == [True, True]
+    assert counters['processed'] == 2
+    assert len(queue.messages) == 0
+
+@pytest.mark.queueworkers
+def test_worker_pool_extends_visibility_of_long_jobs():
+    #arrange
+    queue = InMemoryQueue(["doctype/train/doc.pdf"])
+    pool = QueueWorkerPool(queue, lambda blob_name: time.sleep(0.5), workers=2, visibility_timeout=1, renew_interval=0.1, poll_interval=0.01)
+
+    #act
+    counters = pool.run()
+
+    #assert
+    assert counters['extended'] >= 2
+    assert counters['processed'] == 1
+    assert len(queue.messages) == 0
+
+@pytest.mark.queueworkers
+def test_worker_pool_retries_then_discards_failing_messages():
+    #arrange
+    queue = InMemoryQueue(["doctype/train/doc.pdf"])
+    attempts = []
+    def handler(blob_name):
+        attempts.append(blob_name)
+        raise Exception("OCR failed")
+    pool = QueueWorkerPool(queue, handler, workers=2, max_dequeue_count=3, poll_interval=0.01)
+
+    #act
+    counters = pool.run()
+
+    #assert
+    assert len(attempts) == 3
+    assert counters['failed'] == 3
+    assert counters['discarded'] == 1
+    assert len(queue.messages) == 0
+
+@pytest.mark.queueworkers
+def test_worker_pool_drains_on_stop():
+    #arrange
+    queue = InMemoryQueue([f"doctype/train/doc{i}.pdf" for i in range(10)])
+    started = threading.Event()
+    def handler(blob_name):
+        started.set()
+        time.sleep(0.3)
+    pool = QueueWorkerPool(queue, handler, workers=4, poll_interval=0.01)
+    thread = threading.Thread(target=pool.run)
+
+    #act
+    thread.start()
+    started.wait()
+    pool.stop()
+    thread.join()
+
+    #assert
+    assert pool.counters['processed'] == 4
+    assert len(queue.messages) == 6
@@ -0,0 +1,170 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import os
+import uuid
+import pytest
+from mock import MagicMock, patch
+
+from azure.storage.blob import BlobServiceClient
+
+from shared_code import storage_helpers
+
+# Azurite well-known development account, override with AZURITE_CONNECTION_STRING
+AZURITE_CONNECTION_STRING = os.environ.get('AZURITE_CONNECTION_STRING',
+    "DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;"
+    "AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;"
+    "BlobEndpoint=http://127.0.0.1:10000/devstoreaccount1;")
+
+def make_container_client(account_name):
+    container_client = MagicMock()
+    container_client.account_name = account_name
+    container_client.get_blob_client.side_effect = lambda name: MagicMock(url=f"https://{account_name}/container/{name}?sas")
+    return container_client
+
+def get_azurite_service():
+    try:
+        service = BlobServiceClient.from_connection_string(AZURITE_CONNECTION_STRING, connection_timeout=2, retry_total=0)
+        service.get_service_properties()
+        return service
+    except Exception:
+        return None
+
+@pytest.mark.storagehelpers
+def test_copy_folder_same_account_is_server_side():
+    #arrange
+    blobs = ["doctype/train/a.pdf", "doctype/train/b.pdf"]
+    container_client = make_container_client("account")
+    dest_blob_clients = {}
+    def get_blob_client(name):
+        client = dest_blob_clients[name] = MagicMock(url=f"https://account/container/{name}?sas")
+        client.start_copy_from_url.return_value = {'copy_status': 'success'}
+        return client
+    container_client.get_blob_client.side_effect = get_blob_client
+
+    #act
+    with patch('shared_code.storage_helpers.list_blobs', return_value=blobs), patch('shared_code.storage_helpers.delete_folder'):
+        copied, failed = storage_helpers.copy_folder(container_client, "doctype/train", "doctype/backup")
+
+    #assert
+    assert sorted(copied) == blobs
+    assert failed == []
+    dest_blob_clients["doctype/backup/a.pdf"].start_copy_from_url.assert_called_once_with("https://account/container/doctype/train/a.pdf?sas")
+    container_client.download_blob.assert_not_called()
+
+@pytest.mark.storagehelpers
+def test_copy_folder_tracks_pending_copies_and_retries_failures():
+    #arrange
+    blobs = ["doctype/train/a.pdf", "doctype/train/b.pdf"]
+    container_client = make_container_client("account")
+    attempts = {}
+    def get_blob_client(name):
+        client = MagicMock()
+        attempts[name] = attempts.get(name, 0) + 1
+        client.start_copy_from_url.return_value = {'copy_status': 'pending'}
+        # b.pdf fails once then succeeds, a.pdf is pending for one poll
+        if name.endswith("b.pdf") and attempts[name] == 1:
+            statuses = ['failed']
+        else:
+            statuses = ['pending', 'success']
+        client.get_blob_properties.side_effect = [MagicMock(copy=MagicMock(status=s)) for s in statuses]
+        return client
+    container_client.get_blob_client.side_effect = get_blob_client
+
+    #act
+    with patch('shared_code.storage_helpers.list_blobs', return_value=blobs), patch('shared_code.storage_helpers.delete_folder'):
+        copied, failed = storage_helpers.copy_folder(container_client, "doctype/train", "doctype/backup", poll_interval=0)
+
+    #assert
+    assert sorted(copied) == blobs
+    assert failed == []
+    assert attempts["doctype/backup/b.pdf"] == 2
+
+@pytest.mark.storagehelpers
+def test_copy_folder_aborts_copies_pending_after_timeout():
+    #arrange
+    blobs = ["doctype/train/a.pdf"]
+    container_client = make_container_client("account")
+    dest_blob_clients = []
+    def get_blob_client(name):
+        client = MagicMock(url=f"https://account/container/{name}?sas")
+        client.start_copy_from_url.return_value = {'copy_status': 'pending', 'copy_id': f"copy-{len(dest_blob_clients)}"}
+        client.get_blob_properties.return_value = MagicMock(copy=MagicMock(status='pending'))
+        if name.startswith("doctype/backup/"):
+            dest_blob_clients.append(client)
+        return client
+    container_client.get_blob_client.side_effect = get_blob_client
+
+    #act
+    with patch('shared_code.storage_helpers.list_blobs', return_value=blobs), patch('shared_code.storage_helpers.delete_folder'):
+        copied, failed = storage_helpers.copy_folder(container_client, "doctype/train", "doctype/backup", max_retries=2,
+            poll_interval=0, copy_timeout=0.05)
+
+    #assert
+    assert copied == []
+    assert failed == blobs
+    assert [client.abort_copy.call_args.args[0] for client in dest_blob_clients] == ["copy-0", "copy-1"]
+
+@pytest.mark.storagehelpers
+def test_copy_folder_gives_up_after_max_retries():
+    #arrange
+    blobs = ["doctype/train/a.pdf"]
+    container_client = make_container_client("account")
+    dest_blob_client = MagicMock()
+    dest_blob_client.start_copy_from_url.side_effect = Exception("copy failed")
+    container_client.get_blob_client.side_effect = lambda name: dest_blob_client
+
+    #act
+    with patch('shared_code.storage_helpers.list_blobs', return_value=blobs), patch('shared_code.storage_helpers.delete_folder'):
+        copied, failed = storage_helpers.copy_folder(container_client, "doctype/train", "doctype/backup", max_retries=3)
+
+    #assert
+    assert copied == []
+    assert failed == blobs
+    assert dest_blob_client.start_copy_from_url.call_count == 3
+
+@pytest.mark.storagehelpers
+def test_copy_folder_other_account_streams_blobs():
+    #arrange
+    blobs = ["doctype/train/a.pdf"]
+    container_client = make_container_client("source")
+    dest_container_client = make_container_client("destination")
+    container_client.download_blob.return_value.chunks.return_value = iter([b"abc", b"def"])
+    container_client.download_blob.return_value.size = 6
+
+    #act
+    with patch('shared_code.storage_helpers.list_blobs', return_value=blobs), patch('shared_code.storage_helpers.delete_folder'):
+        copied, failed = storage_helpers.copy_folder(container_client, "doctype/train", "doctype/train", dest_container_client=dest_container_client)
+
+    #assert
+    assert copied == blobs
+    dest_container_client.upload_blob.assert_called_once()
+    assert dest_container_client.upload_blob.call_args.kwargs['name'] == "doctype/train/a.pdf"
+    assert dest_container_client.upload_blob.call_args.kwargs['length'] == 6
+    dest_container_client.get_blob_client.return_value.start_copy_from_url.assert_not_called()
+
+@pytest.mark.storagehelpers
+def test_copy_folder_with_azurite():
+    #arrange
+    service = get_azurite_service()
+    if service == None:
+        pytest.skip("Azurite is not running (start it with `azurite-blob` or set AZURITE_CONNECTION_STRING)")
+    container_client = service.create_container(f"test-copy-{uuid.uuid4().hex[:8]}")
+    try:
+        for i in range(20):
+            container_client.upload_blob(f"doctype/train/doc{i}.pdf", os.urandom(1024))
+        container_client.upload_blob("doctype/backup/stale.pdf", b"stale")
+
+        #act
+        copied, failed = storage_helpers.copy_folder(container_client, "doctype/train", "doctype/backup")
+
+        #assert
+        assert len(copied) == 20
+        assert failed == []
+        backup = sorted(b.name for b in container_client.list_blobs(name_starts_with="doctype/backup/"))
+        assert backup == sorted(f"doctype/backup/doc{i}.pdf" for i in range(20))
+        assert container_client.download_blob("doctype/backup/doc3.pdf").readall() == container_client.download_blob("doctype/train/doc3.pdf").readall()
+    finally:
+        container_client.delete_container()
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import pytest
+import os
+import json
+from mock import MagicMock
+
+from azure.storage.blob import BlobPrefix, BlobProperties
+
+from shared_code import storage_helpers
+from services.trigger_processor import TriggerProcessor
+
+def make_blob(name, size=10, etag="0x1"):
+    blob = BlobProperties(name=name)
+    blob.size = size
+    blob.etag = etag
+    return blob
+
+def make_container_client(pages):
+    container_client = MagicMock()
+    container_client.list_blobs.return_value.by_page.return_value = pages
+    container_client.walk_blobs.return_value.by_page.return_value = pages
+    return container_client
+
+@pytest.mark.storagehelpers
+def test_list_blobs_pushes_prefix_and_delimiter_to_service():
+    #arrange
+    pages = [[make_blob("doctype/train/a.pdf"), BlobPrefix(prefix="doctype/train/sub/")], [make_blob("doctype/train/b.pdf")]]
+    container_client = make_container_client(pages)
+
+    #act
+    result = storage_helpers.list_blobs(container_client, "doctype/train")
+
+    #assert
+    container_client.walk_blobs.assert_called_once_with(name_starts_with="doctype/train/", delimiter='/', results_per_page=5000)
+    assert result == ["doctype/train/a.pdf", "doctype/train/b.pdf"]
+
+@pytest.mark.storagehelpers
+def test_list_blobs_filters_extension_and_empty_blobs():
+    #arrange
+    pages = [[make_blob("doctype/train/a.pdf"), make_blob("doctype/train/a.pdf.ocr.json"), make_blob("doctype/train/empty.pdf", 0)]]
+    container_client = make_container_client(pages)
+
+    #act
+    result = storage_helpers.list_blobs(container_client, "doctype/train")
+    result_all = storage_helpers.list_blobs(container_client, "doctype/train", True)
+
+    #assert
+    assert result == ["doctype/train/a.pdf"]
+    assert result_all == ["doctype/train/a.pdf", "doctype/train/a.pdf.ocr.json"]
+
+@pytest.mark.storagehelpers
+def test_list_blobs_recursive_uses_prefix_without_delimiter():
+    #arrange
+    pages = [[make_blob("doctype/train/a.pdf"), make_blob("doctype/train/sub/b.pdf")]]
+    container_client = make_container_client(pages)
+
+    #act
+    result = storage_helpers.list_blobs(container_client, "doctype/train", False, True)
+
+    #assert
+    container_client.list_blobs.assert_called_once_with(name_starts_with="doctype/train", results_per_page=5000)
+    assert result == ["doctype/train/a.pdf", "doctype/train/sub/b.pdf"]
+
+@pytest.mark.storagehelpers
+def test_list_doctype_folders_uses_delimiter():
+    #arrange
+    container_client = MagicMock()
+    container_client.walk_blobs.return_value = [BlobPrefix(prefix="invoices/"), BlobPrefix(prefix="receipts/"), make_blob("readme.txt")]
+
+    #act
+    result = storage_helpers.list_doctype_folders(container_client)
+
+    #assert
+    container_client.walk_blobs.assert_called_once_with(delimiter='/')
+    assert result == ["invoices", "receipts"]
+
+@pytest.mark.storagehelpers
+def test_list_changed_blobs_returns_only_new_and_modified(tmp_path):
+    #arrange
+    snapshot_path = str(tmp_path / "snapshot.json")
+    first = make_container_client([[make_blob("doctype/train/a.pdf", etag="1"), make_blob("doctype/train/b.pdf", etag="1")]])
+    second = make_container_client([[make_blob("doctype/train/a.pdf", etag="1"), make_blob("doctype/train/b.pdf", etag="2"), make_blob("doctype/train/c.pdf", etag="1")]])
+    third = make_container_client([[make_blob("doctype/train/c.pdf", etag="1")]])
+
+    #act
+    changed1, _, snapshot1 = storage_helpers.list_changed_blobs(first, "doctype/train", snapshot_path)
+    storage_helpers.save_listing_snapshot(snapshot_path, snapshot1)
+    changed2, _, snapshot2 = storage_helpers.list_changed_blobs(second, "doctype/train", snapshot_path)
+    storage_helpers.save_listing_snapshot(snapshot_path, snapshot2)
+    changed3, removed3, snapshot3 = storage_helpers.list_changed_blobs(third, "doctype/train", snapshot_path)
+
+    #assert
+    assert changed1 == ["doctype/train/a.pdf", "doctype/train/b.pdf"]
+    assert changed2 == ["doctype/train/b.pdf", "doctype/train/c.pdf"]
+    assert changed3 == []
+    assert removed3 == ["doctype/train/a.pdf", "doctype/train/b.pdf"]
+    assert snapshot3 == {"doctype/train": {"doctype/train/c.pdf": "1"}}
+    with open(snapshot_path) as f:
+        assert json.load(f) == snapshot2
+
+@pytest.mark.storagehelpers
+def test_list_changed_blobs_keeps_snapshot_when_listing_fails(tmp_path):
+    #arrange
+    snapshot_path = str(tmp_path / "snapshot.json")
+    container_client = MagicMock()
+    container_client.walk_blobs.side_effect = Exception("listing failed")
+
+    #act
+    changed, removed, snapshot = storage_helpers.list_changed_blobs(container_client, "doctype/train", snapshot_path)
+
+    #assert
+    assert changed == None
+    assert snapshot == None
+    assert not os.path.exists(snapshot_path)
+
+def make_trigger_processor(container_client):
+    processor = TriggerProcessor.__new__(TriggerProcessor)
+    processor.container_client = container_client
+    processor.table_service = MagicMock()
+    processor.sync_status = MagicMock(return_value={'failed': 0})
+    return processor
+
+@pytest.mark.storagehelpers
+def test_trigger_saves_snapshot_only_once_blobs_are_queued(tmp_path):
+    #arrange
+    snapshot_path = str(tmp_path / "snapshot.json")
+    processor = make_trigger_processor(make_container_client([[make_blob("doctype/train/a.pdf", etag="1")]]))
+    queue = MagicMock()
+    queue.set.side_effect = [Exception("queue not found"), None]
+
+    #act
+    processor.run("doctype", "new", queue, True, snapshot_path)
+    saved_after_failure = os.path.exists(snapshot_path)
+    processor.run("doctype", "new", queue, True, snapshot_path)
+
+    #assert
+    assert not saved_after_failure
+    assert [c.args[0] for c in queue.set.call_args_list] == [["doctype/train/a.pdf"], ["doctype/train/a.pdf"]]
+    with open(snapshot_path) as f:
+        assert json.load(f) == {"doctype/train": {"doctype/train/a.pdf": "1"}}
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import pytest
+from collections import namedtuple
+from mock import MagicMock
+
+from azure.cosmosdb.table.models import Entity
+
+from shared_code import storage_helpers
+from services.trigger_processor import TriggerProcessor
+
+def make_entity(row_key, status):
+    entity = Entity()
+    entity.PartitionKey = "doctype"
+    entity.RowKey = row_key
+    entity.status = status
+    return entity
+
+def make_page(entities, next_marker=None):
+    page = MagicMock()
+    page.__iter__.return_value = iter(entities)
+    page.next_marker = next_marker
+    return page
+
+def make_trigger_processor():
+    processor = TriggerProcessor.__new__(TriggerProcessor)
+    processor.app_settings = namedtuple('AppSettings', 'status_table')(status_table="status")
+    return processor
+
+@pytest.mark.storagehelpers
+def test_query_partition_status_follows_pages():
+    #arrange
+    table_service = MagicMock()
+    table_service.query_entities.side_effect = [
+        make_page([make_entity("a.pdf", "done")], {'nextrowkey': 'b'}),
+        make_page([make_entity("b.pdf", "ocr-done")])]
+
+    #act
+    statuses, round_trips = storage_helpers.query_partition_status(table_service, "status", "doctype")
+
+    #assert
+    assert statuses == {"a.pdf": "done", "b.pdf": "ocr-done"}
+    assert round_trips == 2
+    assert table_service.query_entities.call_args.kwargs['marker'] == {'nextrowkey': 'b'}
+
+@pytest.mark.storagehelpers
+def test_query_partition_status_escapes_quotes():
+    #arrange
+    table_service = MagicMock()
+    table_service.query_entities.return_value = make_page([])
+
+    #act
+    storage_helpers.query_partition_status(table_service, "status", "o'brien")
+
+    #assert
+    assert table_service.query_entities.call_args.kwargs['filter'] == "PartitionKey eq 'o''brien'"
+
+@pytest.mark.storagehelpers
+def test_query_partition_status_when_query_fails():
+    #arrange
+    table_service = MagicMock()
+    table_service.query_entities.side_effect = Exception("table not found")
+
+    #act
+    statuses, _ = storage_helpers.query_partition_status(table_service, "status", "doctype")
+
+    #assert
+    assert statuses == None
+
+@pytest.mark.storagehelpers
+def test_insert_or_replace_entities_groups_by_partition_in_batches_of_100():
+    #arrange
+    table_service = MagicMock()
+    entities = [{'PartitionKey': 'a', 'RowKey': str(i), 'status': 'new'} for i in range(250)]
+    entities += [{'PartitionKey': 'b', 'RowKey': '0', 'status': 'new'}, {'PartitionKey': 'b', 'RowKey': '0', 'status': 'done'}]
+
+    #act
+    failed, round_trips = storage_helpers.insert_or_replace_entities(table_service, "status", entities)
+
+    #assert
+    assert failed == []
+    assert round_trips == 4
+    batches = [c.args[1] for c in table_service.commit_batch.call_args_list]
+    assert [len(b._requests) for b in batches] == [100, 100, 50, 1]
+    assert batches[3]._partition_key == 'b'
+
+@pytest.mark.storagehelpers
+def test_insert_or_replace_entities_falls_back_to_single_writes():
+    #arrange
+    table_service = MagicMock()
+    table_service.commit_batch.side_effect = Exception("batch failed")
+    table_service.insert_or_replace_entity.side_effect = [None, Exception("invalid entity")]
+    entities = [{'PartitionKey': 'a', 'RowKey': '0', 'status': 'new'}, {'PartitionKey': 'a', 'RowKey': '1', 'status': 'new'}]
+
+    #act
+    failed, round_trips = storage_helpers.insert_or_replace_entities(table_service, "status", entities)
+
+    #assert
+    assert failed == [entities[1]]
+    assert round_trips == 3
+
+@pytest.mark.storagehelpers
+def test_sync_status_keeps_current_status_with_one_query():
+    #arrange
+    processor = make_trigger_processor()
+    table_service = MagicMock()
+    table_service.query_entities.return_value = make_page([make_entity("a.pdf", "done")])
+    blobs = [f"doctype/train/{name}" for name in ["a.pdf", "b.pdf", "c.pdf"]]
+
+    #act
+    stats = processor.sync_status(blobs, 'keep', table_service)
+
+    #assert
+    table_service.get_entity.assert_not_called()
+    table_service.query_entities.assert_called_once()
+    batch = table_service.commit_batch.call_args.args[1]
+    assert [request[0] for request in batch._requests] == ["a.pdf", "b.pdf", "c.pdf"]
+    assert stats == {'documents': 3, 'failed': 0, 'round_trips': 2, 'round_trips_saved': 4}
@@ -0,0 +1,178 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import pytest
+import unittest
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from shared_code import fr_client
+from shared_code.training_scheduler import TrainingScheduler
+
+from fr_mock_server import MockFormRecognizer, KEY
+
+SOURCE = "https://storage/container?sas"
+
+
+def jobs(prefixes):
+    return [(prefix, SOURCE, prefix, False) for prefix in prefixes]
+
+
+@pytest.mark.trainingscheduler
+class TrainingSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = None
+        self.folder = tempfile.TemporaryDirectory()
+        self.checkpoint_path = os.path.join(self.folder.name, "checkpoint.json")
+
+    def tearDown(self):
+        if self.server != None:
+            self.server.stop()
+        self.folder.cleanup()
+
+    def start_server(self, **kwargs):
+        self.server = MockFormRecognizer(latency=0.3, retry_after=0.02, **kwargs)
+        self.server.start()
+
+    def train(self, prefixes, key=KEY, **kwargs):
+        kwargs.setdefault('initial_poll', 0.02)
+        kwargs.setdefault('max_poll', 0.1)
+
+        async def run():
+            async with fr_client.FormRecognizerClient(None, key, self.server.endpoint) as client:
+                scheduler = TrainingScheduler(client, **kwargs)
+                models = await scheduler.train(jobs(prefixes))
+                return scheduler, models
+        return asyncio.run(run())
+
+    def test_train_runs_jobs_concurrently(self):
+
+        #arrange
+        self.start_server()
+
+        #act
+        start = time.monotonic()
+        scheduler, models = self.train([f"folder{i}" for i in range(8)], max_trainings=8)
+        elapsed = time.monotonic() - start
+
+        #assert
+        assert list(models.keys()) == [f"folder{i}" for i in range(8)]
+        assert all(model['modelInfo']['status'] == 'ready' for model in models.values())
+        # About as long as a single training
+        assert elapsed < 0.3 * 2
+        assert self.server.counters['max_trainings'] == 8
+        assert scheduler.get_stats()['ready'] == 8
+
+    def test_train_respects_quota(self):
+
+        #arrange
+        self.start_server()
+
+        #act
+        scheduler, models = self.train([f"folder{i}" for i in range(7)], max_trainings=3)
+
+        #assert
+        assert all(model['modelInfo']['status'] == 'ready' for model in models.values())
+        assert self.server.counters['max_trainings'] == 3
+        assert self.server.counters['throttled'] == 0
+        assert scheduler.counters['max_training'] == 3
+
+    def test_train_when_throttled(self):
+
+        #arrange
+        self.start_server(training_quota=2)
+
+        #act
+        scheduler, models = self.train([f"folder{i}" for i in range(5)], max_trainings=4)
+
+        #assert
+        assert all(model['modelInfo']['status'] == 'ready' for model in models.values())
+        assert self.server.counters['max_trainings'] == 2
+        assert scheduler.counters['throttled'] > 0
+
+    def test_train_when_model_invalid(self):
+
+        #arrange
+        self.start_server()
+
+        #act
+        scheduler, models = self.train(["folder", "invalid-folder"])
+
+        #assert
+        assert models["folder"]['modelInfo']['status'] == 'ready'
+        assert models["invalid-folder"]['modelInfo']['status'] == 'invalid'
+        assert scheduler.counters['ready'] == 1 and scheduler.counters['invalid'] == 1
+
+    def test_train_when_model_invalid_submits_it_again(self):
+
+        #arrange
+        self.start_server()
+        self.train(["folder", "invalid-folder"], checkpoint_path=self.checkpoint_path)
+
+        #act
+        scheduler, models = self.train(["folder", "invalid-folder"], checkpoint_path=self.checkpoint_path)
+
+        #assert
+        assert scheduler.counters['skipped'] == 1 and scheduler.counters['submitted'] == 1
+        assert models["invalid-folder"]['modelInfo']['status'] == 'invalid'
+        assert self.server.counters['trainings'] == 3
+        with open(self.checkpoint_path) as checkpoint_file:
+            assert list(json.load(checkpoint_file)) == ["folder"]
+
+    def test_train_when_key_invalid(self):
+
+        #arrange
+        self.start_server()
+
+        #act
+        scheduler, models = self.train(["folder"], key="abcd", checkpoint_path=self.checkpoint_path)
+
+        #assert
+        assert models["folder"] == None
+        assert scheduler.counters['failed'] == 1
+        with open(self.checkpoint_path) as checkpoint_file:
+            assert json.load(checkpoint_file) == {}
+
+    def test_train_skips_models_in_checkpoint(self):
+
+        #arrange
+        self.start_server()
+        _, first_models = self.train(["folder0", "folder1"], checkpoint_path=self.checkpoint_path)
+
+        #act
+        scheduler, models = self.train(["folder0", "folder1", "folder2"], checkpoint_path=self.checkpoint_path)
+
+        #assert
+        assert scheduler.counters['skipped'] == 2 and scheduler.counters['submitted'] == 1
+        assert models["folder0"] == first_models["folder0"]
+        assert self.server.counters['trainings'] == 3
+
+    def test_train_resumes_submitted_jobs(self):
+
+        #arrange
+        # A previous run crashed once the training was submitted
+        self.start_server()
+
+        async def submit():
+            async with fr_client.FormRecognizerClient(None, KEY, self.server.endpoint) as client:
+                return await client.submit_training(SOURCE, "folder0", False)
+
+        _, headers, _ = asyncio.run(submit())
+        with open(self.checkpoint_path, 'w') as checkpoint_file:
+            json.dump({"folder0": {"location": headers['Location']}}, checkpoint_file)
+
+        #act
+        scheduler, models = self.train(["folder0"], checkpoint_path=self.checkpoint_path)
+
+        #assert
+        assert models["folder0"]['modelInfo']['modelId'] in headers['Location']
+        assert scheduler.counters['resumed'] == 1 and scheduler.counters['submitted'] == 0
+        assert self.server.counters['trainings'] == 1
+        with open(self.checkpoint_path) as checkpoint_file:
+            assert json.load(checkpoint_file)["folder0"]['model'] == models["folder0"]
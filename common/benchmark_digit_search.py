@@ -0,0 +1,103 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""
+Benchmark of the digit fuzzy matching used to find Iban and VAT numbers in invoices.
+Synthetic numbers, of the lengths handled by iban_patterns and vat_patterns, are searched in synthetic digit
+streams where they appear with OCR errors (substituted, dropped or duplicated digits) or not at all. The former
+implementation, scoring every slice of the stream with fuzzywuzzy, is compared with the bit-parallel scan for
+speed and agreement. Both make the same decisions when fuzzywuzzy runs with python-Levenshtein (the fuzz.ratio
+of the pure-python SequenceMatcher fallback can be lower).
+
+From the root of the repository:
+    python -m common.benchmark_digit_search --invoices 200 --issuers 50
+"""
+
+import argparse
+import random
+import re
+import time
+
+from fuzzywuzzy import fuzz, process  # type:ignore
+
+from .digit_search import digit_similarity
+
+
+def reference_fuzzy_digit_matching(identifier, digit_block_text):
+    """The former implementation of common.fuzzy_digit_matching"""
+    cleanidentifier = re.sub("[^0-9]", "", identifier)
+    slices = [digit_block_text[i:i + len(cleanidentifier)] for i in range(0, len(digit_block_text))]
+    if len(slices) == 0:
+        return False
+    highest = process.extractOne(cleanidentifier, slices, scorer=fuzz.ratio)
+    return highest[1] > 75
+
+
+def fuzzy_digit_matching(identifier, digit_block_text):
+    return digit_similarity(re.sub("[^0-9]", "", identifier), digit_block_text) > 75
+
+
+def random_digits(rng, length):
+    return ''.join(rng.choice('0123456789') for _ in range(length))
+
+
+def add_ocr_errors(rng, digits, errors):
+    digits = list(digits)
+    for _ in range(errors):
+        i = rng.randrange(len(digits))
+        kind = rng.choice(['substitute', 'drop', 'duplicate'])
+        if kind == 'substitute':
+            digits[i] = rng.choice('0123456789')
+        elif kind == 'drop':
+            del digits[i]
+        else:
+            digits.insert(i, digits[i])
+    return ''.join(digits)
+
+
+def make_dataset(rng, invoices, issuers):
+    identifiers = [random_digits(rng, rng.choice([6, 7, 9, 11])) for _ in range(issuers)]
+    texts = []
+    for _ in range(invoices):
+        # Dates, amounts, phone numbers... and sometimes the numbers of an issuer with OCR errors
+        parts = [random_digits(rng, rng.randint(2, 10)) for _ in range(rng.randint(10, 30))]
+        if rng.random() < 0.7:
+            identifier = rng.choice(identifiers)
+            parts.insert(rng.randrange(len(parts)), add_ocr_errors(rng, identifier, rng.randint(0, 3)))
+        texts.append(''.join(parts))
+    return identifiers, texts
+
+
+def run(function, identifiers, texts):
+    start = time.perf_counter()
+    results = [function(identifier, text) for text in texts for identifier in identifiers]
+    return results, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invoices", type=int, default=200)
+    parser.add_argument("--issuers", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    identifiers, texts = make_dataset(random.Random(args.seed), args.invoices, args.issuers)
+    searches = len(identifiers) * len(texts)
+    print(f"{searches} searches, {sum(len(t) for t in texts) / len(texts):.0f} digits per invoice on average")
+
+    reference, reference_time = run(reference_fuzzy_digit_matching, identifiers, texts)
+    print(f"Slices scored with fuzzywuzzy: {reference_time:.2f}s ({1e6 * reference_time / searches:.0f}us per search), "
+          f"{sum(reference)} matches")
+    results, elapsed = run(fuzzy_digit_matching, identifiers, texts)
+    print(f"Bit-parallel scan:             {elapsed:.2f}s ({1e6 * elapsed / searches:.0f}us per search), "
+          f"{sum(results)} matches")
+
+    agreement = sum(a == b for a, b in zip(reference, results))
+    only_reference = sum(a and not b for a, b in zip(reference, results))
+    only_scan = sum(b and not a for a, b in zip(reference, results))
+    print(f"Speed-up x{reference_time / elapsed:.1f}, same decision for {100 * agreement / searches:.2f}% of the searches "
+          f"({only_reference} matches only found by fuzzywuzzy, {only_scan} only by the scan)")
+    if fuzz.SequenceMatcher.__module__ != 'difflib':
+        assert only_reference == 0 and only_scan == 0
@@ -14,7 +14,9 @@ import numpy as np
 
 import moment  # type:ignore
 import pandas as pd  # type:ignore
-from fuzzywuzzy import fuzz, process  # type:ignore
+from fuzzywuzzy import fuzz  # type:ignore
+
+from .digit_search import digit_similarity
 
 
 def sum_bounding_box(bbox):
@@ -103,190 +105,10 @@ def find_issuer_in_invoice_text(dfissuers, raw_text, filename, search_term_issue
     :return: Equal length lists that will be used to construct the vendor cluster dataframe
     """
 
-    lst_files = []
-    lst_issuernames = []
-    lst_issuernumbers = []
-    lst_issuerzips = []
-    lst_ibans = []
-    lst_vat = []
-    lst_score = []
-
-    # Clean raw text from OCR
-    raw_text = strip_lower_remove_punctuation(raw_text)
-    # Get digit only text for fuzzy matching of IBAN and VAT
-    digit_block_text = re.sub("[^0-9]", "", raw_text)
-
-    for _, row_ven in dfissuers.iterrows():
-
-        # We are going to score the issuers on various fields
-        # TODO Add your issuer name here
-        issuername = strip_lower_remove_punctuation(row_ven['Your Issuer Name'])
-
-        # TODO Add your post code here
-        zipcode = strip_lower_remove_punctuation(row_ven['Your Post Code'])
-
-        # TODO Add your Iban/Bank Account here
-        iban = str(row_ven['Your Bank number']).strip()
-
-        # TODO Add your issuer unique number here
-        issuernumber = str(row_ven['Your Issuer number here']).strip()
-
-        # TODO Add your VAT number here
-        vat = strip_lower_remove_punctuation(str(row_ven['Your VAT Number']))
-
-        # Reset score
-        total = 0
-        score = 0
-        pscore = 0
-        found_issuer = False
-        found_zip = False
-        found_vat = False
-        found_iban = False
-        candidate_search = ''
-
-        # Straight regex first
-        # TODO add your own data specific formatting
-        found_issuer = is_phrase_in(issuername, raw_text)
-        if len(zipcode) > 0:
-            found_zip = is_phrase_in(zipcode, raw_text.lower())
-        if len(iban) > 0:
-            found_iban = is_phrase_in(iban, raw_text.lower())
-        if len(vat) > 0:
-            found_vat = is_phrase_in(vat, raw_text.lower())
-
-        if found_zip:
-            total += 100  # TODO add your own weighting here
-        else:
-            # Let's check for parts of the zipcode in case of an OCR error
-            if zipcode.find(' '):
-                pos = zipcode.find(' ')
-                found_zip = is_phrase_in(zipcode[:pos], raw_text.lower())
-                # Build composite of the postal in the event of OCR errors
-                if found_zip:
-                    pos = raw_text.lower().find(zipcode[:pos])
-                    ocr_error_zip = raw_text[pos:len(zipcode) + pos].lower()
-                    score = compute_ratio(ocr_error_zip, zipcode)
-                    pscore = compute_partial_ratio(ocr_error_zip, zipcode)
-                    total += score
-                    total += pscore
-                else:  # Check second part
-                    found_zip = is_phrase_in(zipcode[pos:], raw_text.lower())
-                    if found_zip:
-                        zip_second_part = len(zipcode[pos:])
-                        pos = raw_text.lower().find(zipcode[pos:])
-                        ocr_error_zip = raw_text[pos - (len(zipcode) - zip_second_part):pos].lower()
-                        score = compute_ratio(ocr_error_zip, zipcode)
-                        pscore = compute_partial_ratio(ocr_error_zip, zipcode)
-                        total += score
-                        total += pscore
-
-        if found_iban:
-            total += 100  # TODO add your own weighting here
-        else:
-            if (len(iban) > 0) and (iban is not None) and (iban != 'nan'):
-                # To decide - skip iban_patterns and go directly to fuzzy_digit_matching
-                # Let's apply a common mask
-                lst_iban_masks = iban_patterns(iban, len(iban))
-                for iban in lst_iban_masks:
-                    found_iban = is_phrase_in(iban, raw_text.lower())
-                    if found_iban:
-                        total += 100  # TODO add your own weighting here
-                        break
-                if not found_iban:
-                    found_iban = fuzzy_digit_matching(iban, digit_block_text)
-                    if found_iban:
-                        total += 100  # TODO add your own weighting here
-
-        if found_vat:
-            total += 100  # TODO add your own weighting here
-
-        else:
-            if (len(vat) > 0) and (vat is not None) and (vat != 'nan'):
-                # To decide - skip vat_patterns and go directly to fuzzy_digit_matching
-                # Let's apply a common mask
-                lst_vat_masks = vat_patterns(vat, len(vat))
-                for vat in lst_vat_masks:
-                    found_vat = is_phrase_in(vat, raw_text.lower())
-                    if found_vat:
-                        total += 100  # TODO add your own weighting here
-                        break
-                if not found_vat:
-                    found_vat = fuzzy_digit_matching(vat, digit_block_text)
-                    if found_vat:
-                        total += 100  # TODO add your own weighting here
-
-        # Now we search for issuer name
-        if found_issuer:
-            total += 100  # TODO add your own weighting here
-            search_term_issuer_found += 1
-            lst_issuernames.append(issuername)
-            lst_issuerzips.append(zipcode)
-            lst_ibans.append(iban)
-            lst_files.append(str(filename))
-            lst_score.append(total)
-            lst_issuernumbers.append(issuernumber)
-            lst_vat.append(vat)
-        else:
-            # Let's try to partially match on the vendor name
-            lst_issuername = issuername.split()
-
-            if len(lst_issuername) > 0:
-                found_issuer = is_phrase_in(lst_issuername[0].lower(), raw_text.lower())
-
-                # Slide through the window
-                for i in range(len(lst_issuername)):
-                    if i + 2 < len(lst_issuername):
-                        candidate_search = lst_issuername[i].lower() + ' ' \
-                                           + lst_issuername[i + 1].lower() + ' ' \
-                                           + lst_issuername[i + 2].lower()
-                        found_issuer = is_phrase_in(candidate_search, raw_text.lower())
-
-                        # Now we try cater for OCR errors
-                        if not found_issuer:
-                            candidate_search = candidate_search.replace(' ', '')
-                            found_issuer = is_phrase_in(candidate_search, raw_text.lower())
-
-                        if found_issuer:
-                            break
-
-                    elif i + 1 < len(lst_issuername):
-                        candidate_search = lst_issuername[i].lower() + ' ' \
-                                           + lst_issuername[i + 1].lower() + ' '
-                        found_issuer = is_phrase_in(candidate_search, raw_text.lower())
-
-                        # Now we try cater for OCR errors
-                        if not found_issuer:
-                            candidate_search = candidate_search.replace(' ', '')
-                            found_issuer = is_phrase_in(candidate_search, raw_text.lower())
-
-                        if found_issuer:
-                            break
-
-                if found_issuer or found_zip or found_vat or found_iban:
+    # The issuer table is compiled once into an indexed matcher instead of being scanned row by row for every invoice
+    from .issuer_matcher import get_issuer_matcher
 
-                    vendor_part_sum = 0
-                    for vendor_part in lst_issuername:
-                        vendor_part_sum += len(vendor_part) + 1
-
-                    pos = raw_text.lower().find(lst_issuername[0].lower())
-                    candidate_text = raw_text[pos:pos + vendor_part_sum].lower()
-                    score = compute_ratio(candidate_text.lower(), issuername.lower())
-                    pscore = compute_partial_ratio(candidate_text.lower(), issuername.lower())
-
-                    # Add mean of ratio scores to total score
-                    total += ((score + pscore) / 2)  # TODO apply any custom weighting here
-
-                    lst_issuernames.append(issuername)
-                    lst_issuerzips.append(zipcode)
-                    lst_files.append(str(filename))
-                    lst_ibans.append(iban)
-                    lst_score.append(total)
-                    lst_vat.append(vat)
-                    lst_issuernumbers.append(issuernumber)
-                    search_term_issuer_found += 1
-
-    return lst_files, lst_issuernames, lst_issuerzips, lst_ibans, \
-           lst_score, lst_issuernumbers, lst_vat, search_term_issuer_found
+    return get_issuer_matcher(dfissuers).match(raw_text, filename, search_term_issuer_found)
 
 
 def find_anchor_key_in_form_text(df_single_form_gt, df_ocr, row, anchor_keys):
@@ -309,27 +131,28 @@ def find_anchor_key_in_form_text(df_single_form_gt, df_ocr, row, anchor_keys):
     lst_anchor_key = []
     lst_page = []
 
+    # The OCR words are cleaned once, each cleaned word pointing to its first row
+    first_rows = {}
+    for row_ocr in df_ocr.itertuples():
+        first_rows.setdefault(strip_lower_remove_punctuation(row_ocr.data_word), row_ocr)
+
     for anchor_key in anchor_keys:
+        if len(first_rows) == 0 or len(df_single_form_gt[anchor_key]) == 0:
+            continue
 
-        for row_ocr in enumerate(df_ocr.itertuples(), 1):
-            if len(df_single_form_gt[anchor_key]) == 0:
-                continue
+        gt_clean = strip_lower_remove_punctuation(
+            str(df_single_form_gt[anchor_key].iloc[0]))
+        row_ocr = first_rows.get(gt_clean)
 
-            ocr_clean = strip_lower_remove_punctuation(
-                row_ocr[1].data_word)
-            gt_clean = strip_lower_remove_punctuation(
-                str(df_single_form_gt[anchor_key].iloc[0]))
-
-            if ocr_clean == gt_clean:
-                lst_formnames.append('Your form name/vendor/author')  # Todo - add your key
-                lst_files.append(row['Your file name'])  # TODO - add your filename
-                lst_page.append(row_ocr[1].page)
-                lst_bbox_area.append(sum_bounding_box(row_ocr[1].bbox_area))
-                lst_bbox_page.append(sum_bounding_box(row_ocr[1].bbox_page))
-                lst_bbox_par.append(sum_bounding_box(row_ocr[1].bbox_par))
-                lst_bbox_line.append(sum_bounding_box(row_ocr[1].bbox_line))
-                lst_anchor_key.append(anchor_key)
-                break
+        if row_ocr != None:
+            lst_formnames.append('Your form name/vendor/author')  # Todo - add your key
+            lst_files.append(row['Your file name'])  # TODO - add your filename
+            lst_page.append(row_ocr.page)
+            lst_bbox_area.append(sum_bounding_box(row_ocr.bbox_area))
+            lst_bbox_page.append(sum_bounding_box(row_ocr.bbox_page))
+            lst_bbox_par.append(sum_bounding_box(row_ocr.bbox_par))
+            lst_bbox_line.append(sum_bounding_box(row_ocr.bbox_line))
+            lst_anchor_key.append(anchor_key)
 
     data = {'formkey': lst_formnames, 'file': lst_files, 'key': lst_anchor_key, 'page': lst_page,
             'bbox_area': lst_bbox_area, 'bbox_para': lst_bbox_par, 'bbox_line': lst_bbox_line,
@@ -438,7 +261,7 @@ def build_keys_json_object(keys, blobname, anchor_key, found_keys, ocr_text, ocr
     return keys, found_keys
 
 
-def find_anchor_keys_in_form(anchor_keys, df_gt, filename, data, pass_number):
+def find_anchor_keys_in_form(anchor_keys, df_gt, filename, data, pass_number, ocr_index=None):
     """
     This function exists as part of the auto-labelling process for the supervised
     training. In essence, we strip whitespaces, punctuation and concatenate both the
@@ -452,129 +275,70 @@ def find_anchor_keys_in_form(anchor_keys, df_gt, filename, data, pass_number):
     :param filename: The name of the file that we are processing
     :param data: The OCR for the record in question
     :param pass_number: An int that represents the pass number
+    :param ocr_index: The OcrTokenIndex of data, built when not given, pass it to reuse it for both passes
     :return: A json object with the fields and corresponding bounding boxes
     """
+    from .ocr_index import OcrTokenIndex, clean_token, clean_amount
+
     try:
         keys = {}
-        i = 0
         keys[filename] = []
         found_keys = []
         # TODO add your unique file identifier here
         df_issuer_gt = df_gt[df_gt['FILENAME'] == str(filename[:len(filename) - 9])]
+        # The words and lines of the form are normalised once for all the anchor keys (and passes)
+        if ocr_index is None:
+            ocr_index = OcrTokenIndex(data)
 
         # Now we loop through the anchor_keys to see if we can find them
         for anchor_key in anchor_keys:
-            found_key = False
-
-            no_strip = False
             anchor_key = anchor_key.strip()
             # Let's make sure the ground truth is indeed populated
-            if len(df_issuer_gt[anchor_key]) == 0:
+            if len(df_issuer_gt[anchor_key]) == 0 or len(ocr_index.lines) == 0:
+                continue
+
+            normalize = clean_token
+            if anchor_key == 'TOTAL':
+                # TODO add custom total formatting here
+                gt_clean = df_issuer_gt[anchor_key].iloc[0]
+                normalize = clean_amount
+            elif anchor_key == 'BILL_TO':
+                # TODO add your custom formatting here - for the demo we just add text typical to the
+                # TODO invoice format. In reality you would use a classification approach from your master
+                # TODO record to identify vendors and bill to parties
+                # TODO See https://github.com/microsoft/knowledge-extraction-recipes-forms/blob/master/Analysis/Attribute_Search_Classification/README.md
+                gt_clean = clean_token('Invoice for:' + str(df_issuer_gt[anchor_key].iloc[0]))
+            else:
+                # Now we clean out all punctuation for exact matching
+                gt_clean = clean_token(str(df_issuer_gt[anchor_key].iloc[0]))
+
+            if len(gt_clean) == 0:
+                continue
+
+            #  TODO catch all here
+            match = ocr_index.find(gt_clean, normalize, line_level=(pass_number == 2),
+                                   substring=(anchor_key == 'BILL_TO_ZIP') or (anchor_key == 'VENDOR_ZIP'))
+            if match is None:
                 continue
 
-            for pages in data['analyzeResult']['readResults']:  # Added page
-                if found_key:
-                    break
-
-                page = pages['page']
-                height = pages['height']
-                width = pages['width']
-                for lines in pages['lines']:
-                    if found_key:
-                        break
-
-                    # We operate at the lowest level where we can
-                    for words in lines['words']:
-                        if found_key:
-                            break
-
-                        ocr_clean_word = ''
-                        ocr_clean_line = ''
-                        gt_clean = ''
-
-                        if anchor_key == 'BILL_TO':
-                            # TODO add your custom formatting here - for the demo we just add text typical to the
-                            # TODO invoice format. In reality you would use a classification approach from your master
-                            # TODO record to identify vendors and bill to parties
-                            # TODO See https://github.com/microsoft/knowledge-extraction-recipes-forms/blob/master/Analysis/Attribute_Search_Classification/README.md
-                            gt_clean = 'Invoice for:' + str(df_issuer_gt[anchor_key].iloc[0])
-                            gt_clean = strip_lower_remove_punctuation(
-                                gt_clean.encode('ascii', 'ignore').decode('ascii'))
-
-                        if anchor_key == 'TOTAL':
-                            # TODO add custom total formatting here
-                            gt_clean = df_issuer_gt[anchor_key].iloc[0]
-                            ocr_clean_word = words['text'].replace(",", "")
-                            ocr_clean_line = lines['text'].replace(",", "")
-                            no_strip = True
-
-                        if not no_strip:
-
-                            # Now we clean out all punctuation for exact matching - word level
-                            if len(ocr_clean_line) == 0:
-                                ocr_clean_line = strip_lower_remove_punctuation(
-                                    lines['text'].encode('ascii', 'ignore').decode('ascii'))
-                            else:
-                                ocr_clean_line = strip_lower_remove_punctuation(
-                                    ocr_clean_line.encode('ascii', 'ignore').decode('ascii'))
-
-                            # Now we clean out all punctuation for exact matching - line level
-                            if len(ocr_clean_word) == 0:
-                                ocr_clean_word = strip_lower_remove_punctuation(
-                                    words['text'].encode('ascii', 'ignore').decode('ascii'))
-                            else:
-                                ocr_clean_word = strip_lower_remove_punctuation(
-                                    ocr_clean_word.encode('ascii', 'ignore').decode('ascii'))
-
-                            if len(gt_clean) == 0:
-                                gt_clean = strip_lower_remove_punctuation(
-                                    str(df_issuer_gt[anchor_key].iloc[0]).encode('ascii', 'ignore').decode('ascii'))
-
-                            gt_clean = gt_clean.replace(" ", "")
-                            ocr_clean_word = ocr_clean_word.replace(" ", "")
-                            ocr_clean_line = ocr_clean_line.replace(" ", "")
-
-                        if len(gt_clean) > 0:
-                            if gt_clean == ocr_clean_word:
-                                print('Matched', gt_clean, ocr_clean_word, anchor_key, filename)
-                                ocr_orig_word = words['text']
-
-                                keys, found_keys = build_keys_json_object(keys, filename,
-                                                                          anchor_key, found_keys,
-                                                                          ocr_orig_word,
-                                                                          words['boundingBox'],
-                                                                          page,
-                                                                          height,
-                                                                          width)
-                                found_key = True
-
-
-                            elif (gt_clean == ocr_clean_line) and (pass_number == 2):
-                                print('Matched', gt_clean, ocr_clean_line, anchor_key, pass_number, filename)
-                                ocr_orig_line = lines['text']
-                                keys, found_keys = build_keys_json_object(keys, filename,
-                                                                          anchor_key, found_keys,
-                                                                          ocr_orig_line,
-                                                                          lines['boundingBox'],
-                                                                          page,
-                                                                          height,
-                                                                          width)
-                                found_key = True
-
-                            #  TODO catch all here
-                            elif (gt_clean in ocr_clean_line) and ((anchor_key == 'BILL_TO_ZIP') or
-                                                                   anchor_key == 'VENDOR_ZIP'):
-                                ocr_orig_line = lines['text']
-                                keys, found_keys = build_keys_json_object(keys, filename,
-                                                                          anchor_key, found_keys,
-                                                                          ocr_orig_line,
-                                                                          lines['boundingBox'],
-                                                                          page,
-                                                                          height,
-                                                                          width)
-                                found_key = True
-
-        i += 1
+            pages, lines, words = match
+            if words != None:
+                print('Matched', gt_clean, normalize(words['text']), anchor_key, filename)
+                ocr_text = words['text']
+                ocr_boundingbox = words['boundingBox']
+            else:
+                if pass_number == 2 and gt_clean == normalize(lines['text']):
+                    print('Matched', gt_clean, normalize(lines['text']), anchor_key, pass_number, filename)
+                ocr_text = lines['text']
+                ocr_boundingbox = lines['boundingBox']
+
+            keys, found_keys = build_keys_json_object(keys, filename,
+                                                      anchor_key, found_keys,
+                                                      ocr_text,
+                                                      ocr_boundingbox,
+                                                      pages['page'],
+                                                      pages['height'],
+                                                      pages['width'])
 
     except Exception as e:
         exc_type, _, exc_tb = sys.exc_info()
@@ -701,12 +465,10 @@ def fuzzy_digit_matching(identifier, digit_block_text):
     :return: True if matched with high confidence
     """
     cleanidentifier = re.sub("[^0-9]", "", identifier)
-    # Slice text block into length of identifier to get candidates
-    slices = [digit_block_text[i:i + len(cleanidentifier)] for i in range(0, len(digit_block_text))]
-    # Get highest matching slice
-    highest = process.extractOne(cleanidentifier, slices, scorer=fuzz.ratio)
+    # Highest fuzz.ratio of the slices of the text block of the length of the identifier, with bit-parallel scans
+    highest = digit_similarity(cleanidentifier, digit_block_text)
     # Check if highest match is relevant
-    if highest[1] > 75:  # TODO find an acceptable threshold
+    if highest > 75:  # TODO find an acceptable threshold
         return True
     return False
 
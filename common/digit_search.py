@@ -0,0 +1,172 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""
+Approximate search of a number in a digit stream with bit-parallel algorithms: the edit distance of Myers
+(G. Myers, A fast bit-vector algorithm for approximate string matching based on dynamic programming, 1999)
+and the longest common subsequence of Allison and Dix (A bit-string longest-common-subsequence algorithm, 1986).
+The columns of the dynamic programming matrix between the pattern and the text are encoded as bit vectors, so
+each digit of the text costs a few integer operations, whatever the length of the pattern.
+"""
+
+
+def _pattern_masks(pattern):
+    masks = {}
+    for i, char in enumerate(pattern):
+        masks[char] = masks.get(char, 0) | (1 << i)
+    return masks
+
+
+def _best_end(pattern, text):
+    """
+    Scans the text for the pattern
+    :return: The smallest edit distance between the pattern and a substring of the text,
+    and the end (exclusive) of the first substring at that distance
+    """
+    m = len(pattern)
+    masks = _pattern_masks(pattern)
+    full = (1 << m) - 1
+    high = 1 << (m - 1)
+
+    pv = full
+    mv = 0
+    score = m
+    best, best_end = m, 0
+    for j, char in enumerate(text):
+        eq = masks.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        # A match can start anywhere in the text: no carry into the first row
+        ph = (ph << 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+        if score < best:
+            best, best_end = score, j + 1
+            if best == 0:
+                break
+    return best, best_end
+
+
+def find_best_window(pattern, text):
+    """
+    Finds the substring of the text closest to the pattern in edit distance (insertions, deletions and
+    substitutions of one character each cost 1)
+    :param pattern: The digits searched for
+    :param text: The digit-only text to be scanned
+    :return: start, end and edit distance of the best window text[start:end], the first one when several are as close
+    """
+    if len(pattern) == 0:
+        return 0, 0, 0
+    distance, end = _best_end(pattern, text)
+    if end == 0:
+        return 0, 0, distance
+
+    # The start of the window is found by matching the reversed pattern backwards from its end,
+    # the window is at most len(pattern) + distance long
+    window = text[max(end - len(pattern) - distance, 0):end][::-1]
+    start = end
+    for length in range(len(window) + 1):
+        if _distance(pattern[::-1], window[:length]) == distance:
+            start = end - length
+            break
+    return start, end, distance
+
+
+def _distance(pattern, text):
+    """Edit distance between the pattern and the whole text, computed with the same bit vectors"""
+    m = len(pattern)
+    if m == 0:
+        return len(text)
+    masks = _pattern_masks(pattern)
+    full = (1 << m) - 1
+    high = 1 << (m - 1)
+
+    pv = full
+    mv = 0
+    score = m
+    for char in text:
+        eq = masks.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        # The whole text is matched: every text character shifts the first row by one
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+    return score
+
+
+def _lcs_length(masks, m, text):
+    """
+    Length of the longest common subsequence of the pattern and the text, with the bit-parallel algorithm of
+    Allison and Dix (the zero bits of v are the rows where the common subsequence grows)
+    """
+    full = (1 << m) - 1
+    v = full
+    for char in text:
+        u = v & masks.get(char, 0)
+        v = ((v + u) | (v - u)) & full
+    return m - bin(v).count('1')
+
+
+def digit_similarity(pattern, text):
+    """
+    Similarity between a number and its closest slice in a digit stream, the same score as the former
+    extractOne(pattern, slices, scorer=fuzz.ratio) over the slices text[i:i + len(pattern)] with python-Levenshtein:
+    round(100 * (a + b - indel distance) / (a + b)), a and b the lengths of the pattern and of the slice, the indel
+    distance counting insertions and deletions only (a + b - 2 * longest common subsequence)
+    :return: 100 for an exact occurrence, 0 for an empty pattern or text
+    """
+    m = len(pattern)
+    if m == 0:
+        return 0
+    masks = _pattern_masks(pattern)
+    pattern_counts = {}
+    for char in pattern:
+        pattern_counts[char] = pattern_counts.get(char, 0) + 1
+
+    # Characters shared by the pattern and the window counted with their multiplicity, an upper bound of the
+    # common subsequence updated as the window slides: only the windows that could score higher are scanned
+    window_counts = {}
+    shared = 0
+    for char in text[:m]:
+        window_counts[char] = window_counts.get(char, 0) + 1
+        if window_counts[char] <= pattern_counts.get(char, 0):
+            shared += 1
+
+    best = 0
+    for i in range(len(text)):
+        window = text[i:i + m]
+        lensum = m + len(window)
+        if int(round(100 * (2 * shared / lensum))) > best:
+            ratio = 2 * _lcs_length(masks, m, window) / lensum
+            best = max(best, int(round(100 * ratio)))
+            if best == 100:
+                break
+
+        # Slide the window: text[i] leaves it, text[i + m] enters it
+        char = text[i]
+        if window_counts[char] <= pattern_counts.get(char, 0):
+            shared -= 1
+        window_counts[char] -= 1
+        if i + m < len(text):
+            char = text[i + m]
+            window_counts[char] = window_counts.get(char, 0) + 1
+            if window_counts[char] <= pattern_counts.get(char, 0):
+                shared += 1
+    return best
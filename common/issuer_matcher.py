@@ -0,0 +1,314 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import re
+import weakref
+
+from .common import strip_lower_remove_punctuation, iban_patterns, vat_patterns, fuzzy_digit_matching, \
+    compute_ratio, compute_partial_ratio
+
+
+class AhoCorasick(object):
+    """
+    Aho-Corasick automaton finding the first occurrence of many patterns in a single pass over a text
+    """
+
+    def __init__(self, patterns):
+        """
+
+        :param patterns: The patterns to search for, empty patterns are ignored
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [None]
+        self.dict_link = [None]
+        self.lengths = {}
+
+        for pattern in patterns:
+            if len(pattern) == 0 or pattern in self.lengths:
+                continue
+            self.lengths[pattern] = len(pattern)
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(None)
+                    self.dict_link.append(None)
+                state = next_state
+            self.output[state] = pattern
+
+        # Breadth first computation of the failure links and of the links to the nearest terminal suffix state
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                candidate = self.goto[fallback].get(char, 0)
+                # The children of the root fail back to the root
+                self.fail[next_state] = candidate if candidate != next_state else 0
+                link = self.fail[next_state]
+                self.dict_link[next_state] = link if self.output[link] is not None else self.dict_link[link]
+
+    def first_occurrences(self, text):
+        """
+
+        :param text: The text to scan
+        :return: A dictionary pattern -> position of its first occurrence in the text (same as text.find(pattern))
+        """
+        found = {}
+        reported = set()
+        goto = self.goto
+        fail = self.fail
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            node = state if self.output[state] is not None else self.dict_link[state]
+            # The suffix chain of a reported state was reported at the same time, so each pattern is visited once
+            while node is not None and node not in reported:
+                reported.add(node)
+                pattern = self.output[node]
+                found[pattern] = position - self.lengths[pattern] + 1
+                node = self.dict_link[node]
+        return found
+
+
+class IssuerMatcher(object):
+    """
+    Precompiled issuer lookup used by find_issuer_in_invoice_text.
+    The issuer fields are cleaned once, and every exact search (issuer name and its word windows, post code,
+    Iban, VAT number and their masks) is compiled into a single Aho-Corasick automaton, so an invoice is
+    scanned once whatever the number of issuers. The fuzzy scoring of issuer names only runs for the issuers
+    with an exact hit (name window, post code, Iban or VAT number), as in the row by row scan.
+    With digit_ngram=None (the default) the results are the same as scanning the issuer table row by row.
+    digit_ngram trades accuracy for speed: the digit fuzzy matching of Iban and VAT numbers then only runs for
+    the issuers sharing at least one n-gram of digit_ngram digits with the invoice (digit n-gram inverted
+    index). The shortlist is lossy: an identifier with a few OCR errors can score above the threshold of
+    fuzzy_digit_matching without sharing any run of digit_ngram digits with the invoice. A lossless shortlist
+    would need 1-grams, since a score above 75 allows about len(identifier) / 2 inserted or deleted digits.
+    """
+
+    def __init__(self, dfissuers, digit_ngram=None):
+        self.digit_ngram = digit_ngram
+        self.issuers = []
+        self.digit_index = {}
+        patterns = set()
+
+        for position, (_, row_ven) in enumerate(dfissuers.iterrows()):
+            # TODO Add your issuer name, post code, Iban/Bank Account, issuer unique number and VAT number here
+            issuer = {
+                'issuername': strip_lower_remove_punctuation(row_ven['Your Issuer Name']),
+                'zipcode': strip_lower_remove_punctuation(row_ven['Your Post Code']),
+                'iban': str(row_ven['Your Bank number']).strip(),
+                'issuernumber': str(row_ven['Your Issuer number here']).strip(),
+                'vat': strip_lower_remove_punctuation(str(row_ven['Your VAT Number'])),
+            }
+            issuer['tokens'] = issuer['issuername'].split()
+            issuer['iban_masks'] = self._masks(issuer['iban'], iban_patterns)
+            issuer['vat_masks'] = self._masks(issuer['vat'], vat_patterns)
+            issuer['zip_parts'] = self._zip_parts(issuer['zipcode'])
+            issuer['windows'] = self._windows(issuer['tokens'])
+
+            patterns.update([issuer['issuername'], issuer['zipcode'], issuer['iban'], issuer['vat']])
+            patterns.update(issuer['iban_masks'] + issuer['vat_masks'] + issuer['zip_parts'])
+            patterns.update(issuer['tokens'][:1])
+            for window in issuer['windows']:
+                patterns.update(window)
+
+            # The identifiers used for fuzzy matching are the last masks when there are masks
+            # Identifiers with fewer digits than the n-gram size are always matched
+            for kind, masks in [('iban', issuer['iban_masks']), ('vat', issuer['vat_masks'])]:
+                identifier = masks[-1] if len(masks) > 0 else issuer[kind]
+                grams = self._digit_ngrams(identifier)
+                for gram in grams:
+                    self.digit_index.setdefault(gram, set()).add((position, kind))
+                issuer['always_fuzzy_' + kind] = digit_ngram is None or len(grams) == 0
+
+            self.issuers.append(issuer)
+
+        self.automaton = AhoCorasick(patterns)
+
+    @staticmethod
+    def _masks(identifier, patterns_function):
+        if (len(identifier) > 0) and (identifier != 'nan'):
+            return patterns_function(identifier, len(identifier))
+        return []
+
+    @staticmethod
+    def _zip_parts(zipcode):
+        # Same partial searches as the row by row scan: before the first space, then from it
+        # (for a post code without space, without its last character and then its last character)
+        pos = zipcode.find(' ')
+        if pos:
+            return [zipcode[:pos], zipcode[pos:]]
+        return []
+
+    @staticmethod
+    def _windows(tokens):
+        windows = []
+        for i in range(len(tokens)):
+            if i + 2 < len(tokens):
+                candidate_search = tokens[i] + ' ' + tokens[i + 1] + ' ' + tokens[i + 2]
+            elif i + 1 < len(tokens):
+                candidate_search = tokens[i] + ' ' + tokens[i + 1] + ' '
+            else:
+                continue
+            windows.append((candidate_search, candidate_search.replace(' ', '')))
+        return windows
+
+    def _digit_ngrams(self, text):
+        if self.digit_ngram is None:
+            return set()
+        digits = re.sub("[^0-9]", "", text)
+        return {digits[i:i + self.digit_ngram] for i in range(len(digits) - self.digit_ngram + 1)}
+
+    def match(self, raw_text, filename, search_term_issuer_found=0):
+        """
+
+        :param raw_text: The OCR text
+        :param filename: The full name of the invoice file processed
+        :param search_term_issuer_found: A counter for found records
+        :return: Equal length lists that will be used to construct the vendor cluster dataframe
+        """
+        lst_files = []
+        lst_issuernames = []
+        lst_issuernumbers = []
+        lst_issuerzips = []
+        lst_ibans = []
+        lst_vat = []
+        lst_score = []
+
+        # Clean raw text from OCR
+        raw_text = strip_lower_remove_punctuation(raw_text)
+        # Get digit only text for fuzzy matching of IBAN and VAT
+        digit_block_text = re.sub("[^0-9]", "", raw_text)
+
+        found = self.automaton.first_occurrences(raw_text)
+        # The empty string is found at the start of any text
+        found[''] = 0
+
+        shortlist = set()
+        for gram in self._digit_ngrams(digit_block_text):
+            shortlist.update(self.digit_index.get(gram, ()))
+
+        for position, issuer in enumerate(self.issuers):
+            issuername = issuer['issuername']
+            zipcode = issuer['zipcode']
+            iban = issuer['iban']
+            issuernumber = issuer['issuernumber']
+            vat = issuer['vat']
+
+            total = 0
+            found_issuer = issuername in found
+            found_zip = len(zipcode) > 0 and zipcode in found
+            found_iban = len(iban) > 0 and iban in found
+            found_vat = len(vat) > 0 and vat in found
+
+            if found_zip:
+                total += 100  # TODO add your own weighting here
+            elif len(issuer['zip_parts']) > 0:
+                # Let's check for parts of the zipcode in case of an OCR error
+                first_part, second_part = issuer['zip_parts']
+                if first_part in found:
+                    found_zip = True
+                    pos = found[first_part]
+                    ocr_error_zip = raw_text[pos:len(zipcode) + pos]
+                    total += compute_ratio(ocr_error_zip, zipcode)
+                    total += compute_partial_ratio(ocr_error_zip, zipcode)
+                elif second_part in found:
+                    found_zip = True
+                    pos = found[second_part]
+                    ocr_error_zip = raw_text[pos - (len(zipcode) - len(second_part)):pos]
+                    total += compute_ratio(ocr_error_zip, zipcode)
+                    total += compute_partial_ratio(ocr_error_zip, zipcode)
+
+            if found_iban:
+                total += 100  # TODO add your own weighting here
+            elif (len(iban) > 0) and (iban != 'nan'):
+                for iban in issuer['iban_masks']:
+                    found_iban = iban in found
+                    if found_iban:
+                        break
+                if not found_iban and (issuer['always_fuzzy_iban'] or (position, 'iban') in shortlist):
+                    found_iban = fuzzy_digit_matching(iban, digit_block_text)
+                if found_iban:
+                    total += 100  # TODO add your own weighting here
+
+            if found_vat:
+                total += 100  # TODO add your own weighting here
+            elif (len(vat) > 0) and (vat != 'nan'):
+                for vat in issuer['vat_masks']:
+                    found_vat = vat in found
+                    if found_vat:
+                        break
+                if not found_vat and (issuer['always_fuzzy_vat'] or (position, 'vat') in shortlist):
+                    found_vat = fuzzy_digit_matching(vat, digit_block_text)
+                if found_vat:
+                    total += 100  # TODO add your own weighting here
+
+            # Now we search for issuer name
+            if found_issuer:
+                total += 100  # TODO add your own weighting here
+            else:
+                lst_issuername = issuer['tokens']
+                if len(lst_issuername) == 0:
+                    continue
+                # Let's try to partially match on the vendor name, sliding through the window
+                if len(issuer['windows']) > 0:
+                    found_issuer = any(window in found or nospace in found for window, nospace in issuer['windows'])
+                else:
+                    found_issuer = lst_issuername[0] in found
+
+                if not (found_issuer or found_zip or found_vat or found_iban):
+                    continue
+
+                vendor_part_sum = 0
+                for vendor_part in lst_issuername:
+                    vendor_part_sum += len(vendor_part) + 1
+
+                pos = found.get(lst_issuername[0], -1)
+                candidate_text = raw_text[pos:pos + vendor_part_sum]
+                score = compute_ratio(candidate_text, issuername)
+                pscore = compute_partial_ratio(candidate_text, issuername)
+
+                # Add mean of ratio scores to total score
+                total += ((score + pscore) / 2)  # TODO apply any custom weighting here
+
+            search_term_issuer_found += 1
+            lst_issuernames.append(issuername)
+            lst_issuerzips.append(zipcode)
+            lst_ibans.append(iban)
+            lst_files.append(str(filename))
+            lst_score.append(total)
+            lst_issuernumbers.append(issuernumber)
+            lst_vat.append(vat)
+
+        return lst_files, lst_issuernames, lst_issuerzips, lst_ibans, \
+            lst_score, lst_issuernumbers, lst_vat, search_term_issuer_found
+
+
+_matchers = {}
+
+
+def get_issuer_matcher(dfissuers, digit_ngram=None):
+    """
+    Returns the matcher compiled for an issuer dataframe, compiling it on first use
+    The matcher is cached for the lifetime of the dataframe, build an IssuerMatcher if the dataframe is edited in place
+    """
+    key = (id(dfissuers), digit_ngram)
+    entry = _matchers.get(key)
+    if entry is not None and entry[0]() is dfissuers:
+        return entry[1]
+    matcher = IssuerMatcher(dfissuers, digit_ngram)
+    _matchers[key] = (weakref.ref(dfissuers, lambda _: _matchers.pop(key, None)), matcher)
+    return matcher
@@ -0,0 +1,161 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+
+# Default location and size cap, can be overridden with the OCR_CACHE_DIR and OCR_CACHE_MAX_BYTES environment variables
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'forms_ocr')
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+class OcrCache(object):
+
+    """
+    Content-addressed cache of OCR results on local disk.
+    Results are keyed on the SHA-256 of the document bytes plus the API and its parameters, so a
+    renamed or duplicated document is only sent to the OCR service once. Each result is stored
+    gzip-compressed in a file sharded on the first characters of its key. Reading a result
+    refreshes its modification time, and the least recently used results are evicted when the
+    cache grows over max_bytes.
+    """
+
+    EXTENSION = '.json.gz'
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir if cache_dir != None else DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(data, api, params=None):
+        """
+        Key of a document for an OCR API
+        :param data: The bytes of the document
+        :param api: The API name and version, for instance 'formrecognizer/v2.0/layout'
+        :param params: The parameters changing the result of the API (language...)
+        :return: The hexadecimal key
+        """
+        key = hashlib.sha256()
+        key.update(hashlib.sha256(data).digest())
+        key.update(api.encode('utf-8'))
+        key.update(json.dumps(params or {}, sort_keys=True).encode('utf-8'))
+        return key.hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key[2:4], key + self.EXTENSION)
+
+    def get(self, key):
+        """Returns the cached OCR result or None"""
+        path = self.get_path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                result = json.load(f)
+            # Marking the result as recently used
+            os.utime(path)
+            self.hits += 1
+            return result
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning(f"Could not read OCR cache entry {path}: {e}")
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """Stores an OCR result, the file is written atomically so that concurrent readers never see a partial result"""
+        path = self.get_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                json.dump(result, f)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning(f"Could not write OCR cache entry {path}: {e}")
+            return
+
+        with self._lock:
+            if self._size != None:
+                self._size += size
+            over_cap = self.get_size() > self.max_bytes
+        if over_cap:
+            self.evict()
+
+    def get_or_compute(self, data, api, params, compute):
+        """
+        Returns the cached OCR result of a document, calling compute() and caching its result on a miss
+        Empty results (failed OCR calls) are returned but not cached
+        """
+        key = self.make_key(data, api, params)
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            if result:
+                self.put(key, result)
+        return result
+
+    def _list_entries(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(self.EXTENSION):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                        entries.append((stat.st_mtime, stat.st_size, path))
+                    except FileNotFoundError:
+                        pass
+        return entries
+
+    def get_size(self):
+        """Size of the cache in bytes, computed once and then maintained by this instance"""
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._list_entries())
+        return self._size
+
+    def evict(self, target_ratio=0.9):
+        """Removes the least recently used results until the cache is under target_ratio * max_bytes"""
+        with self._lock:
+            entries = sorted(self._list_entries())
+            size = sum(entry_size for _, entry_size, _ in entries)
+            target = self.max_bytes * target_ratio
+            removed = 0
+            for _, entry_size, path in entries:
+                if size <= target:
+                    break
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                size -= entry_size
+            self._size = size
+        logging.info(f"Evicted {removed} results from OCR cache {self.cache_dir}.")
+        return removed
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """Returns the process-wide OCR cache"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            cache_dir = os.getenv('OCR_CACHE_DIR', DEFAULT_CACHE_DIR)
+            max_bytes = int(os.getenv('OCR_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+            _default_cache = OcrCache(cache_dir, max_bytes)
+    return _default_cache
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+from .common import strip_lower_remove_punctuation
+
+
+def clean_token(text):
+    """Lower case, no punctuation and no white space, as the anchor keys are compared"""
+    return strip_lower_remove_punctuation(text).replace(" ", "")
+
+
+def clean_amount(text):
+    """Thousands separators removed, as the totals are compared"""
+    return text.replace(",", "")
+
+
+class OcrTokenIndex(object):
+    """
+    Index of the words and lines of an OCR result (analyzeResult of the Form Recognizer layout API) used
+    by find_anchor_keys_in_form. Each word and line is normalised once into a token -> first position map,
+    so that an anchor key is looked up directly instead of being compared with every word of the form.
+    Positions are in reading order (pages, lines, words), the lines without words are not indexed as an
+    anchor key can't be matched on them.
+    """
+
+    def __init__(self, data):
+        self.lines = []
+        for pages in data['analyzeResult']['readResults']:
+            for lines in pages['lines']:
+                if len(lines['words']) > 0:
+                    self.lines.append((pages, lines))
+        self._maps = {}
+
+    def _get_maps(self, normalize):
+        maps = self._maps.get(normalize)
+        if maps is None:
+            words = {}
+            lines = {}
+            clean_lines = []
+            for line_position, (_, line) in enumerate(self.lines):
+                clean_line = normalize(line['text'])
+                clean_lines.append(clean_line)
+                lines.setdefault(clean_line, line_position)
+                for word_position, word in enumerate(line['words']):
+                    words.setdefault(normalize(word['text']), (line_position, word_position))
+            maps = self._maps[normalize] = (words, lines, clean_lines)
+        return maps
+
+    def find(self, token, normalize=clean_token, line_level=False, substring=False):
+        """
+        Finds the first word or line of the form matching a token
+        :param token: The normalised value searched for
+        :param normalize: The normalisation applied to the words and lines of the form
+        :param line_level: True to also match the lines equal to the token
+        :param substring: True to also match the lines containing the token
+        :return: page, line and word (None when the whole line matched) of the first match, or None
+        """
+        words, lines, clean_lines = self._get_maps(normalize)
+        word_position = words.get(token)
+        last_line = word_position[0] if word_position != None else len(self.lines) - 1
+
+        line_position = None
+        if substring:
+            for position in range(last_line + 1):
+                if token in clean_lines[position]:
+                    line_position = position
+                    break
+        elif line_level:
+            line_position = lines.get(token)
+
+        # A line is matched on its first word, where the word itself is compared first
+        if line_position != None and (word_position is None or line_position < word_position[0]
+                                      or (line_position == word_position[0] and word_position[1] > 0)):
+            pages, line = self.lines[line_position]
+            return pages, line, None
+        if word_position != None:
+            pages, line = self.lines[word_position[0]]
+            return pages, line, line['words'][word_position[1]]
+        return None